@@ -0,0 +1,174 @@
+"""
+端到端基准测试：在本地启动模拟平台接口的服务器，测量download_content下载文档、一师一课和视频的耗时与吞吐量。
+
+用法（在项目根目录下运行）:
+    python -m benchmark.run --docs 4 --doc-size 8M --videos 2 --segments 120 --latency 0.02
+    python -m benchmark.run --scenarios videos --error-rate 0.05 --error-status 429 --json result.json
+
+所有https请求都被改写到本地服务器，真实服务器不会收到任何请求。每个场景使用独立的资源ID，
+缓存不会跨场景命中；下载文件写入临时目录，结束后删除（--keep保留）。
+"""
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+from urllib.parse import urlsplit
+
+from utils import config, transport
+from utils.bandwidth import parse_rate
+from benchmark.server import StandInPlatform, StandInServer
+
+USER_DATA = json.dumps({"value": json.dumps({"access_token": "bench-token", "mac_key": "bench-mac-key",
+                                             "user_id": "bench-user"})})
+APP_ID = "00000000-0000-0000-0000-000000000000"
+
+
+class LocalRedirectAdapter(transport.CountingAdapter):
+    """把https://<域名>/<路径>改写为 <本地服务器>/<域名>/<路径>"""
+
+    def __init__(self, base_url: str, **kwargs):
+        self.base_url = base_url
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        parts = urlsplit(request.url)
+        request.url = f"{self.base_url}/{parts.netloc}{parts.path}" + (f"?{parts.query}" if parts.query else "")
+        return super().send(request, **kwargs)
+
+
+def install_redirect(base_url: str) -> None:
+    adapter = LocalRedirectAdapter(base_url, pool_connections=config.POOL_HOSTS, pool_maxsize=config.POOL_MAXSIZE)
+    transport.get_session().mount("https://", adapter)
+
+
+def scenario_urls(name: str, args, run: int) -> list:
+    prefix = f"{name}{run}"
+    if name == "documents":
+        return [f"https://basic.smartedu.cn/tchMaterial/detail?contentType=assets_document&contentId={prefix}-doc{i}"
+                for i in range(args.docs)]
+    if name == "lessons":
+        return [f"https://basic.smartedu.cn/syncClassroom/prepare/detail?lessonId={prefix}-lesson{i}"
+                for i in range(args.lessons)]
+    if name == "videos":
+        return [f"https://basic.smartedu.cn/sedu/detail?contentType=assets_video&contentId={prefix}-video{i}"
+                for i in range(args.videos)]
+    raise ValueError(f"未知的场景: {name}")
+
+
+def directory_size(path: str) -> tuple:
+    """统计目录中已完成文件（不含.part及其记录）的数量和总字节数"""
+    files, size = 0, 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            if ".part" in name:
+                continue
+            files += 1
+            size += os.path.getsize(os.path.join(root, name))
+    return files, size
+
+
+def run_scenario(name: str, args, server: StandInServer, work_dir: str, run: int) -> dict:
+    from utils.command import download_content
+
+    scenario_dir = os.path.join(work_dir, f"{name}-{run}")
+    os.makedirs(scenario_dir, exist_ok=True)
+    os.chdir(scenario_dir)
+    server.reset_stats()
+
+    urls = scenario_urls(name, args, run)
+    output = io.StringIO()
+    started = time.monotonic()
+    with contextlib.redirect_stdout(sys.stdout if args.verbose else output):
+        results = [download_content(url, USER_DATA, APP_ID, engine="sync") for url in urls]
+    wall = time.monotonic() - started
+
+    files, size = directory_size(scenario_dir)
+    return {
+        "scenario": name,
+        "run": run,
+        "pages": len(urls),
+        "succeeded": sum(1 for ok in results if ok),
+        "files": files,
+        "bytes": size,
+        "wall_seconds": wall,
+        "throughput": size / wall if wall > 0 else 0.0,
+        "server": server.get_stats()
+    }
+
+
+def print_report(results: list) -> None:
+    mb = 1024 * 1024
+    print(f"{'场景':<10}{'轮次':>4}{'成功/页面':>10}{'文件数':>7}{'大小(MB)':>10}{'耗时(s)':>9}{'吞吐(MB/s)':>12}"
+          f"{'请求数':>8}{'注入错误':>9}")
+    for result in results:
+        print(f"{result['scenario']:<12}{result['run']:>4}{result['succeeded']:>7}/{result['pages']:<4}"
+              f"{result['files']:>7}{result['bytes'] / mb:>10.2f}{result['wall_seconds']:>9.2f}"
+              f"{result['throughput'] / mb:>12.2f}{result['server']['requests']:>8}"
+              f"{result['server']['errors_injected']:>9}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="smartedu-download 端到端基准测试")
+    parser.add_argument("--scenarios", default="documents,lessons,videos", help="逗号分隔的场景：documents、lessons、videos")
+    parser.add_argument("--repeat", type=int, default=1, help="每个场景运行的轮数")
+    parser.add_argument("--docs", type=int, default=4, help="documents场景中的教材数量")
+    parser.add_argument("--doc-size", default="4M", help="每个文档的大小，可带K/M/G单位")
+    parser.add_argument("--lessons", type=int, default=2, help="lessons场景中的一师一课数量")
+    parser.add_argument("--lesson-docs", type=int, default=3, help="每节课中带直接下载地址的文档数")
+    parser.add_argument("--lesson-courseware", type=int, default=3, help="每节课中需要通过文档中心解析的课件数")
+    parser.add_argument("--lesson-videos", type=int, default=1, help="每节课中的视频数")
+    parser.add_argument("--videos", type=int, default=2, help="videos场景中的视频数量")
+    parser.add_argument("--segments", type=int, default=60, help="每个视频的TS片段数")
+    parser.add_argument("--segment-size", default="256K", help="每个TS片段的大小，可带K/M/G单位")
+    parser.add_argument("--latency", type=float, default=0.0, help="服务器每个请求的延迟（秒）")
+    parser.add_argument("--bandwidth", default="0", help="服务器每个响应的带宽，可带K/M/G单位，0为不限速")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="文档和TS片段请求返回错误的概率")
+    parser.add_argument("--error-status", type=int, default=500, help="注入错误时的状态码")
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子")
+    parser.add_argument("--json", help="把结果写入JSON文件")
+    parser.add_argument("--keep", action="store_true", help="保留下载的文件和缓存目录")
+    parser.add_argument("--verbose", action="store_true", help="显示下载过程中的输出")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> list:
+    args = parse_args(argv)
+    platform = StandInPlatform(
+        doc_size=int(parse_rate(args.doc_size)), segments=args.segments,
+        segment_size=int(parse_rate(args.segment_size)), lesson_docs=args.lesson_docs,
+        lesson_courseware=args.lesson_courseware, lesson_videos=args.lesson_videos, seed=args.seed
+    )
+    server = StandInServer(platform, latency=args.latency, bandwidth=parse_rate(args.bandwidth),
+                           error_rate=args.error_rate, error_status=args.error_status, seed=args.seed).start()
+
+    work_dir = tempfile.mkdtemp(prefix="smartedu-bench-")
+    original_cwd = os.getcwd()
+    config.CACHE_DIR = os.path.join(work_dir, ".smartedu_cache")
+    install_redirect(server.base_url)
+    print(f"模拟服务器: {server.base_url}，工作目录: {work_dir}")
+
+    results = []
+    try:
+        for run in range(args.repeat):
+            for name in [name.strip() for name in args.scenarios.split(",") if name.strip()]:
+                results.append(run_scenario(name, args, server, work_dir, run))
+    finally:
+        os.chdir(original_cwd)
+        server.stop()
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_report(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump({"args": vars(args), "results": results}, file, ensure_ascii=False, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+import re
+import json
+import time
+import base64
+import random
+import hashlib
+import threading
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import pad
+
+# 下载链接中的占位前缀，与平台返回的ti_storage格式一致
+REF_PATH = "cs_path:${ref-path}"
+
+# EXT-X-KEY中的IV，平台只使用其十六进制字符串的前16个字符作为实际IV
+IV_HEX = "00112233445566778899aabbccddeeff"
+SEGMENT_IV = IV_HEX[:16].encode("utf-8")
+
+
+def _sign(nonce: str, key_id: str) -> str:
+    return hashlib.md5((nonce + key_id).encode("utf-8")).hexdigest()[:16]
+
+
+class StandInPlatform:
+    """
+    模拟平台各接口的本地数据源，所有内容由资源ID确定性地生成，不需要事先准备数据。
+
+    支持的接口（路径的第一段为原始域名）：
+    - s-file-1.ykt.cbern.com.cn：教材、一师一课、视频资源的详情JSON，教材目录（data_version.json及分页）和专题课程的list.json；
+    - doc-center.ykt.eduyun.cn：add_to_center/batch以及文档中心的资源详情；
+    - cdncs.ykt.cbern.com.cn：文档文件，支持Range和If-Range；
+    - r1-ndr.ykt.cbern.com.cn：HLS播放列表、AES-128-CBC加密的TS片段，以及/signs和nonce/sign密钥接口。
+    """
+
+    def __init__(self, doc_size: int = 4 * 1024 * 1024, segments: int = 60, segment_size: int = 256 * 1024,
+                 lesson_docs: int = 3, lesson_courseware: int = 3, lesson_videos: int = 1, seed: int = 0,
+                 catalog_pages: int = 2, catalog_page_size: int = 5, thematic_items: int = 3):
+        self.doc_size = doc_size
+        self.segments = segments
+        self.segment_size = segment_size
+        self.lesson_docs = lesson_docs
+        self.lesson_courseware = lesson_courseware
+        self.lesson_videos = lesson_videos
+        self.catalog_pages = catalog_pages
+        self.catalog_page_size = catalog_page_size
+        self.catalog_version = 1  # 修改后data_version.json列出新的分页，模拟目录发布新版本
+        self.thematic_items = thematic_items
+        self._block = random.Random(seed).randbytes(1024 * 1024)
+        self._files = {}
+        self._segments = {}
+        self._added = set()
+        self._lock = threading.Lock()
+
+    # ---- 资源内容 ----
+
+    def file_bytes(self, size: int) -> bytes:
+        with self._lock:
+            data = self._files.get(size)
+            if data is None:
+                data = (self._block * (size // len(self._block) + 1))[:size]
+                self._files[size] = data
+            return data
+
+    def segment_plain(self, index: int) -> bytes:
+        start = (index * 7919) % len(self._block)
+        return (self._block[start:] + self._block)[:self.segment_size]
+
+    def segment_encrypted(self, video_id: str, index: int) -> bytes:
+        with self._lock:
+            data = self._segments.get((video_id, index))
+        if data is None:
+            cipher = AES.new(self.video_key(video_id), AES.MODE_CBC, SEGMENT_IV)
+            data = cipher.encrypt(pad(self.segment_plain(index), AES.block_size))
+            with self._lock:
+                self._segments[(video_id, index)] = data
+        return data
+
+    def video_key(self, video_id: str) -> bytes:
+        return hashlib.sha256(video_id.encode("utf-8")).digest()[:16]
+
+    # ---- 详情JSON ----
+
+    def document_item(self, resource_id: str, title: str, size: int = None) -> dict:
+        size = size or self.doc_size
+        return {
+            "id": resource_id,
+            "title": title,
+            "global_title": {"zh-CN": title},
+            "custom_properties": {"format": "pdf", "size": size},
+            "ti_items": [{
+                "ti_file_flag": "source",
+                "ti_size": size,
+                "ti_storage": f"{REF_PATH}/bench/{resource_id}-{size}.pdf",
+                "ti_storages": [f"https://cdncs.ykt.cbern.com.cn/v0.1/static/bench/{resource_id}-{size}.pdf"]
+            }]
+        }
+
+    def video_item(self, video_id: str, title: str) -> dict:
+        return {
+            "id": video_id,
+            "title": title,
+            "global_title": {"zh-CN": title},
+            "custom_properties": {"format": "mp4", "size": self.segments * self.segment_size},
+            "ti_items": [{
+                "ti_file_flag": "href",
+                "ti_storage": f"{REF_PATH}/bench/{video_id}/index.m3u8",
+                "ti_storages": [f"https://r1-ndr.ykt.cbern.com.cn/bench/{video_id}/index.m3u8"]
+            }]
+        }
+
+    def courseware_item(self, resource_id: str, title: str) -> dict:
+        """json中没有下载地址、需要通过文档中心获取的课件"""
+        return {
+            "id": resource_id,
+            "container_id": f"container-{resource_id.split('-')[0]}",
+            "title": title,
+            "global_title": {"zh-CN": title},
+            "custom_properties": {"format": "pdf", "size": self.doc_size},
+            "ti_items": []
+        }
+
+    def lesson(self, lesson_id: str) -> dict:
+        return {
+            "title": f"基准测试课程{lesson_id}",
+            "teacher_list": [{"name": "测试教师"}],
+            "relations": {
+                "lesson_plan_design": [self.document_item(f"{lesson_id}-plan{i}", f"教学设计{i}")
+                                       for i in range(self.lesson_docs)],
+                "classroom_record": [self.video_item(f"{lesson_id}-record{i}", f"课堂实录{i}")
+                                     for i in range(self.lesson_videos)],
+                "teaching_assets": [self.courseware_item(f"{lesson_id}-asset{i}", f"课件{i}")
+                                    for i in range(self.lesson_courseware)]
+            }
+        }
+
+    def playlist(self, video_id: str) -> str:
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-MEDIA-SEQUENCE:0",
+                 f'#EXT-X-KEY:METHOD=AES-128,URI="https://r1-ndr.ykt.cbern.com.cn/bench/_keys/{video_id}",IV=0x{IV_HEX}']
+        for index in range(self.segments):
+            lines.append("#EXTINF:10.0,")
+            lines.append(f"seg-{index:05d}.ts")
+        lines.append("#EXT-X-ENDLIST")
+        return "\n".join(lines)
+
+    def data_version(self) -> dict:
+        urls = [f"https://s-file-1.ykt.cbern.com.cn/zxx/ndrs/resources/tch_material/part_{self.catalog_version}{i:03d}.json"
+                for i in range(self.catalog_pages)]
+        return {"module_version": self.catalog_version, "urls": ",".join(urls)}
+
+    def catalog_page(self, part: str) -> list:
+        """教材目录的一个分页，条目带学段和学科标签，偶数条为数学、奇数条为语文"""
+        return [{"id": f"tch-{part}-{i}", "title": f"基准测试教材{part}-{i}",
+                 "tag_list": [{"tag_name": "初中"}, {"tag_name": "数学" if i % 2 == 0 else "语文"}]}
+                for i in range(self.catalog_page_size)]
+
+    def thematic_list(self, course_id: str) -> list:
+        return [self.document_item(f"{course_id}-item{i}", f"专题资源{i}") for i in range(self.thematic_items)]
+
+    def mark_added(self, resource_ids: list) -> None:
+        with self._lock:
+            self._added.update(resource_ids)
+
+    def is_added(self, resource_id: str) -> bool:
+        with self._lock:
+            return resource_id in self._added
+
+
+class StandInServer:
+    """
+    在本地端口上运行StandInPlatform，可配置每个请求的延迟、每个响应的带宽以及错误注入。
+
+    参数:
+        platform (StandInPlatform): 数据源。
+        latency (float): 每个请求在返回响应头前等待的秒数。
+        bandwidth (float): 每个响应的最大发送速率（字节/秒），0为不限速。
+        error_rate (float): 文档文件和TS片段请求返回错误的概率。
+        error_status (int): 注入错误时返回的状态码，如500或429。
+    """
+
+    def __init__(self, platform: StandInPlatform, latency: float = 0.0, bandwidth: float = 0.0,
+                 error_rate: float = 0.0, error_status: int = 500, seed: int = 0):
+        self.platform = platform
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.bytes_sent = 0
+        self.errors_injected = 0
+        self._server = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def start(self, port: int = 0) -> "StandInServer":
+        server = self
+
+        class Handler(_Handler):
+            stand_in = server
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def should_fail(self) -> bool:
+        if self.error_rate <= 0:
+            return False
+        with self._lock:
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors_injected += 1
+            return failed
+
+    def count(self, sent: int) -> None:
+        with self._lock:
+            self.requests += 1
+            self.bytes_sent += sent
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {"requests": self.requests, "bytes_sent": self.bytes_sent, "errors_injected": self.errors_injected}
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.requests = self.bytes_sent = self.errors_injected = 0
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    stand_in = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, body: bytes, status: int = 200, headers: dict = None) -> None:
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        bandwidth = self.stand_in.bandwidth
+        if bandwidth <= 0 or self.command == "HEAD":
+            if self.command != "HEAD":
+                self.wfile.write(body)
+        else:
+            # 按带宽分块发送
+            chunk_size = max(1024, int(bandwidth / 50))
+            started = time.monotonic()
+            for offset in range(0, len(body), chunk_size):
+                self.wfile.write(body[offset:offset + chunk_size])
+                delay = started + (offset + chunk_size) / bandwidth - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+        self.stand_in.count(len(body))
+
+    def _send_json(self, data, status: int = 200) -> None:
+        self._send(json.dumps(data, ensure_ascii=False).encode("utf-8"), status,
+                   {"Content-Type": "application/json; charset=utf-8"})
+
+    def _route(self):
+        parts = urlsplit(self.path)
+        host, _, path = parts.path.lstrip("/").partition("/")
+        return host, "/" + path, parse_qs(parts.query)
+
+    def do_GET(self):
+        if self.stand_in.latency > 0:
+            time.sleep(self.stand_in.latency)
+        host, path, query = self._route()
+        platform = self.stand_in.platform
+
+        if host.startswith("s-file-"):
+            match = re.fullmatch(r"/zxx/ndrv2/resources/tch_material/details/(.+)\.json", path)
+            if match:
+                return self._send_json(platform.document_item(match.group(1), f"基准测试教材{match.group(1)}"))
+            match = re.fullmatch(r"/zxx/ndrv2/prepare_lesson/resources/details/(.+)\.json", path)
+            if match:
+                return self._send_json(platform.lesson(match.group(1)))
+            match = re.fullmatch(r"/zxx/ndrs/special_edu/resources/details/(.+)\.json", path)
+            if match:
+                return self._send_json(platform.video_item(match.group(1), f"基准测试视频{match.group(1)}"))
+            if path == "/zxx/ndrs/resources/tch_material/version/data_version.json":
+                return self._send_json(platform.data_version())
+            match = re.fullmatch(r"/zxx/ndrs/resources/tch_material/part_(\d+)\.json", path)
+            if match:
+                return self._send_json(platform.catalog_page(match.group(1)))
+            match = re.fullmatch(r"/zxx/ndrs/special_edu/thematic_course/([^/]+)/resources/list\.json", path)
+            if match:
+                return self._send_json(platform.thematic_list(match.group(1)))
+
+        elif host == "doc-center.ykt.eduyun.cn":
+            if not self.headers.get("Authorization", "").startswith("MAC id="):
+                return self._send_json({"code": "UNAUTHORIZED"}, 401)
+            match = re.fullmatch(r"/v1.0/c/document/([^/]+)", path)
+            if match:
+                resource_id = match.group(1)
+                if not platform.is_added(resource_id):
+                    return self._send_json({"code": "NOT_FOUND"}, 404)
+                return self._send_json(platform.document_item(resource_id, resource_id))
+
+        elif host == "cdncs.ykt.cbern.com.cn":
+            match = re.fullmatch(r"/v0.1/static/bench/(.+)-(\d+)\.pdf", path)
+            if match:
+                if self.stand_in.should_fail():
+                    return self._send(b"injected error", self.stand_in.error_status)
+                return self._send_file(platform.file_bytes(int(match.group(2))), match.group(1))
+
+        elif host == "r1-ndr.ykt.cbern.com.cn":
+            match = re.fullmatch(r"/bench/_keys/([^/]+)/signs", path)
+            if match:
+                return self._send_json({"nonce": f"{random.getrandbits(64):016x}"})
+            match = re.fullmatch(r"/bench/_keys/([^/]+)", path)
+            if match:
+                key_id = match.group(1)
+                nonce, sign = query.get("nonce", [""])[0], query.get("sign", [""])[0]
+                if not nonce or sign != _sign(nonce, key_id):
+                    return self._send_json({"code": "INVALID_SIGN"}, 403)
+                key = AES.new(sign.encode("utf-8"), AES.MODE_ECB).encrypt(pad(platform.video_key(key_id), AES.block_size))
+                return self._send_json({"key": base64.b64encode(key).decode("utf-8")})
+            match = re.fullmatch(r"/bench/([^/]+)/index\.m3u8", path)
+            if match:
+                return self._send(platform.playlist(match.group(1)).encode("utf-8"), 200,
+                                  {"Content-Type": "application/vnd.apple.mpegurl"})
+            match = re.fullmatch(r"/bench/([^/]+)/seg-(\d+)\.ts", path)
+            if match and int(match.group(2)) < platform.segments:
+                if self.stand_in.should_fail():
+                    return self._send(b"injected error", self.stand_in.error_status)
+                return self._send(platform.segment_encrypted(match.group(1), int(match.group(2))), 200,
+                                  {"Content-Type": "video/mp2t"})
+
+        self._send_json({"code": "NOT_FOUND", "path": self.path}, 404)
+
+    def do_POST(self):
+        if self.stand_in.latency > 0:
+            time.sleep(self.stand_in.latency)
+        host, path, _ = self._route()
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if host == "doc-center.ykt.eduyun.cn" and path == "/v1.0/c/document/actions/add_to_center/batch":
+            if not self.headers.get("Authorization", "").startswith("MAC id="):
+                return self._send_json({"code": "UNAUTHORIZED"}, 401)
+            data = json.loads(body or b"{}")
+            resource_ids = [item["resource_id"] for item in data.get("resource_list", [])]
+            self.stand_in.platform.mark_added(resource_ids)
+            return self._send_json({"items": [{"resource_id": resource_id} for resource_id in resource_ids]})
+        self._send_json({"code": "NOT_FOUND", "path": self.path}, 404)
+
+    def _send_file(self, data: bytes, name: str) -> None:
+        """支持Range/If-Range的文件响应"""
+        etag = f'"{hashlib.md5(name.encode("utf-8")).hexdigest()}-{len(data)}"'
+        headers = {"ETag": etag, "Accept-Ranges": "bytes", "Content-Type": "application/pdf"}
+        range_header = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", range_header or "")
+        if match and (if_range is None or if_range == etag):
+            start = int(match.group(1))
+            end = min(int(match.group(2)) if match.group(2) else len(data) - 1, len(data) - 1)
+            if start >= len(data):
+                return self._send(b"", 416, {"Content-Range": f"bytes */{len(data)}"})
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+            return self._send(data[start:end + 1], 206, headers)
+        self._send(data, 200, headers)
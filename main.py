@@ -1,15 +1,52 @@
-from utils.command import welcome_interface, get_text_file_input, get_user_input, download_content, get_user_info, get_app_id
+import os
+import argparse
+from utils.command import welcome_interface, get_text_file_input, get_user_input, download_content, get_user_info, get_app_id, print_run_stats
+from utils import config, metrics
+from utils.crawler import CATALOGS, CatalogCrawler
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Smartedu-Download")
+    parser.add_argument("--sync", action="store_true", help="增量同步，只下载新增或有变化的资源")
+    parser.add_argument("--crawl", metavar="CATALOG", choices=list(CATALOGS), help="抓取整个目录（tchMaterial为教材，thematic为专题课程资源，需配合--course-id）中范围内的全部资源，中断后再次运行会继续")
+    parser.add_argument("--course-id", help="抓取专题课程资源（thematic）时的课程ID")
+    parser.add_argument("--tag", action="append", default=[], help="抓取范围：条目必须包含的标签，如学段、学科、年级，可指定多次")
+    parser.add_argument("--keyword", help="抓取范围：条目标题必须包含的关键字")
+    parser.add_argument("--retry-failed", action="store_true", help="抓取时重新处理上次失败的条目")
+    parser.add_argument("--serve", action="store_true", help="以服务模式运行，通过本地HTTP接口接收下载任务")
+    parser.add_argument("--host", default=config.SERVICE_HOST, help="服务模式监听的地址")
+    parser.add_argument("--port", type=int, default=config.SERVICE_PORT, help="服务模式监听的端口")
+    args = parser.parse_args()
+    if args.crawl and "list" in CATALOGS[args.crawl] and not args.course_id:
+        parser.error(f"--crawl {args.crawl} 需要通过--course-id指定课程ID")
+    if args.sync:
+        config.SYNC = 1
+
     # 显示欢迎界面
     welcome_interface()
 
+    # 按配置启动运行指标输出
+    metrics.start()
+
     # 获取APP-ID
     app_id = get_app_id()
 
+    if args.serve:
+        from utils.service import serve
+
+        # 服务模式可通过环境变量提供身份验证信息，无需在启动时输入
+        user_data = os.environ.get("SMARTEDU_USER_DATA") or get_user_info(app_id)
+        serve(user_data, app_id, args.host, args.port)
+
     # 获取用户输入的身份验证信息
     user_data = get_user_info(app_id)
 
+    if args.crawl:
+        crawler = CatalogCrawler(args.crawl, args.tag, args.keyword, course_id=args.course_id)
+        crawler.run(lambda web_url: download_content(web_url, user_data, app_id), retry_failed=args.retry_failed)
+        print_run_stats()
+        metrics.flush()
+        raise SystemExit(0)
+
     # 获取txt文件中的链接进行处理
     get_text_file_input(user_data, app_id)
 
@@ -0,0 +1,480 @@
+import os
+import time
+import asyncio
+import threading
+import contextlib
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from utils import config, metrics, profiling, progress, transport, cancellation
+from utils.tool import ensure_directory_exists
+from utils.crypt import aes_ecb_decrypt, aes_cbc_decrypt_into, md5_encrypt
+from utils.partfile import PartFileState
+from utils.bandwidth import bandwidth_limiter
+from utils.store import content_store
+from utils.sync import sync_state
+from utils.download import (build_file_name, parse_m3u8_content, open_video_checkpoint,
+                            prepare_video_part, key_store, needs_range_probe, range_total_size, split_ranges)
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class AsyncOrderedWriter:
+    """
+    asyncio版本的按顺序写入器，与utils.writer.OrderedSegmentWriter的行为一致。
+
+    片段在下载前先调用wait_turn等待进入重排缓冲区范围，避免大量已下载的数据堆积在内存中。
+    """
+
+    def __init__(self, file_path: str, buffer_size: int, start_index: int = 0, mode: str = 'wb', on_write=None):
+        self.file_path = file_path
+        self.buffer_size = max(1, buffer_size)
+        self.next_index = start_index
+        self.bytes_written = 0
+        self._file = open(file_path, mode)
+        self._pending = {}
+        self._condition = asyncio.Condition()
+        self._on_write = on_write
+
+    async def wait_turn(self, index: int) -> None:
+        """等待编号为index的片段进入重排缓冲区范围。"""
+        async with self._condition:
+            await self._condition.wait_for(lambda: index - self.next_index < self.buffer_size)
+
+    async def write(self, index: int, data: bytes) -> None:
+        async with self._condition:
+            self._pending[index] = data
+            if self.next_index in self._pending:
+                # 文件写入和断点记录在线程中进行，不阻塞事件循环
+                await asyncio.get_running_loop().run_in_executor(None, self._flush_ready)
+            self._condition.notify_all()
+
+    def _flush_ready(self) -> None:
+        while self.next_index in self._pending:
+            chunk = self._pending.pop(self.next_index)
+            with profiling.stage("segment_write", len(chunk)):
+                self._file.write(chunk)
+                self.bytes_written += len(chunk)
+                if self._on_write is not None:
+                    self._file.flush()
+                    self._on_write(self.next_index, len(chunk))
+            self.next_index += 1
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class AsyncEngine:
+    """
+    基于asyncio和aiohttp的下载引擎。
+
+    所有条目在同一个事件循环中并发下载，同时进行的传输数由config.ASYNC_CONCURRENCY限制，不再为每个请求占用一个线程；
+    发出请求到收到响应头期间还占用与同步请求共用的全局在途名额（config.MAX_IN_FLIGHT），并按主机计入相同的HTTP指标。
+    大文档与同步引擎一样按config.RANGE_CONNECTIONS分段下载，文件写入在线程中进行。
+    断点记录、.part文件和密钥缓存与同步引擎共用，两种引擎下载的文件可以互相续传。
+    元数据解析仍使用同步请求，在下载管线的解析线程中进行。
+    """
+
+    def __init__(self, session, decrypt_executor):
+        self.session = session
+        self.decrypt_executor = decrypt_executor
+        self.semaphore = asyncio.Semaphore(config.ASYNC_CONCURRENCY)
+        self._key_locks = {}
+
+    @contextlib.asynccontextmanager
+    async def request(self, url: str, headers: dict = None):
+        """发起GET请求并返回响应，收到响应头前占用全局在途名额，请求按主机和状态码计入运行指标。"""
+        host = urlsplit(url).netloc
+        async with self.semaphore:
+            async with transport.in_flight_async():
+                started = time.monotonic()
+                try:
+                    response = await self.session.get(url, headers=headers)
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    transport.record_request(host, "error", time.monotonic() - started)
+                    raise
+                transport.record_request(host, response.status, time.monotonic() - started)
+            try:
+                yield response
+            finally:
+                response.release()
+
+    async def fetch_bytes(self, url: str, headers: dict = None) -> bytes:
+        async with self.request(url, headers) as response:
+            response.raise_for_status()
+            return await response.read()
+
+    async def fetch_segment(self, url: str) -> bytearray:
+        """按块读取片段内容，每块都经过全局限速。"""
+        data = bytearray()
+        started = time.monotonic()
+        async with self.request(url) as response:
+            response.raise_for_status()
+            async for chunk in response.content.iter_chunked(config.CHUNK_SIZE):
+                cancellation.check()
+                data += chunk
+                await bandwidth_limiter.throttle_async(len(chunk))
+                metrics.inc("smartedu_download_bytes_total", len(chunk), kind="segment")
+                progress.add_bytes(len(chunk))
+        metrics.observe("smartedu_segment_fetch_seconds", time.monotonic() - started)
+        profiling.record("segment_fetch", time.monotonic() - started, size=len(data))
+        return data
+
+    async def fetch_json(self, url: str):
+        async with self.request(url) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+    async def download_item(self, item: dict) -> bool:
+        """下载单个条目，失败时打印错误并返回False。"""
+        file_name = item["file_name"]
+        kind = "video" if item["is_video"] else "document"
+        try:
+            if item["is_video"]:
+                await self.download_video(item["file_url"], item["path"], file_name)
+            else:
+                print(f"正在下载 {file_name}.{item['file_format']} ...")
+                full_path = await self.download_document(item["file_url"], item["path"], file_name,
+                                                         item.get("file_size"))
+                print(f"下载完成，文件保存在 {full_path}")
+        except Exception as e:
+            print(f"下载 {file_name} 时发生错误: {e}")
+            metrics.inc("smartedu_downloads_total", kind=kind, result="failed")
+            return False
+        metrics.inc("smartedu_downloads_total", kind=kind, result="ok")
+        sync_state.record(item)
+        return True
+
+    @contextlib.asynccontextmanager
+    async def store_lock(self, url: str):
+        """
+        占用content_store.lock_for(url)，与同步引擎共用，同一地址同时只下载一次，其他任务等待后直接从存储中链接。
+
+        锁被占用时轮询等待，不占用线程，任务被取消时也不会遗留锁。
+        """
+        lock = content_store.lock_for(url)
+        delay = 0.001
+        while not lock.acquire(blocking=False):
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.1)
+        try:
+            yield
+        finally:
+            lock.release()
+
+    async def download_document(self, url: str, save_path: str, filename: str, file_size = None) -> str:
+        """
+        下载文档，同一文件已经下载过时直接从本地存储中链接。
+        本地存储的链接和加入（计算SHA-256、可能复制文件）都在线程中进行，不阻塞事件循环。
+        """
+        ensure_directory_exists(save_path)
+        full_path = os.path.join(save_path, build_file_name(url, filename))
+        loop = asyncio.get_running_loop()
+        async with self.store_lock(url):
+            if await loop.run_in_executor(None, content_store.restore, url, full_path, file_size):
+                return full_path
+            await self.fetch_document(url, full_path, file_size)
+            await loop.run_in_executor(None, content_store.add, url, full_path)
+        return full_path
+
+    async def fetch_document(self, url: str, full_path: str, file_size = None) -> None:
+        """
+        下载文档到.part文件，支持从上次中断处继续，完成后重命名为最终文件名。
+        大文件按字节范围分段并行下载，步骤与utils.download.fetch_file一致。
+        """
+        loop = asyncio.get_running_loop()
+        state = await loop.run_in_executor(None, PartFileState.load, full_path + '.part', url)
+        started = time.monotonic()
+
+        total_size, headers = await self.probe_range_size(url, file_size)
+        if headers is not None and not state.matches(headers):
+            print("服务器上的文件已更新，重新下载。")
+            state.reset(headers)
+        if total_size:
+            if await loop.run_in_executor(None, split_ranges, state, total_size, headers):
+                print("从上次中断处继续分段下载")
+            tasks = [asyncio.ensure_future(self.download_range(url, state, index))
+                     for index in range(len(state.ranges))]
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                # 任一分段失败后取消其余分段，已写入的字节保留在记录中
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+            finally:
+                await loop.run_in_executor(None, state.save)
+        else:
+            await self.download_stream(url, state)
+
+        profiling.record("document_download", time.monotonic() - started, size=os.path.getsize(state.part_path))
+        await loop.run_in_executor(None, state.finish, full_path)
+
+    async def probe_range_size(self, url: str, file_size = None):
+        """与utils.download.probe_range_size相同：返回(可以分段下载时为文件总大小，否则为None, 探测请求的响应头)"""
+        if not needs_range_probe(file_size):
+            return None, None
+        async with self.request(url, {'Range': 'bytes=0-0'}) as response:
+            response.raise_for_status()
+            return range_total_size(response.status, response.headers), response.headers
+
+    async def download_stream(self, url: str, state: PartFileState) -> None:
+        """使用单个连接下载，有上次未完成的数据时带上Range和If-Range请求剩余部分"""
+        offset = state.bytes_written if state.ranges is None else 0
+        if offset and state.size is not None and offset >= state.size:
+            # 上次已下载完整，只是还未重命名
+            return
+        headers = {}
+        if offset:
+            headers['Range'] = f'bytes={offset}-'
+            if state.if_range():
+                headers['If-Range'] = state.if_range()
+
+        async with self.request(url, headers) as response:
+            response.raise_for_status()
+            if offset and response.status == 206:
+                print(f"从 {offset} 字节处继续下载")
+            else:
+                offset = 0
+                state.reset(response.headers, response.content_length)
+            await self.write_body(response, state, offset, 'r+b' if offset else 'wb', truncate=True)
+
+    async def download_range(self, url: str, state: PartFileState, index: int) -> None:
+        """下载第index段尚未完成的字节范围，并写入.part文件的对应位置"""
+        start, end, written = state.ranges[index]
+        if start + written > end:
+            return
+        headers = {'Range': f'bytes={start + written}-{end}'}
+        if state.if_range():
+            headers['If-Range'] = state.if_range()
+
+        async with self.request(url, headers) as response:
+            response.raise_for_status()
+            if response.status != 206:
+                raise IOError(f"服务器未按Range返回数据，状态码: {response.status}")
+            await self.write_body(response, state, start + written, 'r+b', range_index=index)
+
+        if state.ranges[index][2] != end - start + 1:
+            raise IOError(f"分段 {start}-{end} 下载不完整，仅收到 {state.ranges[index][2]} 字节")
+
+    async def write_body(self, response, state: PartFileState, offset: int, mode: str,
+                         truncate: bool = False, range_index: int = None) -> None:
+        """把响应内容从offset处写入.part文件，写入在线程中进行，不阻塞事件循环"""
+        loop = asyncio.get_running_loop()
+        file = await loop.run_in_executor(None, open, state.part_path, mode, 0)
+        try:
+            await loop.run_in_executor(None, file.seek, offset)
+            if truncate:
+                await loop.run_in_executor(None, file.truncate)
+            async for chunk in response.content.iter_chunked(config.CHUNK_SIZE):
+                cancellation.check()
+                await loop.run_in_executor(None, file.write, chunk)
+                await loop.run_in_executor(None, state.add_bytes, len(chunk), range_index)
+                await bandwidth_limiter.throttle_async(len(chunk))
+                metrics.inc("smartedu_download_bytes_total", len(chunk), kind="document")
+                progress.add_bytes(len(chunk))
+        finally:
+            await loop.run_in_executor(None, file.close)
+            if range_index is None:
+                await loop.run_in_executor(None, state.save)
+
+    async def get_key(self, key_url: str, key_id: str) -> bytes:
+        """获取解密密钥，与同步引擎共用密钥缓存，同一密钥只请求一次。"""
+        key = key_store.peek(key_url)
+        if key is not None:
+            return key
+        started = time.monotonic()
+        lock = self._key_locks.setdefault(key_url, asyncio.Lock())
+        async with lock:
+            key = key_store.peek(key_url)
+            if key is not None:
+                return key
+            nonce = (await self.fetch_json(key_url + "/signs"))["nonce"]
+            sign = md5_encrypt(nonce + key_id)
+            data = await self.fetch_json(f"{key_url}?nonce={nonce}&sign={sign}")
+            key = aes_ecb_decrypt(sign.encode('utf-8'), data["key"])
+            key_store.put(key_url, key)
+            profiling.record("get_key", time.monotonic() - started)
+            return key
+
+    async def download_video(self, m3u8_url: str, save_path: str, file_name: str) -> None:
+        """下载M3U8视频，同一视频已经下载过时直接从本地存储中链接，与download_document相同。"""
+        outfile_name = os.path.join(save_path, f"{file_name}.mp4")
+        loop = asyncio.get_running_loop()
+        async with self.store_lock(m3u8_url):
+            if await loop.run_in_executor(None, content_store.restore, m3u8_url, outfile_name):
+                return
+            await self.fetch_video(m3u8_url, save_path, file_name)
+            await loop.run_in_executor(None, content_store.add, m3u8_url, outfile_name)
+
+    async def fetch_video(self, m3u8_url: str, save_path: str, file_name: str) -> None:
+        """
+        从网络下载M3U8视频：解析播放列表、获取密钥、并发下载片段并按顺序写入 <save_path>/<file_name>.mp4。
+        断点记录的读取和保存在线程中进行。
+        """
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        m3u8_content = (await self.fetch_bytes(m3u8_url)).decode('utf-8')
+        profiling.record("fetch_playlist", time.monotonic() - started)
+        segments = parse_m3u8_content(m3u8_url, m3u8_content)['segments']
+
+        ensure_directory_exists(save_path)
+        checkpoint = await loop.run_in_executor(None, open_video_checkpoint, m3u8_url, segments, save_path, file_name)
+        keys = {}
+        for segment in segments:
+            key_url = segment['key_url']
+            if key_url is not None and key_url not in keys:
+                keys[key_url] = checkpoint.keys.get(key_url) or await self.get_key(key_url, segment['key_id'])
+        checkpoint.keys.update(keys)
+
+        outfile_name = os.path.join(save_path, f"{file_name}.mp4")
+        start_index, mode = await loop.run_in_executor(None, prepare_video_part, checkpoint, len(segments))
+        writer = AsyncOrderedWriter(checkpoint.part_path, config.SEGMENT_BUFFER,
+                                    start_index=start_index, mode=mode, on_write=checkpoint.record)
+
+        async def fetch_and_write(index, segment):
+            await writer.wait_turn(index)
+            data = await self.download_segment(segment['url'])
+            key = keys.get(segment['key_url'])
+            if key:
+                # 在单独的解密线程池中原地解密，不占用事件循环
+                started = time.monotonic()
+                data = await loop.run_in_executor(
+                    self.decrypt_executor, aes_cbc_decrypt_into, key, memoryview(data), segment['iv'])
+                metrics.observe("smartedu_segment_decrypt_seconds", time.monotonic() - started)
+                profiling.record("segment_decrypt", time.monotonic() - started, size=len(data))
+            await writer.write(index, data)
+
+        tasks = [asyncio.ensure_future(fetch_and_write(index, segments[index]))
+                 for index in range(start_index, len(segments))]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # 任一片段失败后取消其余任务，保留断点记录
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            writer.close()
+            await loop.run_in_executor(None, checkpoint.save)
+            print(f"视频下载未完成，已保存断点（{checkpoint.completed}/{len(segments)} 个片段），重新运行即可继续。")
+            raise
+
+        with metrics.timer("smartedu_video_merge_seconds"), profiling.stage("merge"):
+            writer.close()
+            os.replace(checkpoint.part_path, outfile_name)
+        await loop.run_in_executor(None, checkpoint.remove)
+        print(f"ts视频流下载完成，视频已保存至: {outfile_name}")
+
+    async def download_segment(self, ts_url: str) -> bytearray:
+        """下载单个TS片段，失败时最多重试3次。"""
+        max_retries = 3  # 最大重试次数
+        retry_delay = 1  # 重试间隔时间（秒）
+        for attempt in range(1, max_retries + 1):
+            try:
+                return await self.fetch_segment(ts_url)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"下载失败，尝试第{attempt}/{max_retries}次，原因：{e}")
+                if attempt == max_retries:
+                    raise
+                metrics.inc("smartedu_segment_retries_total", host=urlsplit(ts_url).netloc)
+                await asyncio.sleep(retry_delay)
+
+
+@contextlib.asynccontextmanager
+async def open_engine():
+    """创建共享连接池的AsyncEngine，退出时关闭连接和解密线程"""
+    connector = aiohttp.TCPConnector(limit=config.ASYNC_CONCURRENCY, limit_per_host=config.ASYNC_CONCURRENCY)
+    timeout = aiohttp.ClientTimeout(sock_connect=config.CONNECT_TIMEOUT, sock_read=config.READ_TIMEOUT)
+    with ThreadPoolExecutor(max_workers=max(1, config.DECRYPT_WORKERS)) as decrypt_executor:
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            yield AsyncEngine(session, decrypt_executor)
+
+
+async def download_items_async(items: list, on_done=None) -> bool:
+    """
+    使用asyncio引擎并发下载所有条目。
+
+    参数:
+        on_done (callable, optional): 每个条目结束后调用，参数为条目和是否成功。
+
+    返回:
+        bool: 所有条目均下载成功时返回True，否则返回False。
+    """
+    async with open_engine() as engine:
+
+        async def download_one(item):
+            cancellation.check()
+            ok = await engine.download_item(item)
+            if on_done is not None:
+                on_done(item, ok)
+            return ok
+
+        results = await asyncio.gather(*(download_one(item) for item in items))
+    return all(results)
+
+
+class LoopQueue:
+    """
+    由其他线程放入条目、在事件循环中取出的有界队列。
+
+    put在队列满时阻塞调用线程（解析线程随之暂停）；close之后或事件循环已结束时put不再阻塞，条目被丢弃。
+    下载协程直接等待asyncio.Queue，不占用线程池中的线程。
+    """
+
+    def __init__(self, loop, maxsize: int):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self._closed = threading.Event()
+
+    def put(self, item) -> None:
+        if self._closed.is_set():
+            return
+        try:
+            future = asyncio.run_coroutine_threadsafe(self.queue.put(item), self.loop)
+        except RuntimeError:
+            # 事件循环已关闭
+            return
+        while True:
+            try:
+                future.result(0.5)
+                return
+            except FutureTimeoutError:
+                if self._closed.is_set():
+                    future.cancel()
+                    return
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self) -> None:
+        self._closed.set()
+
+
+async def download_queue_async(items_queue: LoopQueue, workers: int, on_done=None) -> bool:
+    """
+    使用asyncio引擎从队列（由解析线程边解析边放入）中取出条目下载，
+    workers个下载协程同时进行，每个协程取到None时结束。
+
+    返回:
+        bool: 所有条目均下载成功时返回True，否则返回False。
+    """
+    async with open_engine() as engine:
+
+        async def worker():
+            success = True
+            while True:
+                item = await items_queue.get()
+                if item is None:
+                    return success
+                cancellation.check()
+                ok = await engine.download_item(item)
+                progress.finished(item, ok)
+                if on_done is not None:
+                    on_done(item, ok)
+                success = success and ok
+
+        results = await asyncio.gather(*(worker() for _ in range(max(1, workers))))
+    return all(results)
@@ -0,0 +1,184 @@
+import time
+import asyncio
+import threading
+from utils import config
+
+_UNITS = {"": 1, "B": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def parse_rate(text: str) -> float:
+    """
+    解析带单位的速率（字节/秒），如"512K"、"2M"、"1.5G"，单位后可带"B"或"/s"。空字符串或0表示不限速。
+
+    异常:
+        ValueError: 格式不正确。
+    """
+    value = (text or "").strip().upper().replace("/S", "")
+    if value.endswith("B") and len(value) > 1 and value[-2] in _UNITS:
+        value = value[:-1]
+    if not value:
+        return 0.0
+    unit = value[-1] if value[-1] in _UNITS else ""
+    number = value[:-1] if unit else value
+    return float(number) * _UNITS[unit]
+
+
+def parse_schedule(text: str) -> list:
+    """
+    解析分时段限速规则，如"08:00-18:00=1M;18:00-08:00=0"，规则之间用分号或逗号分隔。
+    结束时间早于开始时间的时段跨越午夜。
+
+    返回:
+        list: [(开始分钟, 结束分钟, 速率), ...]
+
+    异常:
+        ValueError: 格式不正确。
+    """
+    rules = []
+    for part in (text or "").replace(",", ";").split(";"):
+        part = part.strip()
+        if not part:
+            continue
+        period, rate = part.split("=", 1)
+        start, end = period.split("-", 1)
+        rules.append((_parse_minute(start), _parse_minute(end), parse_rate(rate)))
+    return rules
+
+
+def _parse_minute(text: str) -> int:
+    hour, minute = text.strip().split(":")
+    hour, minute = int(hour), int(minute)
+    if not (0 <= hour <= 24 and 0 <= minute < 60):
+        raise ValueError(f"时间格式不正确: {text}")
+    return hour * 60 + minute
+
+
+class BandwidthLimiter:
+    """
+    进程内共享的令牌桶限速器，文档和视频片段下载读取的每一块数据都要先取得相应的令牌。
+
+    令牌按当前速率持续补充，最多累积burst字节；取令牌时允许透支，透支的部分按速率换算成等待时间，
+    因此多个线程同时下载时总速率仍不超过限制。配置了分时段规则时，按本地时间选取当前时段的速率，
+    不在任何时段内时使用默认速率。速率为0表示不限速。
+    """
+
+    def __init__(self, rate: float = 0, burst: float = None, schedule: list = None):
+        """
+        参数:
+            rate (float): 默认速率（字节/秒）。
+            burst (float, optional): 令牌桶容量（字节），默认为1秒的流量。
+            schedule (list, optional): parse_schedule返回的分时段规则。
+        """
+        self.rate = rate
+        self.burst = burst
+        self.schedule = schedule or []
+        self._lock = threading.Lock()
+        self._tokens = None
+        self._last_refill = time.monotonic()
+        # 实际吞吐量统计
+        self.total_bytes = 0
+        self.waited = 0.0
+        self._first_time = None
+        self._last_time = None
+        self._second = None
+        self._second_bytes = 0
+        self.peak = 0
+
+    def current_rate(self) -> float:
+        """按本地时间返回当前生效的速率。"""
+        if self.schedule:
+            now = time.localtime()
+            minute = now.tm_hour * 60 + now.tm_min
+            for start, end, rate in self.schedule:
+                if start <= minute < end or (end < start and (minute >= start or minute < end)):
+                    return rate
+        return self.rate
+
+    def reserve(self, count: int) -> float:
+        """
+        取出count字节的令牌。
+
+        返回:
+            float: 需要等待的秒数，不限速或令牌充足时为0。
+        """
+        rate = self.current_rate()
+        with self._lock:
+            now = time.monotonic()
+            if rate <= 0:
+                self._tokens = None
+                self._last_refill = now
+                return 0.0
+            burst = self.burst or rate
+            if self._tokens is None:
+                self._tokens = burst
+            self._tokens = min(burst, self._tokens + (now - self._last_refill) * rate)
+            self._last_refill = now
+            self._tokens -= count
+            return -self._tokens / rate if self._tokens < 0 else 0.0
+
+    def throttle(self, count: int) -> None:
+        """读取了count字节后调用，超出限速时在当前线程中等待。"""
+        delay = self.reserve(count)
+        if delay > 0:
+            time.sleep(delay)
+        self._record(count, delay)
+
+    async def throttle_async(self, count: int) -> None:
+        """throttle的asyncio版本，等待时不阻塞事件循环。"""
+        delay = self.reserve(count)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self._record(count, delay)
+
+    def _record(self, count: int, delay: float) -> None:
+        now = time.monotonic()
+        second = int(now)
+        with self._lock:
+            if self._first_time is None:
+                self._first_time = now
+            self._last_time = now
+            self.total_bytes += count
+            self.waited += delay
+            if second != self._second:
+                self._second, self._second_bytes = second, 0
+            self._second_bytes += count
+            self.peak = max(self.peak, self._second_bytes)
+
+    def get_stats(self) -> dict:
+        """
+        返回实际吞吐量统计：总字节数、从第一块到最后一块数据的秒数、平均速率、
+        单秒最高速率、因限速累计等待的秒数以及当前限速（均以字节为单位）。
+        """
+        with self._lock:
+            seconds = (self._last_time - self._first_time) if self._first_time is not None else 0.0
+            return {
+                "bytes": self.total_bytes,
+                "seconds": seconds,
+                "average": self.total_bytes / seconds if seconds > 0 else 0.0,
+                "peak": self.peak,
+                "waited": self.waited,
+                "limit": self.current_rate()
+            }
+
+    def print_stats(self) -> None:
+        stats = self.get_stats()
+        if not stats["bytes"]:
+            return
+        mb = 1024 * 1024
+        limit = f"{stats['limit'] / mb:.2f} MB/s" if stats["limit"] > 0 else "不限速"
+        print(f"带宽：共下载 {stats['bytes'] / mb:.2f} MB，平均 {stats['average'] / mb:.2f} MB/s，"
+              f"单秒峰值 {stats['peak'] / mb:.2f} MB/s，限速等待 {stats['waited']:.1f} 秒（当前限速 {limit}）")
+
+
+def _create_limiter() -> BandwidthLimiter:
+    try:
+        rate = parse_rate(config.BANDWIDTH_LIMIT)
+        burst = parse_rate(config.BANDWIDTH_BURST) or None
+        schedule = parse_schedule(config.BANDWIDTH_SCHEDULE)
+    except ValueError as e:
+        print(f"限速配置格式不正确，将不限速: {e}")
+        return BandwidthLimiter()
+    return BandwidthLimiter(rate, burst, schedule)
+
+
+bandwidth_limiter = _create_limiter()
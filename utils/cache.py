@@ -0,0 +1,289 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import requests
+from utils import config, transport, metrics
+
+
+class MetadataCache:
+    """
+    资源详情JSON的本地缓存，每个URL对应缓存目录下的一个文件。
+
+    - 缓存未过期（config.METADATA_TTL秒内）时直接返回，不发起请求；
+    - 过期后带上If-None-Match/If-Modified-Since重新验证，服务器返回304时继续使用缓存；
+    - 重新验证时连接失败、超时或服务器返回5xx，退回使用过期的缓存（计为stale）；4xx直接抛出；
+    - 缓存总大小超过config.METADATA_CACHE_MAX_BYTES时，按最近使用时间淘汰最久未用的条目。
+    """
+
+    def __init__(self, cache_dir: str = None):
+        self._cache_dir = cache_dir
+        self._index = None  # {文件名: [最近使用时间, 文件大小]}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.stale = 0  # 请求失败时使用过期缓存的次数
+
+    @property
+    def cache_dir(self) -> str:
+        return self._cache_dir or os.path.join(config.CACHE_DIR, "metadata")
+
+    def _entry_name(self, url: str) -> str:
+        return hashlib.sha1(url.encode("utf-8")).hexdigest() + ".json"
+
+    def _load_index(self) -> dict:
+        """首次使用时扫描缓存目录，建立淘汰所需的索引。"""
+        if self._index is None:
+            self._index = {}
+            if os.path.isdir(self.cache_dir):
+                for name in os.listdir(self.cache_dir):
+                    if name.endswith(".json"):
+                        stat = os.stat(os.path.join(self.cache_dir, name))
+                        self._index[name] = [stat.st_mtime, stat.st_size]
+        return self._index
+
+    def _read(self, name: str):
+        path = os.path.join(self.cache_dir, name)
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def _touch(self, name: str) -> None:
+        """更新条目的最近使用时间，文件修改时间同时作为下次启动时的LRU依据。"""
+        now = time.time()
+        with self._lock:
+            index = self._load_index()
+            if name in index:
+                index[name][0] = now
+        try:
+            os.utime(os.path.join(self.cache_dir, name), (now, now))
+        except OSError:
+            pass
+
+    def _write(self, name: str, entry: dict) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = os.path.join(self.cache_dir, name)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(entry, file, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+        with self._lock:
+            index = self._load_index()
+            index[name] = [time.time(), os.path.getsize(path)]
+            self._evict_locked()
+
+    def _evict_locked(self) -> None:
+        index = self._index
+        total = sum(size for _, size in index.values())
+        if total <= config.METADATA_CACHE_MAX_BYTES:
+            return
+        for name in sorted(index, key=lambda key: index[key][0]):
+            if total <= config.METADATA_CACHE_MAX_BYTES:
+                break
+            total -= index.pop(name)[1]
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+
+    def get_json(self, url: str):
+        """
+        获取URL对应的JSON数据。
+
+        异常:
+            requests.exceptions.RequestException: 请求失败且没有可用缓存时抛出。
+            ValueError: 响应内容不是有效的JSON。
+        """
+        if not config.METADATA_CACHE:
+            response = transport.get(url)
+            response.raise_for_status()
+            return response.json()
+
+        name = self._entry_name(url)
+        entry = self._read(name)
+        if entry is not None and entry.get("url") != url:
+            entry = None
+
+        if entry is not None and time.time() - entry["fetched_at"] < config.METADATA_TTL:
+            self._count("hits")
+            self._touch(name)
+            return entry["data"]
+
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        try:
+            response = transport.get(url, headers=headers)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if entry is None:
+                raise
+            return self._stale(url, entry, e)
+
+        if response.status_code == 304 and entry is not None:
+            self._count("revalidated")
+            entry["fetched_at"] = time.time()
+            self._write(name, entry)
+            return entry["data"]
+        if response.status_code >= 500 and entry is not None:
+            return self._stale(url, entry, f"HTTP {response.status_code}")
+        # 4xx（如资源已下架）不使用缓存，直接抛出
+        response.raise_for_status()
+
+        data = response.json()
+        self._count("misses")
+        self._write(name, {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "fetched_at": time.time(),
+            "data": data
+        })
+        return data
+
+    def _stale(self, url: str, entry: dict, reason):
+        """连接失败、超时或服务器错误时退回使用过期的缓存"""
+        print(f"获取 {url} 失败，使用过期的本地缓存: {reason}")
+        self._count("stale")
+        return entry["data"]
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+        metrics.inc("smartedu_cache_events_total", cache="metadata", result=name)
+
+    def get_stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "revalidated": self.revalidated, "stale": self.stale}
+
+    def print_stats(self) -> None:
+        total = self.hits + self.misses + self.revalidated + self.stale
+        if not total:
+            return
+        print(f"元数据缓存：命中 {self.hits} 次，重新验证 {self.revalidated} 次，未命中 {self.misses} 次"
+              + (f"，请求失败时使用过期缓存 {self.stale} 次" if self.stale else ""))
+
+
+metadata_cache = MetadataCache()
+
+
+class ResolutionCache:
+    """
+    课件下载链接解析结果的缓存，保存在缓存目录下的resolutions.json中。
+
+    - 以resource_id为键记录通过文档中心解析得到的下载链接，超过config.RESOLUTION_TTL秒后失效；
+    - 记录每个用户已经添加到文档中心的资源，避免重复调用add_to_center。
+    """
+
+    def __init__(self, path: str = None):
+        self._path = path
+        self._urls = None  # {resource_id: {"url": 下载链接, "expires_at": 过期时间}}
+        self._added = None  # {用户标识: [resource_id, ...]}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_save = 0.0
+        self._resource_locks = {}
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def path(self) -> str:
+        return self._path or os.path.join(config.CACHE_DIR, "resolutions.json")
+
+    def _load_locked(self) -> None:
+        if self._urls is not None:
+            return
+        self._urls, self._added = {}, {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        self._urls = {resource_id: entry for resource_id, entry in data.get("urls", {}).items()
+                      if entry.get("expires_at", 0) > now}
+        self._added = {user_key: set(ids) for user_key, ids in data.get("added", {}).items()}
+
+    def _save_locked(self, force: bool = False) -> None:
+        """
+        保存解析结果。一次解析成千上万个资源时每次都重写整个文件开销很大，因此按config.CHECKPOINT_INTERVAL的间隔保存，
+        force为True时立即保存；间隔内的修改由flush写入。
+        """
+        self._dirty = True
+        if not force and time.monotonic() - self._last_save < config.CHECKPOINT_INTERVAL:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        data = {
+            "urls": self._urls,
+            "added": {user_key: sorted(ids) for user_key, ids in self._added.items()}
+        }
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(data, file)
+        os.replace(temp_path, self.path)
+        self._dirty = False
+        self._last_save = time.monotonic()
+
+    def flush(self) -> None:
+        """写入尚未保存的解析结果"""
+        with self._lock:
+            if self._dirty:
+                self._save_locked(force=True)
+
+    def lock_for(self, resource_id: str) -> threading.Lock:
+        """同一资源同时只允许一个线程解析，其他线程等待后直接读取缓存结果。"""
+        with self._lock:
+            return self._resource_locks.setdefault(resource_id, threading.Lock())
+
+    def get_url(self, resource_id: str, count: bool = True):
+        """读取缓存的下载链接，count为False时不计入命中统计。"""
+        with self._lock:
+            self._load_locked()
+            entry = self._urls.get(resource_id)
+            if entry is not None and entry["expires_at"] > time.time():
+                if count:
+                    self.hits += 1
+                    metrics.inc("smartedu_cache_events_total", cache="resolution", result="hits")
+                return entry["url"]
+            if count:
+                self.misses += 1
+                metrics.inc("smartedu_cache_events_total", cache="resolution", result="misses")
+            return None
+
+    def set_url(self, resource_id: str, url: str) -> None:
+        with self._lock:
+            self._load_locked()
+            self._urls[resource_id] = {"url": url, "expires_at": time.time() + config.RESOLUTION_TTL}
+            self._save_locked()
+
+    def is_added(self, user_key: str, resource_id: str) -> bool:
+        with self._lock:
+            self._load_locked()
+            return resource_id in self._added.get(user_key, ())
+
+    def mark_added(self, user_key: str, resource_id: str) -> None:
+        with self._lock:
+            self._load_locked()
+            self._added.setdefault(user_key, set()).add(resource_id)
+            self._save_locked()
+
+    def unmark_added(self, user_key: str, resource_id: str) -> None:
+        with self._lock:
+            self._load_locked()
+            self._added.get(user_key, set()).discard(resource_id)
+            self._save_locked()
+
+    def print_stats(self) -> None:
+        if not self.hits + self.misses:
+            return
+        print(f"课件链接缓存：命中 {self.hits} 次，未命中 {self.misses} 次")
+
+
+resolution_cache = ResolutionCache()
@@ -0,0 +1,36 @@
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# 当前链接的取消标记，由服务模式在处理链接前设置，工作线程通过profiling.bind继承
+_current = contextvars.ContextVar("smartedu_cancel", default=None)
+
+
+class Cancelled(BaseException):
+    """
+    下载已被取消。
+
+    与KeyboardInterrupt一样不是Exception的子类，不会被下载过程中的错误处理当作普通失败，
+    而是沿用中断时的处理：已领取的条目放回任务队列，.part文件和断点记录保留，下次提交时继续。
+    """
+
+
+@contextmanager
+def scope(event: threading.Event):
+    """with块内（包括通过profiling.bind提交的任务）在event被设置后，于下一个数据块或片段处停止下载"""
+    token = _current.set(event)
+    try:
+        yield event
+    finally:
+        _current.reset(token)
+
+
+def requested() -> bool:
+    event = _current.get()
+    return event is not None and event.is_set()
+
+
+def check() -> None:
+    """当前链接已被取消时抛出Cancelled"""
+    if requested():
+        raise Cancelled("下载已取消")
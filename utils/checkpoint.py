@@ -0,0 +1,111 @@
+import os
+import json
+import time
+import hashlib
+from utils import config
+
+
+def playlist_fingerprint(segments: list) -> str:
+    """
+    根据每个片段的URL、密钥URL和IV计算播放列表指纹，播放列表变化时指纹随之变化。
+    """
+    digest = hashlib.sha1()
+    for segment in segments:
+        iv = segment.get("iv")
+        line = f"{segment['url']}|{segment.get('key_url') or ''}|{iv.hex() if iv else ''}\n"
+        digest.update(line.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class SegmentCheckpoint:
+    """
+    视频下载断点记录，以M3U8地址和.part文件路径为键保存在缓存目录下，
+    同一视频保存为不同文件名或目录时各自记录，互不影响。
+
+    记录已写入输出文件的片段编号和字节数，以及解析得到的各个密钥（每个片段的IV已包含在播放列表指纹中）。
+    由于片段按顺序写入，已完成的片段总是从0开始的连续前缀，恢复时只需把.part文件截断到
+    记录的字节数并从下一个片段继续下载。
+    """
+
+    def __init__(self, m3u8_url: str, fingerprint: str, part_path: str, keys: dict = None):
+        self.m3u8_url = m3u8_url
+        self.fingerprint = fingerprint
+        self.part_path = part_path
+        self.keys = dict(keys or {})  # {密钥URL: 密钥}
+        self.segments = []  # [[片段编号, 字节数], ...]
+        self._last_save = 0.0
+
+    @staticmethod
+    def checkpoint_path(m3u8_url: str, part_path: str) -> str:
+        key = f"{m3u8_url}\n{os.path.abspath(part_path)}"
+        name = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(config.CACHE_DIR, "checkpoints", f"{name}.json")
+
+    @classmethod
+    def load(cls, m3u8_url: str, fingerprint: str, part_path: str):
+        """
+        读取m3u8_url保存到part_path的断点记录。若播放列表指纹不一致，或.part文件已丢失、长度不足，
+        则删除旧记录并返回None。
+        """
+        path = cls.checkpoint_path(m3u8_url, part_path)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+            checkpoint = cls(
+                data["m3u8_url"], data["fingerprint"], data["part_path"],
+                {key_url: bytes.fromhex(key) for key_url, key in data.get("keys", {}).items()}
+            )
+            checkpoint.segments = data.get("segments", [])
+        except (OSError, ValueError, KeyError) as e:
+            print(f"断点记录 {path} 无法读取，将重新下载: {e}")
+            os.remove(path)
+            return None
+
+        if (checkpoint.m3u8_url != m3u8_url or checkpoint.fingerprint != fingerprint
+                or os.path.abspath(checkpoint.part_path) != os.path.abspath(part_path) or not os.path.exists(part_path)
+                or os.path.getsize(part_path) < checkpoint.bytes_done):
+            print("播放列表或未完成文件已变化，断点记录失效，将重新下载。")
+            checkpoint.remove()
+            return None
+        return checkpoint
+
+    @property
+    def completed(self) -> int:
+        """已完成的片段数量，也就是下一个待下载片段的编号。"""
+        return len(self.segments)
+
+    @property
+    def bytes_done(self) -> int:
+        return sum(size for _, size in self.segments)
+
+    def record(self, index: int, size: int) -> None:
+        """
+        记录一个已写入的片段，按config.CHECKPOINT_INTERVAL秒的间隔落盘。
+        """
+        self.segments.append([index, size])
+        if time.monotonic() - self._last_save >= config.CHECKPOINT_INTERVAL:
+            self.save()
+
+    def save(self) -> None:
+        path = self.checkpoint_path(self.m3u8_url, self.part_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = {
+            "m3u8_url": self.m3u8_url,
+            "fingerprint": self.fingerprint,
+            "part_path": self.part_path,
+            "keys": {key_url: key.hex() for key_url, key in self.keys.items()},
+            "segments": self.segments
+        }
+        # 先写临时文件再替换，避免进程中断时留下半个记录
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(data, file)
+        os.replace(temp_path, path)
+        self._last_save = time.monotonic()
+
+    def remove(self) -> None:
+        path = self.checkpoint_path(self.m3u8_url, self.part_path)
+        if os.path.exists(path):
+            os.remove(path)
@@ -1,6 +1,16 @@
 import os
+import queue
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from utils import aio, config, metrics, profiling, progress, transport, cancellation
+from utils.cache import metadata_cache, resolution_cache
+from utils.bandwidth import bandwidth_limiter
+from utils.store import content_store
+from utils.sync import sync_state
+from utils.jobstore import job_store
 from utils.tool import get_url_param, sanitize_filename, replace_domain
-from utils.download import download_file_from_url, download_video
+from utils.download import download_file_from_url, download_video, segment_scheduler
 from utils.getInfo import *
 
 
@@ -23,63 +33,360 @@ def get_text_file_input(user_data: str, app_id: str):
     file_name = "smartedu_download.txt"
     if os.path.exists(file_name):
         with open(file_name, "r", encoding="utf-8") as file:
-            # 遍历文件的每一行
-            for line in file:
-                # 去除每行末尾的换行符（如果有的话）
-                line = line.rstrip('\n')
-                if line:  # 这里检查line是否非空
-                    print("-------------------------------------------------------------")
-                    download_content(line, user_data, app_id)
+            # 去除每行末尾的换行符，并跳过空行
+            web_urls = [line.rstrip('\n') for line in file if line.rstrip('\n')]
+        if web_urls:
+            run_batch(web_urls, user_data, app_id)
 
 
-def download_content(web_url: str, user_data: str, app_id: str):
+def run_batch(web_urls: list, user_data: str, app_id: str, workers: int = None) -> list:
+    """
+    同时处理多个链接，单个链接失败不影响其他链接，全部结束后打印每个链接的结果。
+
+    参数:
+        web_urls (list): 要下载的网页地址列表。
+        workers (int, optional): 同时处理的链接数，默认使用config.BATCH_WORKERS。
+
+    返回:
+        list[tuple]: 按输入顺序排列的(网页地址, 是否下载成功)列表。
+    """
+    workers = max(1, min(workers or config.BATCH_WORKERS, len(web_urls)))
+
+    def run_one(web_url):
+        print("-------------------------------------------------------------")
+        try:
+            return download_content(web_url, user_data, app_id)
+        except Exception as e:
+            print(f"处理 {web_url} 时发生错误: {e}")
+            return False
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(zip(web_urls, executor.map(run_one, web_urls)))
+
+    succeeded = [url for url, ok in results if ok]
+    failed = [url for url, ok in results if not ok]
+    print("-------------------------------------------------------------")
+    print(f"批量下载完成：共 {len(results)} 个链接，成功 {len(succeeded)} 个，失败 {len(failed)} 个")
+    for url in succeeded:
+        print(f"[成功] {url}")
+    for url in failed:
+        print(f"[失败] {url}")
+    return results
+
+
+def download_content(web_url: str, user_data: str, app_id: str, engine: str = None,
+                     cancel: threading.Event = None) -> bool:
+    """
+    解析网页地址对应的资源并下载。
+
+    参数:
+        engine (str, optional): 下载引擎，"sync"为多线程同步下载，"async"为基于asyncio的下载引擎，
+                                默认使用config.ENGINE。
+        cancel (threading.Event, optional): 设置后停止解析，正在下载的文件和视频在下一个数据块或片段处停止，
+                                            并抛出cancellation.Cancelled；未完成的部分下次处理该链接时继续。
+
+    返回:
+        bool: 所有资源均下载成功时返回True，否则返回False。
+
+    解析与下载同时进行，第一个资源的下载链接解析出来后马上开始下载，见run_pipeline。
+    启用config.SYNC时，本地已是最新的资源直接跳过，见utils.sync.SyncState。
+    启用config.JOB_STORE时，解析结果和每个条目的下载状态保存在任务队列中，该链接上次解析完成但未下载完时不再解析，
+    直接继续下载未完成的条目，见utils.jobstore.JobStore。
+    启用config.PROFILE时，结束后打印该链接各阶段（解析、JSON请求、文档中心签名、片段下载、解密、写入、合并等）的耗时。
+    """
+    if cancel is not None:
+        with cancellation.scope(cancel):
+            return download_content(web_url, user_data, app_id, engine)
+    if not is_supported_url(web_url):
+        # exit、空输入和暂不支持的链接不需要打开任务队列，直接处理（退出或提示暂未支持）
+        resolve_content(web_url, user_data, app_id)
+        return False
+    profile = profiling.begin(web_url)
+    try:
+        job_id = job_store.find_unfinished(web_url) if config.JOB_STORE else None
+        if job_id is not None:
+            status = job_store.job_status(job_id)
+            print(f"继续上次未完成的任务：已完成 {status['done']} 个，待下载 {status['pending'] + status['running']} 个")
+            with profiling.stage("download"):
+                return download_job(job_id, engine)
+
+        with profiling.stage("resolve"):
+            data = resolve_content(web_url, user_data, app_id)
+        if data is None:
+            return False
+        items = prepare_download_items(data)
+        if config.SYNC:
+            # 增量同步：只下载新增或有变化的资源
+            items = sync_state.pending(items)
+        if not config.JOB_STORE:
+            resolved, success = run_pipeline(items, engine)
+            return resolved and success
+
+        # 解析出的条目逐个写入任务队列并由本进程领取，中断时未下载的条目放回队列
+        job_id = job_store.create_job(web_url)
+        claimed = set()
+
+        def on_resolved(item):
+            item = job_store.add_item(job_id, item)
+            claimed.add(item["id"])
+            return item
+
+        def on_done(item, ok):
+            job_store.complete(item["id"], ok)
+            claimed.discard(item["id"])
+
+        try:
+            resolved, _ = run_pipeline(items, engine, on_resolved, on_done)
+        finally:
+            if claimed:
+                job_store.release(claimed)
+        job_store.finish_resolve(job_id, resolved)
+        if not resolved:
+            return False
+        # 下载失败的条目在尝试次数用完前再次下载
+        with profiling.stage("download"):
+            return download_job(job_id, engine)
+    finally:
+        sync_state.flush()
+        resolution_cache.flush()
+        profiling.end(profile)
+
+
+def run_pipeline(items, engine: str = None, on_resolved=None, on_done=None) -> tuple:
+    """
+    边解析边下载：解析线程从items（可以是边解析边产出的生成器）中逐个取出条目，放入有界队列（config.PIPELINE_QUEUE），
+    config.DOWNLOAD_WORKERS个下载线程（asyncio引擎为下载协程）同时从队列中取出条目下载。
+    队列满时解析暂停，内存中待下载的条目数量不随资源列表的长度增长。
+
+    同步引擎中视频另用一个队列，由config.VIDEO_WORKERS个线程交给全局片段调度器，这些线程只等待调度结果，
+    多个短视频可以同时排队，调度器从所有视频中取片段（见utils.scheduler.SegmentScheduler）。
+
+    参数:
+        on_resolved (callable, optional): 条目放入队列前调用，参数为条目，返回实际放入队列的条目。
+        on_done (callable, optional): 每个条目结束后调用，参数为条目和是否成功。
+
+    返回:
+        tuple: (解析是否完成, 已解析的条目是否均下载成功)。
+    """
+    workers = max(1, config.DOWNLOAD_WORKERS)
+    video_workers = max(1, config.VIDEO_WORKERS)
+    use_async = (engine or config.ENGINE) == "async"
+    if use_async and aio.aiohttp is None:
+        print("未安装aiohttp，使用同步下载引擎。")
+        use_async = False
+    stop = threading.Event()
+    resolved = []
+
+    def produce(put, finish):
+        """put(item)放入一个条目，finish()在解析结束后放入结束标记"""
+        ok = False
+        try:
+            iterator = iter(items)
+            while not stop.is_set() and not cancellation.requested():
+                with profiling.stage("resolve"):
+                    item = next(iterator, None)
+                if item is None:
+                    ok = True
+                    break
+                if on_resolved is not None:
+                    item = on_resolved(item)
+                progress.queued(item)
+                put(item)
+        except requests.exceptions.HTTPError as http_err:
+            print(f"HTTP错误: {http_err}")
+        except requests.exceptions.RequestException as req_err:
+            print(f"请求过程中发生错误: {req_err}")
+        except ValueError:
+            print("解析错误：响应内容不是有效的JSON格式。")
+        except Exception as e:
+            print(f"未知错误: {e}")
+        finally:
+            if not ok and not stop.is_set() and not cancellation.requested():
+                print("获取数据出错！")
+            resolved.append(ok)
+            finish()
+
+    def start_producer(put, finish) -> threading.Thread:
+        producer = threading.Thread(target=profiling.bind(produce), args=(put, finish), daemon=True)
+        producer.start()
+        return producer
+
+    def consume(source):
+        success = True
+        while True:
+            item = source.get()
+            if item is None:
+                return success
+            if stop.is_set():
+                # 已中断，只取出剩余条目让解析线程结束
+                continue
+            cancellation.check()
+            ok = download_item(item)
+            progress.finished(item, ok)
+            if on_done is not None:
+                on_done(item, ok)
+            success = success and ok
+
+    producers = []
+    with profiling.stage("download"):
+        if use_async:
+            async def download_async():
+                # 条目直接交给事件循环中的有界队列，下载协程等待队列时不占用线程
+                feed = aio.LoopQueue(asyncio.get_running_loop(), max(1, config.PIPELINE_QUEUE))
+                producers.append(start_producer(feed.put, lambda: [feed.put(None) for _ in range(workers)]))
+                try:
+                    return await aio.download_queue_async(feed, workers, on_done)
+                finally:
+                    # 下载协程出错退出时，解析线程不再等待放入条目
+                    stop.set()
+                    feed.close()
+
+            success = asyncio.run(download_async())
+        else:
+            items_queue = queue.Queue(maxsize=max(1, config.PIPELINE_QUEUE))
+            video_queue = queue.Queue(maxsize=max(1, config.PIPELINE_QUEUE))
+
+            def finish():
+                for _ in range(workers):
+                    items_queue.put(None)
+                for _ in range(video_workers):
+                    video_queue.put(None)
+
+            producers.append(start_producer(
+                lambda item: (video_queue if item["is_video"] else items_queue).put(item), finish))
+            with ThreadPoolExecutor(max_workers=workers + video_workers) as executor:
+                try:
+                    futures = [executor.submit(profiling.bind(consume), items_queue) for _ in range(workers)]
+                    futures += [executor.submit(profiling.bind(consume), video_queue) for _ in range(video_workers)]
+                    success = all([future.result() for future in futures])
+                finally:
+                    stop.set()
+    for producer in producers:
+        producer.join()
+    # 取消时解析线程提前结束，条目留在任务队列中，不当作解析出错
+    cancellation.check()
+    return resolved[0], success
+
+
+def run_download(items: list, engine: str = None, on_done=None) -> bool:
+    """
+    使用指定的下载引擎下载条目，未安装aiohttp时使用同步引擎。
+
+    参数:
+        on_done (callable, optional): 每个条目结束后调用，参数为条目和是否成功。
+    """
+    if (engine or config.ENGINE) == "async":
+        if aio.aiohttp is None:
+            print("未安装aiohttp，使用同步下载引擎。")
+        else:
+            return asyncio.run(aio.download_items_async(items, on_done))
+    return download_items(items, on_done)
+
+
+def download_job(job_id: int, engine: str = None) -> bool:
+    """
+    从任务队列中领取该任务的条目并下载，结果写回队列。失败的条目在尝试次数用完前会再次领取。
+
+    同步引擎每次领取一个条目，多个线程或进程可以同时处理同一个任务；asyncio引擎一次领取全部可领取的条目。
+    下载被中断（如按下Ctrl+C）时，已领取但未完成的条目放回队列，下次运行继续下载。
+
+    返回:
+        bool: 所有条目均已下载成功时返回True；有最终失败、仍由其他进程下载或未处理的条目时返回False。
+    """
+    use_async = (engine or config.ENGINE) == "async" and aio.aiohttp is not None
+    claimed = set()
+
+    def on_done(item, ok):
+        job_store.complete(item["id"], ok)
+        claimed.discard(item["id"])
+        progress.finished(item, ok)
+
+    try:
+        while True:
+            cancellation.check()
+            items = job_store.claim_many(job_id, None if use_async else 1)
+            if not items:
+                break
+            claimed.update(item["id"] for item in items)
+            for item in items:
+                progress.queued(item)
+            run_download(items, engine, on_done)
+    finally:
+        if claimed:
+            job_store.release(claimed)
+
+    status = job_store.job_status(job_id)
+    if status["running"]:
+        print(f"有 {status['running']} 个条目正由其他进程下载，尚未完成")
+    if status["failed"]:
+        print(f"有 {status['failed']} 个条目在尝试 {config.JOB_MAX_ATTEMPTS} 次后仍下载失败")
+    return not (status["failed"] or status["pending"] or status["running"])
+
+
+# 支持的网页地址：(地址前缀, 资源ID参数名, 解析函数)，按顺序匹配第一个前缀
+RESOURCE_PAGES = [
+    ("https://basic.smartedu.cn/tchMaterial/detail?contentType=assets_document", "contentId", get_textbook_info),
+    ("https://basic.smartedu.cn/syncClassroom/classActivity", "activityId", iter_bookcoursebag_info),
+    ("https://basic.smartedu.cn/syncClassroom/prepare/detail?resourceId", "resourceId", get_courseware_info),
+    ("https://basic.smartedu.cn/syncClassroom/experimentLesson", "courseId", iter_experiment_course_info),
+    ("https://basic.smartedu.cn/syncClassroom/prepare/detail?lessonId", "lessonId", iter_one_teacher_info),
+    ("https://jpk.basic.smartedu.cn/yearQualityCourse?courseId", "courseId", iter_basis_info),
+    ("https://basic.smartedu.cn/qualityCourse?courseId", "courseId", iter_subject_info),
+    ("https://basic.smartedu.cn/syncClassroom/basicWork/detail?contentType=assets_document&contentId", "contentId", get_homework_info),
+    ("https://basic.smartedu.cn/sedu/detail?contentType=assets_video&contentId", "contentId", get_homework_info),
+    ("https://basic.smartedu.cn/wisdom/detail?contentType=assets_video&contentId", "contentId", get_wisdom_info),
+    ("https://basic.smartedu.cn/schoolService/detail?contentType=thematic_course&contentId", "contentId", iter_thematic_infos),
+]
+
+
+def find_resource_page(web_url: str):
+    """返回网页地址（已替换域名）匹配的(地址前缀, 资源ID参数名, 解析函数)，不支持时返回None"""
+    for page in RESOURCE_PAGES:
+        if web_url.startswith(page[0]):
+            return page
+    return None
+
+
+def is_supported_url(web_url: str) -> bool:
+    """链接是否可以解析下载，exit、空输入和暂不支持的链接返回False"""
+    return find_resource_page(replace_domain(web_url)) is not None
+
+
+def resolve_content(web_url: str, user_data: str, app_id: str):
+    """
+    根据网页地址解析出所有资源信息。
+
+    课程、课包、专题等包含多个资源的链接返回生成器，资源信息在迭代时逐个解析产出，解析出错时在迭代中抛出异常。
+
+    返回:
+        list[list[dict] 或 生成器]: 资源信息列表，链接不支持或获取数据出错时返回None。
+    """
     # 域名替换
     web_url = replace_domain(web_url)
-    data = []
-    # url判断
-    if web_url.startswith("https://basic.smartedu.cn/tchMaterial/detail?contentType=assets_document"):
-        contentId = get_url_param(web_url, "contentId")
-        data = [get_textbook_info(contentId, user_data, app_id)]
-    elif web_url.startswith("https://basic.smartedu.cn/syncClassroom/classActivity"):
-        activityId = get_url_param(web_url, "activityId")
-        data = [get_bookcoursebag_info(activityId, user_data, app_id)]
-    elif web_url.startswith("https://basic.smartedu.cn/syncClassroom/prepare/detail?resourceId"):
-        resourceId = get_url_param(web_url, "resourceId")
-        data = [get_courseware_info(resourceId, user_data, app_id)]
-    elif web_url.startswith("https://basic.smartedu.cn/syncClassroom/experimentLesson"):
-        courseId = get_url_param(web_url, "courseId")
-        data = [get_experiment_course_info(courseId, user_data, app_id)]
-    elif web_url.startswith("https://basic.smartedu.cn/syncClassroom/prepare/detail?lessonId"):
-        lessonId = get_url_param(web_url, "lessonId")
-        data = [get_one_teacher_info(lessonId, user_data, app_id)]
-    elif web_url.startswith("https://jpk.basic.smartedu.cn/yearQualityCourse?courseId"):
-        courseId = get_url_param(web_url, "courseId")
-        data = [get_basis_info(courseId, user_data, app_id)]
-    elif web_url.startswith("https://basic.smartedu.cn/qualityCourse?courseId"):
-        courseId = get_url_param(web_url, "courseId")
-        data = [get_subject_info(courseId, user_data, app_id)]
-    elif web_url.startswith("https://basic.smartedu.cn/syncClassroom/basicWork/detail?contentType=assets_document&contentId"):
-        contentId = get_url_param(web_url, "contentId")
-        data = [get_homework_info(contentId, user_data, app_id)]
-    elif web_url.startswith("https://basic.smartedu.cn/sedu/detail?contentType=assets_video&contentId"):
-        contentId = get_url_param(web_url, "contentId")
-        data = [get_homework_info(contentId, user_data, app_id)]
-    elif web_url.startswith("https://basic.smartedu.cn/wisdom/detail?contentType=assets_video&contentId"):
-        contentId = get_url_param(web_url, "contentId")
-        data = [get_wisdom_info(contentId, user_data, app_id)]
-    elif web_url.startswith("https://basic.smartedu.cn/schoolService/detail?contentType=thematic_course&contentId"):
-        contentId = get_url_param(web_url, "contentId")
-        data = get_thematic_infos(contentId, user_data, app_id)
-    elif web_url == "exit":
+    if web_url == "exit":
+        print_run_stats()
+        metrics.flush()
         print("退出程序")
         os._exit(0)
-    else:
+    # url判断
+    page = find_resource_page(web_url)
+    if page is None:
         print(f"您输入的链接暂未支持!\n请前往 https://github.com/52beijixing/smartedu-download/issues 反馈！")
-    
-    if data is None:
+        return None
+    _, param, resolve = page
+    data = [resolve(get_url_param(web_url, param), user_data, app_id)]
+
+    if data is None or None in data:
         print("获取数据出错！")
-        return
-    
+        return None
+    return data
+
+
+def prepare_download_items(data: list):
+    """
+    将解析出的资源信息整理成待下载条目，包含保存目录、清理后的文件名以及是否为视频。
+    逐个产出，资源信息可以是边解析边产出的生成器。
+    """
     current_path  = os.getcwd()
     for per_data in data:
         for item in per_data:
@@ -93,21 +400,78 @@ def download_content(web_url: str, user_data: str, app_id: str):
             file_name = sanitize_filename(file_name)
             file_url = item.get("file_url")
             file_format = item.get("file_format")
-            #file_size = item.get("file_size")
+            file_size = item.get("file_size")
             path = os.path.join(current_path, dir_name)
+            yield {
+                "path": path,
+                "file_name": file_name,
+                "file_url": file_url,
+                "file_format": file_format,
+                "file_size": file_size,
+                "update_time": item.get("update_time"),
+                "is_video": file_format == "mp4" or file_format == "m3u8" or file_format == "avi" or file_format == "flv"
+            }
 
-            if file_format == "mp4" or file_format == "m3u8" or file_format == "avi" or file_format == "flv":
-                try:
-                    download_video(file_url, path, file_name)
-                except Exception as e:
-                    print(f"下载视频时发生错误: {e}")
-            else:
-                print(f"正在下载 {file_name}.{file_format} ...")
-                try:
-                    full_path = download_file_from_url(file_url, path, file_name)
-                    print(f"下载完成，文件保存在 {full_path}")
-                except Exception as e:
-                    print(f"下载课件时发生错误: {e}")
+
+def download_items(items: list, on_done=None) -> bool:
+    """
+    使用同步引擎逐个下载条目。
+
+    参数:
+        on_done (callable, optional): 每个条目结束后调用，参数为条目和是否成功。
+
+    返回:
+        bool: 所有条目均下载成功时返回True，否则返回False。
+    """
+    success = True
+    for item in items:
+        cancellation.check()
+        ok = download_item(item)
+        if on_done is not None:
+            on_done(item, ok)
+        success = success and ok
+    return success
+
+
+def download_item(item: dict) -> bool:
+    """使用同步引擎下载单个条目，失败时打印错误并返回False。"""
+    path = item["path"]
+    file_name = item["file_name"]
+    file_url = item["file_url"]
+    file_format = item["file_format"]
+    file_size = item["file_size"]
+
+    if item["is_video"]:
+        try:
+            download_video(file_url, path, file_name)
+        except Exception as e:
+            print(f"下载视频时发生错误: {e}")
+            return False
+        sync_state.record(item)
+        return True
+
+    print(f"正在下载 {file_name}.{file_format} ...")
+    try:
+        full_path = download_file_from_url(file_url, path, file_name, file_size)
+    except Exception as e:
+        print(f"下载课件时发生错误: {e}")
+        return False
+    if full_path is None:
+        return False
+    sync_state.record(item)
+    print(f"下载完成，文件保存在 {full_path}")
+    return True
+
+
+def print_run_stats():
+    """打印连接复用、各类缓存、本地存储、增量同步、片段调度以及实际带宽的统计信息"""
+    transport.print_connection_stats()
+    metadata_cache.print_stats()
+    resolution_cache.print_stats()
+    content_store.print_stats()
+    sync_state.print_stats()
+    segment_scheduler.print_stats()
+    bandwidth_limiter.print_stats()
 
 
 def get_user_info(app_id):
@@ -124,7 +488,7 @@ def get_app_id():
     url = 'https://auth.smartedu.cn/uias/login'
     try:
         # 发起GET请求并检查响应状态
-        response = requests.get(url)
+        response = transport.get(url)
         response.raise_for_status()
         html_content = response.text
          # 正则表达式模式，用于匹配 sdpAppId 的值
@@ -0,0 +1,101 @@
+import time
+import threading
+
+
+class AdaptiveLimiter:
+    """
+    按AIMD（加性增、乘性减）方式自动调整同时在途的片段请求数。
+
+    每完成与当前并发数相同数量的请求为一个观察窗口，窗口结束时根据本窗口的情况调整：
+    - 出现429或请求失败：并发数减半；
+    - 平均耗时超过历史最低值的latency_factor倍：并发数降为原来的3/4；
+    - 上次增加并发后吞吐量没有提升：回退一级；
+    - 其他情况：并发数加一。
+    并发数始终保持在[floor, ceiling]之间，每次调整都会打印出来。
+    """
+
+    def __init__(self, floor: int, ceiling: int, initial: int = None, latency_factor: float = 2.0):
+        """
+        参数:
+            floor (int): 最低并发数。
+            ceiling (int): 最高并发数。
+            initial (int, optional): 初始并发数，默认为floor。
+            latency_factor (float): 平均耗时超过历史最低值的多少倍时视为拥塞。
+        """
+        self.floor = max(1, floor)
+        self.ceiling = max(self.floor, ceiling)
+        self.limit = min(max(initial or self.floor, self.floor), self.ceiling)
+        self.latency_factor = latency_factor
+        self.in_flight = 0
+        self.adjustments = 0
+        self._condition = threading.Condition()
+        self._base_latency = None
+        self._last_throughput = None
+        self._last_increased = False
+        self._reset_window()
+
+    def _reset_window(self) -> None:
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self._window_bytes = 0
+        self._window_latency = 0.0
+        self._window_errors = 0
+        self._window_throttled = 0
+
+    def acquire(self) -> None:
+        """等待直到在途请求数低于当前并发数。"""
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, elapsed: float, size: int, outcome: str) -> None:
+        """
+        记录一次请求的结果并释放名额。
+
+        参数:
+            elapsed (float): 请求耗时（秒）。
+            size (int): 收到的字节数。
+            outcome (str): "ok"表示成功，"throttled"表示服务器返回429，"error"表示其他失败。
+        """
+        with self._condition:
+            self.in_flight -= 1
+            self._window_count += 1
+            self._window_bytes += size
+            self._window_latency += elapsed
+            if outcome == "throttled":
+                self._window_throttled += 1
+            elif outcome != "ok":
+                self._window_errors += 1
+            if self._window_count >= self.limit:
+                self._adjust_locked()
+            self._condition.notify_all()
+
+    def _adjust_locked(self) -> None:
+        elapsed = max(time.monotonic() - self._window_start, 1e-6)
+        throughput = self._window_bytes / elapsed
+        latency = self._window_latency / self._window_count
+        old = self.limit
+
+        if self._window_throttled or self._window_errors:
+            new = max(self.floor, old // 2)
+            reason = f"{self._window_throttled} 次限流，{self._window_errors} 次失败"
+        elif self._base_latency is not None and latency > self._base_latency * self.latency_factor:
+            new = max(self.floor, old * 3 // 4)
+            reason = f"平均耗时 {latency:.2f}s，高于最低值 {self._base_latency:.2f}s"
+        elif self._last_increased and throughput < self._last_throughput * 1.05:
+            new = max(self.floor, old - 1)
+            reason = "增加并发后吞吐量未提升"
+        else:
+            new = min(self.ceiling, old + 1)
+            reason = f"吞吐量 {throughput / 1024 / 1024:.2f} MB/s"
+
+        if self._window_errors == 0 and self._window_throttled == 0:
+            self._base_latency = latency if self._base_latency is None else min(self._base_latency, latency)
+        self._last_throughput = throughput
+        self._last_increased = new > old
+        self.limit = new
+        if new != old:
+            self.adjustments += 1
+            print(f"片段并发数调整为 {new}（原为 {old}，{reason}）")
+        self._reset_window()
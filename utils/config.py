@@ -0,0 +1,144 @@
+import os
+
+
+def _env_int(name: str, default: int) -> int:
+    """
+    从环境变量中读取整数配置，未设置或格式错误时返回默认值。
+    """
+    value = os.environ.get(name)
+    try:
+        return int(value) if value else default
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    """
+    从环境变量中读取浮点数配置，未设置或格式错误时返回默认值。
+    """
+    value = os.environ.get(name)
+    try:
+        return float(value) if value else default
+    except ValueError:
+        return default
+
+
+# 文件分段下载：并行连接数，以及启用分段下载的最小文件大小（字节）
+RANGE_CONNECTIONS = _env_int("SMARTEDU_RANGE_CONNECTIONS", 4)
+RANGE_MIN_SIZE = _env_int("SMARTEDU_RANGE_MIN_SIZE", 16 * 1024 * 1024)
+
+# 流式下载时每次读取的块大小（字节）
+CHUNK_SIZE = _env_int("SMARTEDU_CHUNK_SIZE", 64 * 1024)
+
+# 全局限速（字节/秒，可带K/M/G单位，0为不限速）、令牌桶容量（默认为1秒的流量），
+# 以及分时段限速规则，如"08:00-18:00=1M;18:00-08:00=0"
+BANDWIDTH_LIMIT = os.environ.get("SMARTEDU_BANDWIDTH_LIMIT") or "0"
+BANDWIDTH_BURST = os.environ.get("SMARTEDU_BANDWIDTH_BURST") or ""
+BANDWIDTH_SCHEDULE = os.environ.get("SMARTEDU_BANDWIDTH_SCHEDULE") or ""
+
+# 缓存目录，存放元数据缓存、断点记录等运行期数据
+CACHE_DIR = os.environ.get("SMARTEDU_CACHE_DIR") or ".smartedu_cache"
+
+# 元数据（资源详情JSON）缓存：是否启用、有效期（秒）、缓存目录总大小上限（字节）
+METADATA_CACHE = _env_int("SMARTEDU_METADATA_CACHE", 1)
+METADATA_TTL = _env_float("SMARTEDU_METADATA_TTL", 3600)
+METADATA_CACHE_MAX_BYTES = _env_int("SMARTEDU_METADATA_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+
+# 每次add_to_center/batch请求最多提交的资源数
+ADD_TO_CENTER_BATCH = _env_int("SMARTEDU_ADD_TO_CENTER_BATCH", 20)
+
+# 课件下载链接解析结果的有效期（秒）
+RESOLUTION_TTL = _env_float("SMARTEDU_RESOLUTION_TTL", 24 * 3600)
+
+# 视频解密密钥缓存：有效期（秒），以及是否同时保存到缓存目录
+KEY_CACHE_TTL = _env_float("SMARTEDU_KEY_CACHE_TTL", 24 * 3600)
+KEY_CACHE_DISK = _env_int("SMARTEDU_KEY_CACHE_DISK", 0)
+
+# 内容寻址存储：是否启用（同一来源、同样大小的文件只下载一次，再次下载时从存储中链接），
+# 存储目录（为空时使用缓存目录下的store），链接方式："reflink"（写时复制）、"hardlink"（硬链接，
+# 修改任一副本会影响所有副本，恢复前校验SHA-256）或"copy"（普通复制，每个文件在存储中再占一份磁盘空间），
+# reflink和hardlink都不支持时（如Windows或ext4上的reflink）不加入存储；以及存储占用的磁盘上限（字节），
+# 超出时按最近使用时间淘汰
+DEDUP = _env_int("SMARTEDU_DEDUP", 0)
+DEDUP_DIR = os.environ.get("SMARTEDU_DEDUP_DIR") or ""
+DEDUP_LINK = os.environ.get("SMARTEDU_DEDUP_LINK") or "reflink"
+DEDUP_MAX_BYTES = _env_int("SMARTEDU_DEDUP_MAX_BYTES", 10 * 1024 * 1024 * 1024)
+
+# 增量同步：开启后只下载新增或有变化的资源，本地已是最新的文件直接跳过
+SYNC = _env_int("SMARTEDU_SYNC", 0)
+
+# 任务队列：是否把解析结果和每个条目的下载状态保存到SQLite数据库（为空时使用缓存目录下的jobs.db），
+# 中断后再次处理同一链接时从中断处继续；领取条目的租约时长（秒，进程退出后超过该时长条目可被重新领取），
+# 以及每个条目的最多尝试次数
+JOB_STORE = _env_int("SMARTEDU_JOB_STORE", 1)
+JOB_DB = os.environ.get("SMARTEDU_JOB_DB") or ""
+JOB_LEASE = _env_float("SMARTEDU_JOB_LEASE", 120)
+JOB_MAX_ATTEMPTS = _env_int("SMARTEDU_JOB_MAX_ATTEMPTS", 3)
+
+# 边解析边下载：解析出的条目放入有界队列（条目数），由多个下载线程同时取出下载，
+# 队列满时解析暂停，内存占用不随课程中的资源数量增长
+PIPELINE_QUEUE = _env_int("SMARTEDU_PIPELINE_QUEUE", 8)
+DOWNLOAD_WORKERS = _env_int("SMARTEDU_DOWNLOAD_WORKERS", 3)
+
+# 同时交给片段调度器的视频数，这些视频的片段共用同一组下载线程（线程数取片段并发数上限）
+VIDEO_WORKERS = _env_int("SMARTEDU_VIDEO_WORKERS", 8)
+
+# 视频下载断点记录的最短保存间隔（秒）
+CHECKPOINT_INTERVAL = _env_float("SMARTEDU_CHECKPOINT_INTERVAL", 1)
+
+# 下载引擎："sync"为多线程同步下载，"async"为基于asyncio的下载引擎（需要安装aiohttp）
+ENGINE = os.environ.get("SMARTEDU_ENGINE") or "sync"
+
+# asyncio下载引擎同时在途的请求数
+ASYNC_CONCURRENCY = _env_int("SMARTEDU_ASYNC_CONCURRENCY", 64)
+
+# 视频TS片段同时下载的数量：初始值，以及自动调整时的下限和上限
+SEGMENT_WORKERS = _env_int("SMARTEDU_SEGMENT_WORKERS", 4)
+SEGMENT_WORKERS_MIN = _env_int("SMARTEDU_SEGMENT_WORKERS_MIN", 2)
+SEGMENT_WORKERS_MAX = _env_int("SMARTEDU_SEGMENT_WORKERS_MAX", 32)
+
+# 是否根据吞吐量、耗时和失败/429比例自动调整片段并发数，设为0时固定使用SEGMENT_WORKERS
+ADAPTIVE_CONCURRENCY = _env_int("SMARTEDU_ADAPTIVE_CONCURRENCY", 1)
+
+# 每个视频的片段重排缓冲区大小（片段数），实际取值不小于片段并发数上限
+SEGMENT_BUFFER = _env_int("SMARTEDU_SEGMENT_BUFFER", 32)
+
+# 同时调度的所有视频共用的重排缓冲区大小（片段数），暂存在内存中的片段总数不超过该值，
+# 不随VIDEO_WORKERS增长；实际取值不小于片段并发数上限，每个视频的缓冲区也不超过该值
+SEGMENT_BUFFER_TOTAL = _env_int("SMARTEDU_SEGMENT_BUFFER_TOTAL", 64)
+
+# 视频片段解密线程数，解密与下载分开进行，下载线程不会因解密而空等
+DECRYPT_WORKERS = _env_int("SMARTEDU_DECRYPT_WORKERS", 2)
+
+# 解析课件下载链接时的并发数，设为1时逐个解析
+RESOLVE_WORKERS = _env_int("SMARTEDU_RESOLVE_WORKERS", 8)
+
+# 批量下载（smartedu_download.txt）时同时处理的链接数
+BATCH_WORKERS = _env_int("SMARTEDU_BATCH_WORKERS", 4)
+
+# 全局同时在途的HTTP请求上限
+MAX_IN_FLIGHT = _env_int("SMARTEDU_MAX_IN_FLIGHT", 32)
+
+# 连接池：缓存的主机数量，以及每个主机保持的长连接数量（默认与线程数一致）
+POOL_HOSTS = _env_int("SMARTEDU_POOL_HOSTS", 16)
+POOL_MAXSIZE = _env_int("SMARTEDU_POOL_MAXSIZE", max(SEGMENT_WORKERS_MAX, RESOLVE_WORKERS, 10))
+
+# 运行指标：HTTP接口端口（0为不启动），以及定期写入的JSON文件路径（为空时不写入）和写入间隔（秒）
+METRICS_PORT = _env_int("SMARTEDU_METRICS_PORT", 0)
+METRICS_FILE = os.environ.get("SMARTEDU_METRICS_FILE") or ""
+METRICS_INTERVAL = _env_float("SMARTEDU_METRICS_INTERVAL", 10)
+
+# 性能分析：是否统计每个链接各阶段的耗时，是否同时用cProfile采样，
+# 以及分析结果的保存目录（为空时只打印）
+PROFILE = _env_int("SMARTEDU_PROFILE", 0)
+PROFILE_CPROFILE = _env_int("SMARTEDU_PROFILE_CPROFILE", 0)
+PROFILE_DIR = os.environ.get("SMARTEDU_PROFILE_DIR") or ""
+
+# 超时时间（秒）：连接超时与读取超时
+CONNECT_TIMEOUT = _env_float("SMARTEDU_CONNECT_TIMEOUT", 10)
+READ_TIMEOUT = _env_float("SMARTEDU_READ_TIMEOUT", 30)
+
+# 服务模式：本地任务接口监听的地址和端口，以及保留的已结束任务数量
+SERVICE_HOST = os.environ.get("SMARTEDU_SERVICE_HOST") or "127.0.0.1"
+SERVICE_PORT = _env_int("SMARTEDU_SERVICE_PORT", 8765)
+SERVICE_MAX_JOBS = _env_int("SMARTEDU_SERVICE_MAX_JOBS", 1000)
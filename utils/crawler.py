@@ -0,0 +1,241 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from utils import config, transport, metrics
+
+# 可抓取的目录：
+# - data_version: 目录的版本文件，其中的urls列出所有分页（part_*.json），每页是条目列表；
+# - list: 单个列表文件（如专题课程的list.json），需要通过{course_id}指定课程；
+# - page_url: 条目ID对应的网页地址模板，交给现有的解析流程处理。
+CATALOGS = {
+    "tchMaterial": {
+        "name": "教材",
+        "data_version": "https://s-file-1.ykt.cbern.com.cn/zxx/ndrs/resources/tch_material/version/data_version.json",
+        "page_url": "https://basic.smartedu.cn/tchMaterial/detail?contentType=assets_document&contentId={id}"
+    },
+    "thematic": {
+        "name": "专题课程资源",
+        "list": "https://s-file-1.ykt.cbern.com.cn/zxx/ndrs/special_edu/thematic_course/{course_id}/resources/list.json",
+        "page_url": "https://basic.smartedu.cn/sedu/detail?contentType=assets_video&contentId={id}"
+    }
+}
+
+
+def entry_tags(entry: dict) -> set:
+    """条目的标签名称（学段、学科、年级、版本等）"""
+    return {tag.get("tag_name") for tag in entry.get("tag_list") or [] if tag.get("tag_name")}
+
+
+def matches_scope(entry: dict, tags: list = None, keyword: str = None) -> bool:
+    """条目包含全部指定标签，且标题包含关键字（未指定的条件不限制）"""
+    if tags and not set(tags) <= entry_tags(entry):
+        return False
+    if keyword and keyword not in (entry.get("title") or ""):
+        return False
+    return True
+
+
+class CrawlState:
+    """
+    抓取进度，保存在缓存目录下的crawl/<范围摘要>.json中，中断后再次运行从中断处继续。
+
+    - pages: 目录的分页地址，及每一页是否已经抓取，已抓取的页不会再次请求；
+    - items: 发现的条目（按发现顺序），记录网页地址和处理状态（pending、done、failed）。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.pages = None  # {分页地址: 是否已抓取}
+        self.items = {}  # {条目ID: {"title", "url", "status"}}
+        self._lock = threading.Lock()
+        self._last_save = 0.0
+
+    @classmethod
+    def load(cls, path: str) -> "CrawlState":
+        state = cls(path)
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+            state.pages = data.get("pages")
+            state.items = data.get("items", {})
+        except (OSError, ValueError):
+            pass
+        return state
+
+    def save(self, force: bool = True) -> None:
+        """保存进度，force为False时按config.CHECKPOINT_INTERVAL的间隔保存"""
+        with self._lock:
+            if not force and time.monotonic() - self._last_save < config.CHECKPOINT_INTERVAL:
+                return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as file:
+                json.dump({"pages": self.pages, "items": self.items}, file, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+            self._last_save = time.monotonic()
+
+    def add_page(self, page_url: str, items: dict) -> int:
+        """记录一个分页已抓取，并加入其中新发现的条目，返回新条目数"""
+        with self._lock:
+            new_items = {item_id: item for item_id, item in items.items() if item_id not in self.items}
+            self.items.update(new_items)
+            self.pages[page_url] = True
+            return len(new_items)
+
+    def set_status(self, item_id: str, status: str) -> None:
+        with self._lock:
+            self.items[item_id]["status"] = status
+
+    def pending_items(self, retry_failed: bool = False) -> list:
+        statuses = ("pending", "failed") if retry_failed else ("pending",)
+        with self._lock:
+            return [(item_id, item) for item_id, item in self.items.items() if item["status"] in statuses]
+
+    def counts(self) -> dict:
+        with self._lock:
+            statuses = [item["status"] for item in self.items.values()]
+        return {status: statuses.count(status) for status in ("pending", "done", "failed")}
+
+
+class CatalogCrawler:
+    """
+    按范围（目录类型、标签、标题关键字）遍历平台的目录分页，把发现的条目交给现有的解析和下载流程。
+    """
+
+    def __init__(self, catalog: str, tags: list = None, keyword: str = None, state_path: str = None,
+                 course_id: str = None):
+        """
+        参数:
+            catalog (str): CATALOGS中的目录名称，如"tchMaterial"或"thematic"。
+            tags (list, optional): 条目必须包含的标签名称，如["高中", "数学"]。
+            keyword (str, optional): 条目标题必须包含的关键字。
+            state_path (str, optional): 进度文件路径，默认按目录和范围生成。
+            course_id (str, optional): 列表类目录（如thematic）的课程ID。
+        """
+        if catalog not in CATALOGS:
+            raise ValueError(f"未知的目录: {catalog}，可选: {', '.join(CATALOGS)}")
+        self.catalog = CATALOGS[catalog]
+        if "list" in self.catalog and not course_id:
+            raise ValueError(f"抓取{self.catalog['name']}需要指定课程ID")
+        self.course_id = course_id
+        self.tags = sorted(tags or [])
+        self.keyword = keyword
+        scope = json.dumps([catalog, self.tags, keyword] + ([course_id] if course_id else []), ensure_ascii=False)
+        digest = hashlib.sha1(scope.encode("utf-8")).hexdigest()[:12]
+        self.state = CrawlState.load(state_path or os.path.join(config.CACHE_DIR, "crawl", f"{catalog}-{digest}.json"))
+
+    def discover(self) -> int:
+        """
+        抓取目录中尚未抓取的分页，把范围内的条目加入进度文件。
+
+        每次运行都重新读取目录的分页列表：版本文件中的分页列表变化时（目录发布了新版本），清除已抓取的标记重新抓取各页；
+        列表类目录只有列表文件本身一页，每次运行都重新抓取。已发现条目的处理状态保留。
+
+        返回:
+            int: 仍未抓取成功的分页数量。
+        """
+        try:
+            urls = self.page_urls()
+        except (requests.exceptions.RequestException, ValueError):
+            if self.state.pages is None:
+                raise
+            print("获取目录的分页列表失败，使用上次记录的分页")
+        else:
+            if self.state.pages is None or set(urls) != set(self.state.pages) or "list" in self.catalog:
+                if self.state.pages is not None and "list" not in self.catalog:
+                    print("目录已更新，重新抓取各分页")
+                self.state.pages = {url: False for url in urls}
+                self.state.save()
+            print(f"目录共 {len(urls)} 个分页")
+
+        remaining = 0
+        for page_url, fetched in list(self.state.pages.items()):
+            if fetched:
+                continue
+            try:
+                response = transport.get(page_url)
+                response.raise_for_status()
+                entries = response.json()
+            except requests.exceptions.RequestException as req_err:
+                print(f"抓取分页 {page_url} 时发生错误: {req_err}")
+                remaining += 1
+                continue
+            except ValueError:
+                print(f"解析错误：分页 {page_url} 的内容不是有效的JSON格式。")
+                remaining += 1
+                continue
+
+            items = {entry["id"]: {"title": entry.get("title"),
+                                   "url": self.catalog["page_url"].format(id=entry["id"]),
+                                   "status": "pending"}
+                     for entry in entries if entry.get("id") and matches_scope(entry, self.tags, self.keyword)}
+            found = self.state.add_page(page_url, items)
+            self.state.save()
+            metrics.inc("smartedu_crawl_pages_total")
+            print(f"已抓取分页 {page_url}，新发现 {found} 个条目")
+        return remaining
+
+    def page_urls(self) -> list:
+        """目录当前的分页地址：版本文件中的urls，列表类目录只有列表文件一页"""
+        if "list" in self.catalog:
+            return [self.catalog["list"].format(course_id=self.course_id)]
+        response = transport.get(self.catalog["data_version"])
+        response.raise_for_status()
+        urls = response.json().get("urls") or []
+        if isinstance(urls, str):
+            urls = [url for url in urls.split(",") if url]
+        return urls
+
+    def run(self, handler, workers: int = None, retry_failed: bool = False) -> dict:
+        """
+        抓取目录并依次处理范围内尚未完成的条目。
+
+        参数:
+            handler (callable): 处理单个条目的函数，参数为网页地址，返回是否成功，如下载时传入download_content的包装。
+            workers (int, optional): 同时处理的条目数，默认使用config.BATCH_WORKERS。
+            retry_failed (bool): 是否重新处理上次失败的条目。
+
+        返回:
+            dict: 各状态的条目数量。
+        """
+        try:
+            remaining = self.discover()
+        except requests.exceptions.RequestException as req_err:
+            print(f"获取目录时发生错误: {req_err}")
+            remaining = None
+        except ValueError:
+            print("解析错误：目录内容不是有效的JSON格式。")
+            remaining = None
+
+        pending = self.state.pending_items(retry_failed)
+        print(f"范围内共 {len(self.state.items)} 个条目，待处理 {len(pending)} 个")
+
+        def process(entry):
+            item_id, item = entry
+            try:
+                ok = handler(item["url"])
+            except Exception as e:
+                print(f"处理 {item['url']} 时发生错误: {e}")
+                ok = False
+            self.state.set_status(item_id, "done" if ok else "failed")
+            metrics.inc("smartedu_crawl_items_total", result="done" if ok else "failed")
+            self.state.save(force=False)
+
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, workers or config.BATCH_WORKERS)) as executor:
+                list(executor.map(process, pending))
+        finally:
+            self.state.save()
+
+        counts = self.state.counts()
+        print("-------------------------------------------------------------")
+        print(f"抓取结束：完成 {counts['done']} 个，失败 {counts['failed']} 个，未处理 {counts['pending']} 个")
+        if remaining:
+            print(f"有 {remaining} 个分页抓取失败，重新运行会继续抓取")
+        elif remaining is None:
+            print("目录获取失败，重新运行会继续抓取")
+        return counts
@@ -73,6 +73,38 @@ def aes_cbc_decrypt(key: bytes, ciphertext: bytes, iv: bytes) -> bytes:
     return decrypted_text
 
 
+def aes_cbc_decrypt_into(key: bytes, buffer: memoryview, iv: bytes) -> memoryview:
+    """
+    使用AES-CBC模式在原缓冲区中解密，不产生额外的数据副本。
+
+    参数:
+        key (bytes): 解密密钥，长度应为16、24或32字节。
+        buffer (memoryview): 存放密文的可写缓冲区，解密后的明文直接覆盖密文。
+        iv (bytes): 初始向量，长度应等于AES块大小。
+
+    返回:
+        memoryview: 指向缓冲区中明文部分（已去除PKCS7填充）的视图。
+
+    抛出:
+        ValueError: 如果密钥或IV长度不正确，密文长度不是块大小的整数倍，或填充不正确。
+    """
+    if not isinstance(key, bytes) or len(key) not in [16, 24, 32]:
+        raise ValueError("密钥必须是16、24或32字节长的字节串")
+    if not isinstance(iv, bytes) or len(iv) != AES.block_size:
+        raise ValueError(f"IV长度必须为{AES.block_size}字节")
+    if not len(buffer) or len(buffer) % AES.block_size:
+        raise ValueError("密文长度必须是块大小的整数倍")
+
+    cipher = AES.new(key, AES.MODE_CBC, iv)
+    cipher.decrypt(buffer, output=buffer)
+
+    # 去除PKCS7填充，只返回明文部分的视图
+    padding_len = buffer[-1]
+    if not 1 <= padding_len <= AES.block_size or bytes(buffer[-padding_len:]) != bytes([padding_len]) * padding_len:
+        raise ValueError("填充不正确")
+    return buffer[:len(buffer) - padding_len]
+
+
 def md5_encrypt(text: str) -> str:
     """
     使用MD5算法对输入的字符串进行哈希加密，并返回加密后结果的前16位字符串。
@@ -3,20 +3,35 @@ import requests
 import re
 import binascii
 import time
-from urllib.parse import urljoin
-from utils.tool import ensure_directory_exists, delete_directory_contents_and_dir, check_directory_m3u8downloader
-from utils.crypt import aes_ecb_decrypt, aes_cbc_decrypt, md5_encrypt, bytes_to_base64
-from multiprocessing.dummy import Pool
+from urllib.parse import urljoin, urlsplit
+from utils import config, transport, metrics, profiling, progress, cancellation
+from utils.tool import ensure_directory_exists, check_directory_m3u8downloader
+from utils.crypt import aes_ecb_decrypt, aes_cbc_decrypt_into, md5_encrypt, bytes_to_base64
+from utils.writer import OrderedSegmentWriter, BufferPool
+from utils.checkpoint import SegmentCheckpoint, playlist_fingerprint
+from utils.partfile import PartFileState
+from utils.keystore import KeyStore
+from utils.concurrency import AdaptiveLimiter
+from utils.scheduler import SegmentScheduler
+from utils.bandwidth import bandwidth_limiter
+from utils.store import content_store
+from concurrent.futures import ThreadPoolExecutor
 
 
-def download_file_from_url(url: str, save_path: str, filename: str = None) -> str:
+def download_file_from_url(url: str, save_path: str, filename: str = None, file_size = None) -> str:
     """
     从指定URL下载文件并保存到指定路径。
+
+    文件较大且服务器支持Range请求时，分成多段并行下载到预先分配好大小的文件中，
+    否则使用单个连接流式下载。下载过程中数据写入 <文件名>.part，进度记录在 <文件名>.part.json，
+    中断后再次下载会从中断处继续，全部完成后才重命名为最终文件名。
+    启用config.DEDUP时，同一地址、同样大小的文件下载过一次后，再次下载直接从本地存储中链接。
     
     参数:
     - url (str): 要下载的文件的URL。
     - save_path (str): 本地保存文件的目录路径。
     - filename (str, optional): 保存时使用的文件名。默认为None，此时将从URL中提取文件名。
+    - file_size (int, optional): 资源信息中记录的文件大小（custom_properties中的size），用于判断是否分段下载。
     
     返回:
     - str: 成功时返回文件的完整保存路径；失败返回None。
@@ -24,27 +39,46 @@ def download_file_from_url(url: str, save_path: str, filename: str = None) -> st
 
     ensure_directory_exists(save_path)
 
+    # 使用os.path.join确保路径正确拼接（跨平台）
+    full_path = os.path.join(save_path, build_file_name(url, filename))
+
+    # 同一文件已经下载过时直接从本地存储中链接，同时下载同一地址的其他线程等待结果
+    with content_store.lock_for(url):
+        if content_store.restore(url, full_path, file_size):
+            metrics.inc("smartedu_downloads_total", kind="document", result="ok")
+            return full_path
+        if fetch_file(url, full_path, file_size) is None:
+            return None
+        content_store.add(url, full_path)
+        return full_path
+
+
+def fetch_file(url: str, full_path: str, file_size = None) -> str:
+    """
+    从网络下载文件到full_path，步骤见download_file_from_url。
+
+    返回:
+    - str: 成功时返回full_path；失败返回None。
+    """
     try:
-        # 如果文件名未提供，从URL中提取
-        if filename is None:
-            filename = url.split('/')[-1]
-        else:
-            format = url.split('/')[-1].split('.')[-1]
-            filename = filename + '.' + format
-                
-        # 发起GET请求，设置流式传输
-        response = requests.get(url, stream=True)
-        response.raise_for_status()  # 确保请求成功
-        
-        # 使用os.path.join确保路径正确拼接（跨平台）
-        full_path = os.path.join(save_path, filename)
-        
-        # 写入文件
-        with open(full_path, 'wb') as file:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:  # 过滤空块
-                    file.write(chunk)
-        
+        # 下载过程中写入.part文件，读取上次未完成的下载记录
+        state = PartFileState.load(full_path + '.part', url)
+
+        with profiling.stage("document_download") as stage:
+            # 判断是否可以分段下载
+            total_size, headers = probe_range_size(url, file_size)
+            if headers is not None and not state.matches(headers):
+                print("服务器上的文件已更新，重新下载。")
+                state.reset(headers)
+            if total_size:
+                download_file_ranges(url, state, total_size, headers)
+            else:
+                download_file_stream(url, state)
+            stage.bytes = os.path.getsize(state.part_path)
+
+        # 下载完成后再重命名为最终文件名
+        state.finish(full_path)
+        metrics.inc("smartedu_downloads_total", kind="document", result="ok")
         return full_path
     
     except requests.exceptions.HTTPError as http_err:
@@ -58,9 +92,168 @@ def download_file_from_url(url: str, save_path: str, filename: str = None) -> st
     except IOError as io_err:
         print(f"文件写入错误: {io_err}")
     
+    metrics.inc("smartedu_downloads_total", kind="document", result="failed")
     return None
 
 
+def build_file_name(url: str, filename: str = None) -> str:
+    """
+    生成保存时使用的文件名：未提供文件名时从URL中提取，否则在文件名后加上URL中的扩展名。
+    """
+    if filename is None:
+        return url.split('/')[-1]
+    format = url.split('/')[-1].split('.')[-1]
+    return filename + '.' + format
+
+
+def probe_range_size(url: str, file_size = None):
+    """
+    探测是否应对文件分段下载。
+
+    已知文件大小且小于config.RANGE_MIN_SIZE时直接返回，不发起探测请求；
+    否则请求第一个字节，服务器返回206时从Content-Range中读取文件总大小。
+
+    返回:
+        tuple: (可以分段下载时为文件总大小，否则为None, 探测请求的响应头，未探测时为None)
+    """
+    if not needs_range_probe(file_size):
+        return None, None
+
+    with transport.get(url, headers={'Range': 'bytes=0-0'}, stream=True) as response:
+        response.raise_for_status()
+        return range_total_size(response.status_code, response.headers), response.headers
+
+
+def needs_range_probe(file_size = None) -> bool:
+    """是否需要探测分段下载：未开启分段或已知文件小于config.RANGE_MIN_SIZE时不需要"""
+    if config.RANGE_CONNECTIONS <= 1:
+        return False
+    try:
+        file_size = int(file_size)
+    except (TypeError, ValueError):
+        return True
+    return file_size >= config.RANGE_MIN_SIZE
+
+
+def range_total_size(status_code: int, headers):
+    """从探测请求（Range: bytes=0-0）的响应中读取文件总大小，不支持或文件太小时返回None"""
+    content_range = headers.get('Content-Range', '')
+    if status_code != 206 or '/' not in content_range:
+        return None
+    total = content_range.rsplit('/', 1)[-1]
+    if not total.isdigit() or int(total) < config.RANGE_MIN_SIZE:
+        return None
+    return int(total)
+
+
+def split_ranges(state: PartFileState, total_size: int, headers) -> bool:
+    """
+    按config.RANGE_CONNECTIONS为分段下载准备.part文件和分段记录。
+
+    返回:
+        bool: 沿用上次未完成的分段记录时返回True。
+    """
+    if (state.ranges and state.size == total_size
+            and os.path.getsize(state.part_path) == total_size):
+        return True
+    connections = config.RANGE_CONNECTIONS
+    part_size = -(-total_size // connections)
+    ranges = [[start, min(start + part_size, total_size) - 1, 0] for start in range(0, total_size, part_size)]
+    state.reset(headers, total_size, ranges)
+
+    # 预先分配文件大小
+    with open(state.part_path, 'wb') as file:
+        file.truncate(total_size)
+    return False
+
+
+def download_file_stream(url: str, state: PartFileState) -> None:
+    """
+    使用单个连接流式下载文件到state.part_path。
+
+    若存在上次未完成的数据，则带上Range和If-Range请求剩余部分；服务器返回200（不支持续传或文件已变化）时从头下载。
+    """
+    offset = state.bytes_written if state.ranges is None else 0
+    if offset and state.size is not None and offset >= state.size:
+        # 上次已下载完整，只是还未重命名
+        return
+
+    headers = {}
+    if offset:
+        headers['Range'] = f'bytes={offset}-'
+        if state.if_range():
+            headers['If-Range'] = state.if_range()
+
+    # 发起GET请求，设置流式传输
+    with transport.get(url, headers=headers, stream=True) as response:
+        response.raise_for_status()  # 确保请求成功
+
+        if offset and response.status_code == 206:
+            print(f"从 {offset} 字节处继续下载")
+        else:
+            offset = 0
+            content_length = response.headers.get('Content-Length')
+            state.reset(response.headers, int(content_length) if content_length and content_length.isdigit() else None)
+
+        # 无缓冲写入，保证记录的字节数都已写入文件
+        with open(state.part_path, 'r+b' if offset else 'wb', buffering=0) as file:
+            file.seek(offset)
+            file.truncate()
+            try:
+                for chunk in response.iter_content(chunk_size=config.CHUNK_SIZE):
+                    if chunk:  # 过滤空块
+                        file.write(chunk)
+                        state.add_bytes(len(chunk))
+                        consume_bytes(len(chunk), "document")
+            finally:
+                state.save()
+
+
+def download_file_ranges(url: str, state: PartFileState, total_size: int, headers) -> None:
+    """
+    将文件按字节范围平均分成config.RANGE_CONNECTIONS段，多个连接并行下载，
+    每段直接写入预先分配好大小的.part文件中的对应位置。已有未完成的分段记录时只下载每段剩余的部分。
+    """
+    if split_ranges(state, total_size, headers):
+        print("从上次中断处继续分段下载")
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(state.ranges)) as executor:
+            futures = [executor.submit(profiling.bind(download_file_range), url, state, index)
+                       for index in range(len(state.ranges))]
+            for future in futures:
+                future.result()
+    finally:
+        state.save()
+
+
+def download_file_range(url: str, state: PartFileState, index: int) -> None:
+    """下载第index段尚未完成的字节范围，并写入.part文件的对应位置"""
+    start, end, written = state.ranges[index]
+    if start + written > end:
+        return
+
+    headers = {'Range': f'bytes={start + written}-{end}'}
+    if state.if_range():
+        headers['If-Range'] = state.if_range()
+
+    with transport.get(url, headers=headers, stream=True) as response:
+        response.raise_for_status()
+        if response.status_code != 206:
+            raise requests.exceptions.HTTPError(f"服务器未按Range返回数据，状态码: {response.status_code}", response=response)
+
+        with open(state.part_path, 'r+b', buffering=0) as file:
+            file.seek(start + written)
+            for chunk in response.iter_content(chunk_size=config.CHUNK_SIZE):
+                if chunk:
+                    file.write(chunk)
+                    state.add_bytes(len(chunk), index)
+                    consume_bytes(len(chunk), "document")
+
+    if state.ranges[index][2] != end - start + 1:
+        raise IOError(f"分段 {start}-{end} 下载不完整，仅收到 {state.ranges[index][2]} 字节")
+
+
 def downloader_m3u8(m3u8_url: str, save_path: str, file_name: str, key: bytes = b'') -> None:
     if not key:
         cmd = f'N_m3u8DL-CLI_v3.0.2.exe "{m3u8_url}" --workDir "{save_path}" --saveName "{file_name}" --enableDelAfterDone'
@@ -75,112 +268,192 @@ def download_video(m3u8_url: str, save_path: str, file_name: str) -> None:
     下载M3U8格式的视频并将其保存为指定文件。
     
     步骤：
-    1. 解析M3U8链接获取TS片段、密钥URL、密钥ID及初始化向量。
-    2. 使用密钥URL和ID获取解密密钥。
-    3. 在保存路径下创建以密钥ID命名的文件夹以存储下载的TS片段。
-    4. 下载加密的M3U8内容，包括TS片段，并应用解密。
-    5. 将所有下载的TS片段合并成单个视频文件。
+    1. 解析M3U8链接获取TS片段，以及每个片段对应的密钥URL、密钥ID及初始化向量。
+    2. 通过密钥缓存获取解密密钥，每个不同的密钥只获取一次。
+    3. 下载加密的M3U8内容，包括TS片段，并应用解密。
+    4. 解密后的TS片段按播放列表顺序直接写入视频文件，不再生成临时目录。
     
     参数:
     - m3u8_url (str): M3U8播放列表的URL。
     - save_path (str): 视频文件保存的目录路径。
     - file_name (str): 保存视频文件的名称（包含扩展名）。
     """
+    # 同一视频已经下载过时直接从本地存储中链接
+    with content_store.lock_for(m3u8_url):
+        if content_store.restore(m3u8_url, os.path.join(save_path, f"{file_name}.mp4")):
+            metrics.inc("smartedu_downloads_total", kind="video", result="ok")
+            return
+        fetch_video(m3u8_url, save_path, file_name)
+
+
+def fetch_video(m3u8_url: str, save_path: str, file_name: str) -> None:
+    """从网络下载视频，步骤见download_video"""
     # 解析M3U8链接获取所需数据
     m3u8_info = parse_m3u8(m3u8_url)
-    ts_segments = m3u8_info.get('ts_segments')
+    segments = m3u8_info.get('segments')
     key_url = m3u8_info.get('key_url')
 
-    # 如果没有密钥URL，没有加密，则直接下载并解
+    # 如果没有密钥URL，没有加密，则直接下载
     if key_url is None and check_directory_m3u8downloader():
         downloader_m3u8(m3u8_url, save_path, file_name)
         return
-    elif key_url is None and not check_directory_m3u8downloader():
-        # 准备TS片段存储的文件夹路径
-        ts_segment_folder = os.path.join(save_path, file_name+"temp")
-        # 下载TS片段
-        download_encrypted_m3u8(m3u8_url, ts_segments, save_path, file_name+"temp")
-        # 合并所有TS片段为最终视频文件
-        merge_ts_files(ts_segment_folder, save_path, file_name)
-        return
 
-    key_id = m3u8_info.get('key_id')
-    initialization_vector = m3u8_info.get('iv')
-    
+    # 读取断点记录，若之前下载中断过则复用记录中的密钥
+    checkpoint = open_video_checkpoint(m3u8_url, segments, save_path, file_name)
+
     # 获取解密密钥
-    decryption_key = get_signs(key_url, key_id)
+    keys = resolve_segment_keys(segments, checkpoint)
     
-    if check_directory_m3u8downloader():
-        downloader_m3u8(m3u8_url, save_path, file_name, decryption_key)
+    if key_url is not None and check_directory_m3u8downloader():
+        downloader_m3u8(m3u8_url, save_path, file_name, keys[key_url])
         print(f"下载完成，文件保存在 {os.path.join(save_path, file_name)}.mp4")
         return
     
-    # 准备TS片段存储的文件夹路径
-    ts_segment_folder = os.path.join(save_path, key_id)
-    
-    # 下载并解密TS片段
-    download_encrypted_m3u8(m3u8_url, ts_segments, save_path, key_id, decryption_key, initialization_vector)
-    
-    # 合并所有TS片段为最终视频文件
-    merge_ts_files(ts_segment_folder, save_path, file_name)
+    # 下载并解密TS片段，按顺序直接写入视频文件
+    download_encrypted_m3u8(m3u8_url, segments, save_path, file_name, keys, checkpoint)
+
+
+def open_video_checkpoint(m3u8_url, segments, save_path, file_name):
+    """读取视频的断点记录，没有可用记录（播放列表变化或未完成文件丢失）时创建新的空记录"""
+    part_file_name = os.path.join(save_path, f"{file_name}.mp4.part")
+    fingerprint = playlist_fingerprint(segments)
+    checkpoint = SegmentCheckpoint.load(m3u8_url, fingerprint, part_file_name)
+    if checkpoint is None:
+        checkpoint = SegmentCheckpoint(m3u8_url, fingerprint, part_file_name)
+    return checkpoint
+
+
+def prepare_video_part(checkpoint: SegmentCheckpoint, total: int):
+    """
+    根据断点记录准备.part文件。
+
+    返回:
+        tuple: (第一个待下载片段的编号, 打开.part文件的模式)
+    """
+    if not checkpoint.completed:
+        return 0, 'wb'
+    # 丢弃断点记录之后写入的不完整数据，从下一个片段继续
+    os.truncate(checkpoint.part_path, checkpoint.bytes_done)
+    print(f"从断点继续下载：已完成 {checkpoint.completed}/{total} 个片段")
+    return checkpoint.completed, 'ab'
+
+
+def resolve_segment_keys(segments: list, checkpoint: SegmentCheckpoint = None) -> dict:
+    """
+    获取播放列表中用到的所有解密密钥，优先使用断点记录中保存的密钥，其次使用密钥缓存。
 
+    返回:
+        dict: 以密钥URL为键、解密密钥为值的字典。
+    """
+    keys = {}
+    for segment in segments:
+        key_url = segment['key_url']
+        if key_url is None or key_url in keys:
+            continue
+        key = checkpoint.keys.get(key_url) if checkpoint is not None else None
+        if key is None:
+            with profiling.stage("get_key"):
+                key = key_store.get(key_url, segment['key_id'])
+        if key is None:
+            raise ValueError(f"无法获取解密密钥: {key_url}")
+        keys[key_url] = key
+
+    if checkpoint is not None:
+        checkpoint.keys.update(keys)
+    return keys
 
 
 def parse_m3u8(m3u8_url: str) -> dict:
     """
     解析M3U8链接以提取加密密钥URL、密钥及TS片段列表。
+
+    播放列表中可能有多个EXT-X-KEY（中途更换密钥），每个片段都使用在它之前最近的一个密钥；
+    EXT-X-KEY没有给出IV时，按HLS规范使用片段的媒体序列号作为IV。
     
     参数:
         m3u8_url (str): M3U8文件的网址。
     
     返回:
-        dict: 包含密钥URL、密钥及TS片段列表的字典。
-              格式: {'key_url': str, 'key': str, 'ts_segments': List[str]}
+        dict: 包含片段列表，以及第一个密钥的URL、ID和IV的字典。
+              格式: {'key_url': str, 'key_id': str, 'iv': bytes, 'ts_segments': List[str],
+                     'segments': List[{'url': str, 'key_url': str, 'key_id': str, 'iv': bytes}]}
     """
     # 获取M3U8内容
-    response = requests.get(m3u8_url)
-    m3u8_content = response.text
-    
+    with profiling.stage("fetch_playlist"):
+        response = transport.get(m3u8_url)
+    return parse_m3u8_content(m3u8_url, response.text)
+
+
+def parse_m3u8_content(m3u8_url: str, m3u8_content: str) -> dict:
+    """解析M3U8文本内容，返回格式与parse_m3u8相同"""
+    with profiling.stage("parse_m3u8"):
+        return _parse_m3u8_lines(m3u8_url, m3u8_content)
+
+
+def _parse_m3u8_lines(m3u8_url: str, m3u8_content: str) -> dict:
     # 初始化列表和变量
-    ts_segments = []  # TS片段列表
-    key_url = None  # 密钥URL
-    key_id = None  # 密钥ID
-    iv_bytes = None
+    segments = []  # TS片段列表
+    key_url = None  # 当前密钥URL
+    key_id = None  # 当前密钥ID
+    iv_bytes = None  # 当前密钥的IV
+    first_key = None
+    media_sequence = 0
     
     # 遍历M3U8内容的每一行
     for line in m3u8_content.splitlines():
+        line = line.strip()
+        if not line:
+            continue
         if line.startswith('#'):
+            if line.startswith('#EXT-X-MEDIA-SEQUENCE:'):
+                media_sequence = int(line.split(':', 1)[1])
             # 如果行包含密钥信息，则提取之
-            if 'EXT-X-KEY' in line:
+            elif 'EXT-X-KEY' in line:
+                if 'METHOD=NONE' in line:
+                    key_url, key_id, iv_bytes = None, None, None
+                    continue
+
                 key_url_match = re.search(r'URI="([^"]+)"', line)
                 key_match = re.search(r'_keys/([^"]+)"', line)
-                iv_match = re.search(r'IV=(.*?)(?=\n|$)', line) 
+                iv_match = re.search(r'IV=(0[xX][0-9a-fA-F]+)', line)
 
-                # 设置密钥URL和密钥id
-                if key_url_match:
-                    key_url = key_url_match.group(1)
-                if key_match:
-                    key_id = key_match.group(1)
+                # 设置密钥URL、密钥id和IV
+                key_url = urljoin(m3u8_url, key_url_match.group(1)) if key_url_match else None
+                key_id = key_match.group(1) if key_match else None
                 if iv_match:
                     iv = iv_match.group(1)
-                    iv_bytes = binascii.unhexlify(iv.replace('0x', "")).hex()[:16].encode('utf-8')
+                    iv_bytes = binascii.unhexlify(iv[2:]).hex()[:16].encode('utf-8')
+                else:
+                    iv_bytes = None
+                if first_key is None and key_url is not None:
+                    first_key = (key_url, key_id, iv_bytes)
         else:
             # 非注释行视为TS片段URL，加入列表
-            ts_segments.append(urljoin(m3u8_url, line))
+            segment_iv = iv_bytes
+            if key_url is not None and segment_iv is None:
+                segment_iv = (media_sequence + len(segments)).to_bytes(16, 'big')
+            segments.append({
+                'url': urljoin(m3u8_url, line),
+                'key_url': key_url,
+                'key_id': key_id,
+                'iv': segment_iv
+            })
     
     # 返回包含所有提取信息的字典
-    return {'key_url': key_url, 'key_id': key_id, 'ts_segments': ts_segments, 'iv': iv_bytes}
+    first_key_url, first_key_id, first_iv = first_key or (None, None, None)
+    return {'key_url': first_key_url, 'key_id': first_key_id, 'iv': first_iv,
+            'ts_segments': [segment['url'] for segment in segments], 'segments': segments}
 
 
 def get_signs(key_url: str,key_id: str):
     get_sign_url = key_url + "/signs"
     try:
-        response = requests.get(get_sign_url)
+        response = transport.get(get_sign_url)
         response.raise_for_status()
         nonce = response.json()["nonce"]
         sign = md5_encrypt(nonce+key_id)
         get_key_id_url = f"{key_url}?nonce={nonce}&sign={sign}"
-        response = requests.get(get_key_id_url)
+        response = transport.get(get_key_id_url)
         response.raise_for_status()
         key = response.json()["key"]
         return aes_ecb_decrypt(sign.encode('utf-8'), key)
@@ -194,32 +467,122 @@ def get_signs(key_url: str,key_id: str):
         print(f"未知错误: {e}")
 
 
-def download_encrypted_m3u8(m3u8_url, ts_segments, save_path, key_id , key = None, iv = None):
-    """下载加密的M3U8视频流"""
-    output_folder = os.path.join(save_path, key_id)
-    os.makedirs(output_folder, exist_ok=True)
-    
-    ts_list = [(urljoin(m3u8_url.rsplit('/', 1)[0], ts_url),
-          os.path.join(str(output_folder), urljoin(m3u8_url.rsplit('/', 1)[0], ts_url).split('-')[-1]), 
-          key, 
-          iv) for ts_url in ts_segments]
+# 解密密钥缓存，相同密钥URL在一次运行中（启用磁盘缓存时跨运行）只获取一次
+key_store = KeyStore(get_signs)
+
+# 片段缓冲区，下载、解密和写入共用，写入文件后归还复用
+segment_buffers = BufferPool()
 
-    num_processes = os.cpu_count() or 4
-    # 多线程下载
-    with Pool(num_processes) as pool:
-        pool.starmap(download_ts_segment, ts_list)
+# 片段并发控制，同时下载的多个视频共用，避免对同一CDN发起过多连接
+if config.ADAPTIVE_CONCURRENCY:
+    segment_limiter = AdaptiveLimiter(config.SEGMENT_WORKERS_MIN, config.SEGMENT_WORKERS_MAX, config.SEGMENT_WORKERS)
+else:
+    segment_limiter = AdaptiveLimiter(config.SEGMENT_WORKERS, config.SEGMENT_WORKERS)
 
-    print("ts视频流下载完成.")
+# 片段调度，所有视频的片段由同一组常驻线程下载，线程数取并发上限，实际在途请求数由segment_limiter调整；
+# 所有视频暂存的片段总数不超过config.SEGMENT_BUFFER_TOTAL
+segment_scheduler = SegmentScheduler(segment_limiter.ceiling, config.SEGMENT_BUFFER_TOTAL)
 
 
-def download_ts_segment(ts_url: str, ts_temp_folder: str, key:str = '', iv:str = None):
+def download_encrypted_m3u8(m3u8_url, segments, save_path, file_name, keys = None, checkpoint = None):
     """
-    下载并（可选）解密单个TS片段。
-    
+    下载（加密的）M3U8视频流，片段按播放列表顺序直接写入 <save_path>/<file_name>.mp4。
+
+    segments为parse_m3u8返回的片段列表，每个片段使用自己对应的密钥和IV解密，keys为密钥URL到密钥的映射。
+    下载过程中写入同名的.part文件，全部片段完成后再重命名。每写入一个片段都会记录到断点记录中，
+    下载失败或中断时保留.part文件和断点记录，下次运行只下载缺失的片段。
+    """
+    ensure_directory_exists(save_path)
+    outfile_name = os.path.join(save_path, f"{file_name}.mp4")
+    part_file_name = outfile_name + ".part"
+    keys = keys or {}
+
+    if checkpoint is None:
+        checkpoint = SegmentCheckpoint(m3u8_url, playlist_fingerprint(segments), part_file_name)
+    checkpoint.keys.update(keys)
+    start_index, mode = prepare_video_part(checkpoint, len(segments))
+
+    print(f"片段并发数：{segment_limiter.limit}（范围 {segment_limiter.floor}-{segment_limiter.ceiling}）")
+    window = min(max(config.SEGMENT_BUFFER, segment_scheduler.workers), segment_scheduler.budget)
+    writer = OrderedSegmentWriter(part_file_name, window,
+                                  start_index=start_index, mode=mode, on_write=checkpoint.record,
+                                  release=segment_buffers.release)
+    decrypt_executor = segment_scheduler.decrypt_executor()
+
+    def decrypt_and_write(task, index, segment, data):
+        try:
+            try:
+                with metrics.timer("smartedu_segment_decrypt_seconds"), profiling.stage("segment_decrypt", len(data)):
+                    data = aes_cbc_decrypt_into(keys[segment['key_url']], data, segment['iv'])
+            except BaseException:
+                # 片段还没交给写入器，由这里归还缓冲区
+                segment_buffers.release(data)
+                raise
+            writer.write(index, data)
+        except BaseException as e:
+            writer.abort(e)
+            task.fail(e)
+            return
+        task.complete()
+
+    def fetch(task, index):
+        # 调度器只派发已进入重排缓冲区范围的片段，之后的解密和写入都不会阻塞
+        segment = segments[index]
+        buffer = segment_buffers.acquire()
+        owned = True  # 缓冲区交给解密线程或写入器后，由它们负责归还
+        try:
+            buffer = fetch_ts_segment(segment['url'], buffer, segment_limiter)
+            if keys.get(segment['key_url']):
+                # 解密交给单独的线程池，下载线程立即去取下一个片段
+                decrypt_executor.submit(decrypt_task, task, index, segment, buffer)
+                owned = False
+                return
+            owned = False
+            writer.write(index, buffer)
+        except BaseException as e:
+            if owned:
+                segment_buffers.release(buffer)
+            writer.abort(e)
+            raise
+        task.complete()
+
+    # 调度线程和解密线程中的耗时也记入当前链接的性能分析
+    fetch_task, decrypt_task = profiling.bind(fetch), profiling.bind(decrypt_and_write)
+
+    try:
+        # 片段交给全局调度器，与同时下载的其他视频共用下载线程
+        task = segment_scheduler.submit(range(start_index, len(segments)), fetch_task, writer.written, window)
+        try:
+            task.wait()
+        except BaseException:
+            # 任一片段失败或用户中断后不再派发新的片段，等已开始的片段结束
+            writer.abort(RuntimeError("下载已中止"))
+            task.cancel(RuntimeError("下载已中止"))
+            raise
+    except BaseException:
+        writer.close()
+        checkpoint.save()
+        metrics.inc("smartedu_downloads_total", kind="video", result="failed")
+        print(f"视频下载未完成，已保存断点（{checkpoint.completed}/{len(segments)} 个片段），重新运行即可继续。")
+        raise
+
+    with metrics.timer("smartedu_video_merge_seconds"), profiling.stage("merge"):
+        writer.close()
+        os.replace(part_file_name, outfile_name)
+    checkpoint.remove()
+    content_store.add(m3u8_url, outfile_name)
+    metrics.inc("smartedu_downloads_total", kind="video", result="ok")
+    print(f"ts视频流下载完成，视频已保存至: {outfile_name}")
+
+
+def fetch_ts_segment(ts_url: str, buffer: bytearray, limiter: AdaptiveLimiter = None) -> memoryview:
+    """
+    下载单个TS片段，数据直接读入buffer，失败时最多重试3次。
+
     :param ts_url: TS片段的下载URL
-    :param ts_temp_folder: 保存下载文件的本地路径
-    :param key: 解密密钥，如果TS片段加密了的话
-    :param iv: 解密初始化向量，与密钥一起使用
+    :param buffer: 用于存放片段数据的缓冲区，长度不够时会自动扩大
+    :param limiter: 并发控制器，每次请求前占用一个名额，完成后报告耗时和结果
+    :return: 指向缓冲区中片段数据的视图
     """
     print(f"正在下载：{ts_url.split('-')[-1]}")
     
@@ -228,65 +591,75 @@ def download_ts_segment(ts_url: str, ts_temp_folder: str, key:str = '', iv:str =
     
     for attempt in range(1, max_retries + 1):
         try:
-            response = requests.get(ts_url, timeout=10)  # 添加超时限制以避免长时间等待
-            encrypted_data = response.content
-            break  # 成功下载，跳出循环
+            return fetch_ts_segment_once(ts_url, buffer, limiter)
         except requests.RequestException as e:
             print(f"下载失败，尝试第{attempt}/{max_retries}次，原因：{e}")
             if attempt < max_retries:
+                metrics.inc("smartedu_segment_retries_total", host=urlsplit(ts_url).netloc)
                 time.sleep(retry_delay)  # 等待一段时间后重试
             else:
                 raise  # 所有重试均失败，重新抛出异常
-    
-    # 根据是否提供密钥决定是否解密
-    if key:
-        decrypted_data = aes_cbc_decrypt(key, encrypted_data, iv)
-    else:
-        decrypted_data = encrypted_data  # 未提供密钥，直接使用加密数据
-    
-    # 保存数据到本地文件
-    with open(ts_temp_folder, 'wb') as file:
-        file.write(decrypted_data)
 
 
-def merge_ts_files(ts_folder_path: str, save_folder: str, output_file: str):
-    """
-    合并指定目录下的所有 .ts 文件到一个 MP4 文件中。
-    
-    :param ts_folder_path: 包含 .ts 文件的目录路径
-    :param save_folder: 合并后文件保存的目录路径
-    :param output_file: 合并后文件的名称（不含扩展名）
-    """
-    # 构建输出文件的完整路径
-    outfile_name = os.path.join(save_folder, f"{output_file}.mp4")
-    
+def fetch_ts_segment_once(ts_url: str, buffer: bytearray, limiter: AdaptiveLimiter = None) -> memoryview:
+    """发起一次片段请求，重试前会先释放并发名额"""
+    if limiter is not None:
+        limiter.acquire()
+    started = time.monotonic()
+    outcome, size = "error", 0
     try:
-        # 确保保存目录存在，如果不存在则创建
-        if not os.path.exists(save_folder):
-            os.makedirs(save_folder)
-        
-        # 打开输出文件用于写入二进制数据
-        with open(outfile_name, 'wb') as outfile:
-            # 遍历并排序 ts 文件夹中的所有文件
-            for filename in sorted(os.listdir(ts_folder_path)):
-                if filename.endswith('.ts'):
-                    # 构建 ts 文件的完整路径
-                    filepath = os.path.join(ts_folder_path, filename)
-                    
-                    try:
-                        # 打开并读取当前 ts 文件的二进制内容，追加到输出文件中
-                        with open(filepath, 'rb') as infile:
-                            outfile.write(infile.read())
-                    except IOError as e:
-                        # 处理读取文件时可能发生的错误
-                        print(f"读取文件 {filename} 出错: {e}")
-                        return
-                
-    except Exception as e:
-        # 处理其他可能的异常情况
-        print(f"合并过程中出现错误: {e}")
-    else:
-        print(f"所有.ts文件已成功合并至: {outfile_name}")
+        with profiling.stage("segment_fetch") as stage, transport.get(ts_url, stream=True) as response:
+            if response.status_code == 429:
+                outcome = "throttled"
+            response.raise_for_status()
+            data = read_response_into(response, buffer)
+            stage.bytes = len(data)
+        outcome, size = "ok", len(data)
+        metrics.observe("smartedu_segment_fetch_seconds", time.monotonic() - started)
+        return data
     finally:
-        # 清理ts临时目录
-        delete_directory_contents_and_dir(ts_folder_path)
+        if limiter is not None:
+            limiter.release(time.monotonic() - started, size, outcome)
+
+
+def consume_bytes(count: int, kind: str) -> None:
+    """记录读取到的数据量，经过全局限速并计入运行指标和当前链接的进度；当前链接已被取消时抛出cancellation.Cancelled"""
+    cancellation.check()
+    bandwidth_limiter.throttle(count)
+    metrics.inc("smartedu_download_bytes_total", count, kind=kind)
+    progress.add_bytes(count)
+
+
+def read_response_into(response, buffer: bytearray) -> memoryview:
+    """
+    把响应内容读入buffer，返回指向实际数据的视图。
+
+    响应带有Content-Length且未压缩时直接读入缓冲区，否则先读出完整内容再复制进去。
+    """
+    length = response.headers.get('Content-Length')
+    if length is None or response.headers.get('Content-Encoding', 'identity') != 'identity':
+        content = response.content
+        consume_bytes(len(content), "segment")
+        try:
+            buffer[:] = content
+        except BufferError:
+            # 之前失败的读取仍引用着该缓冲区，改用新的缓冲区
+            buffer = bytearray(content)
+        return memoryview(buffer)
+
+    size = int(length)
+    if len(buffer) < size:
+        try:
+            buffer.extend(bytes(size - len(buffer)))
+        except BufferError:
+            buffer = bytearray(size)
+    view = memoryview(buffer)[:size]
+    received = 0
+    while received < size:
+        # 每次最多读取CHUNK_SIZE字节，限速器才能均匀地控制速率
+        count = response.raw.readinto(view[received:received + config.CHUNK_SIZE])
+        if not count:
+            raise requests.exceptions.ChunkedEncodingError(f"连接提前关闭，已接收 {received}/{size} 字节")
+        received += count
+        consume_bytes(count, "segment")
+    return view
@@ -1,11 +1,23 @@
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from utils import config, transport, metrics, profiling
+from utils.cache import metadata_cache, resolution_cache
 from utils.tool import replace_starting_pattern, get_info_parse
 import random
 import time
+import hashlib
 from utils.crypt import auth_encrypt
 import re
 
 
+def fetch_json(json_url: str):
+    """
+    获取资源详情JSON，经过本地元数据缓存，缓存过期后使用条件请求重新验证。
+    """
+    with profiling.stage("fetch_json"):
+        return metadata_cache.get_json(json_url)
+
+
 def get_download_url(ti_items, file_size, file_format):
     """
     根据文件格式和大小从资源项中获取下载URL。
@@ -36,38 +48,159 @@ def get_download_url(ti_items, file_size, file_format):
     return None
 
 
-def fetch_resources(resource_key, relations, dir_name, teacher_name, user_data, app_id):
-    """提取特定资源列表中的文件信息"""
-    resource_list = relations.get(resource_key, [])
-    items = []
-    for item in resource_list:
-        #file_name = item.get("title")
-        global_title = item.get("global_title", {})
-        title_zh_cn = global_title.get("zh-CN", "")
-        show_title = item.get("title", "")
-        file_name = f"{title_zh_cn}_{show_title}"
-        custom_properties = item.get("custom_properties", {})
-        file_format = custom_properties.get("format", "")
-        file_size = custom_properties.get("size", "")
-        ti_items = item.get("ti_items", [])
-        file_url = get_download_url(ti_items, file_size, file_format)
-        if file_url is None:
-            container_id = item.get("container_id")
-            id =item.get("id")
-            access_token = get_info_parse(user_data, "access_token")
-            mac_key = get_info_parse(user_data, "mac_key")
-            save_info(container_id, id, access_token, mac_key, app_id)
+def resolve_in_parallel(func, items: list) -> list:
+    """
+    以有限并发对每个元素调用func，结果顺序与输入顺序一致。
+
+    并发数由config.RESOLVE_WORKERS控制，设为1或只有一个元素时按顺序逐个执行。
+    """
+    return list(iter_in_parallel(func, items))
+
+
+def iter_in_parallel(func, items: list):
+    """resolve_in_parallel的生成器版本，按输入顺序逐个产出结果，前面的结果不必等后面的元素执行完"""
+    workers = min(config.RESOLVE_WORKERS, len(items))
+    if workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(profiling.bind(func), items)
+
+
+def iter_courseware_urls(resource_items: list, user_data: str, app_id: str):
+    """
+    批量解析json中没有直接下载地址的资源，按输入顺序逐个产出下载链接，解析失败的为None。
+
+    1. 已缓存下载链接的资源直接使用缓存；
+    2. 尚未添加到用户文档中心的资源按container_id分组，每组通过一次add_to_center/batch请求添加；
+    3. 并发获取各资源的下载链接，并按resource_id缓存，每个链接解析完成（且之前的都已产出）后立即产出。
+    """
+    access_token = get_info_parse(user_data, "access_token")
+    mac_key = get_info_parse(user_data, "mac_key")
+    user_key = get_user_key(user_data)
+
+    # 去重，同一资源只解析一次
+    file_urls = {}
+    pending = {}
+    for item in resource_items:
+        id = item.get("id")
+        if id in file_urls or id in pending:
+            continue
+        cached_url = resolution_cache.get_url(id)
+        if cached_url:
+            file_urls[id] = cached_url
+        else:
+            pending[id] = item
+
+    # 批量添加到文档中心
+    to_add = [(item.get("container_id"), id) for id, item in pending.items()
+              if not resolution_cache.is_added(user_key, id)]
+    if to_add:
+        for id, ok in save_infos(to_add, access_token, mac_key, app_id).items():
+            if ok:
+                resolution_cache.mark_added(user_key, id)
+    just_added = {id for _, id in to_add}
+
+    def lookup(id):
+        with resolution_cache.lock_for(id), metrics.timer("smartedu_courseware_resolve_seconds"):
+            # 其他线程可能刚解析完同一个资源
+            file_url = resolution_cache.get_url(id, count=False)
+            if file_url:
+                return file_url
             file_url = get_courseware_url(id, access_token, mac_key, app_id)
+            if file_url is None and id not in just_added:
+                # 资源可能已被用户从文档中心移除，重新添加
+                resolution_cache.unmark_added(user_key, id)
+                if save_info(pending[id].get("container_id"), id, access_token, mac_key, app_id):
+                    resolution_cache.mark_added(user_key, id)
+                file_url = get_courseware_url(id, access_token, mac_key, app_id)
+            if file_url:
+                resolution_cache.set_url(id, file_url)
+            return file_url
+
+    # pending按资源首次出现的顺序排列，遇到尚未解析的资源时，它一定是下一个解析结果
+    pending_ids = iter(pending)
+    resolved = iter_in_parallel(lookup, list(pending))
+    for item in resource_items:
+        id = item.get("id")
+        while id not in file_urls:
+            file_url = next(resolved)
+            file_urls[next(pending_ids)] = file_url
+            metrics.inc("smartedu_courseware_resolutions_total", result="ok" if file_url else "failed")
+        yield file_urls[id]
+
+
+def get_user_key(user_data: str) -> str:
+    """用于区分用户的标识，优先使用user_id，没有时使用access_token的摘要"""
+    user_id = get_info_parse(user_data, "user_id")
+    if user_id:
+        return str(user_id)
+    access_token = get_info_parse(user_data, "access_token") or ""
+    return hashlib.sha1(access_token.encode("utf-8")).hexdigest()
+
+
+def parse_resource_item(item, dir_name, teacher_name):
+    """提取单个资源的文件信息，json中没有直接下载地址时file_url为None"""
+    #file_name = item.get("title")
+    global_title = item.get("global_title", {})
+    title_zh_cn = global_title.get("zh-CN", "")
+    show_title = item.get("title", "")
+    file_name = f"{title_zh_cn}_{show_title}"
+    custom_properties = item.get("custom_properties", {})
+    file_format = custom_properties.get("format", "")
+    file_size = custom_properties.get("size", "")
+    ti_items = item.get("ti_items", [])
+    file_url = get_download_url(ti_items, file_size, file_format)
+
+    return {
+        "dir_name": dir_name,
+        "file_name": file_name,
+        "file_url": file_url,
+        "file_format": file_format,
+        "file_size": file_size,
+        "update_time": item.get("update_time"),
+        "teacher_name": teacher_name
+    }
 
-        items.append({
-            "dir_name": dir_name,
-            "file_name": file_name,
-            "file_url": file_url,
-            "file_format": file_format,
-            "file_size": file_size,
-            "teacher_name": teacher_name
-        })
-    return items
+
+def iter_resources_multi(resource_keys, relations, dir_name, teacher_name, user_data, app_id):
+    """
+    按资源列表及列表内的原有顺序逐个产出多个资源列表中的文件信息。
+
+    有下载地址的条目立即产出；没有的每config.ADD_TO_CENTER_BATCH个一组，一次添加到文档中心后并发获取下载链接，
+    每个链接获取后（且之前的条目都已产出）立即产出，资源列表边解析边产出，不必先构建完整的条目列表。
+    """
+    chunk_size = max(1, config.ADD_TO_CENTER_BATCH)
+    pending = []  # 等待这一组解析完成的条目，以没有下载地址的条目开头：[(文件信息, 需解析时为原始资源否则为None)]
+    unresolved = 0
+    for resource_key in resource_keys:
+        for resource in relations.get(resource_key, []):
+            item = parse_resource_item(resource, dir_name, teacher_name)
+            if item["file_url"] is not None:
+                if pending:
+                    pending.append((item, None))
+                else:
+                    yield item
+                continue
+            pending.append((item, resource))
+            unresolved += 1
+            if unresolved == chunk_size:
+                yield from _with_courseware_urls(pending, user_data, app_id)
+                pending = []
+                unresolved = 0
+    yield from _with_courseware_urls(pending, user_data, app_id)
+
+
+def _with_courseware_urls(pending: list, user_data: str, app_id: str):
+    """通过文档中心为pending中需解析的条目获取下载链接，按顺序产出pending中的文件信息"""
+    if not pending:
+        return
+    file_urls = iter_courseware_urls([resource for _, resource in pending if resource is not None], user_data, app_id)
+    for item, resource in pending:
+        if resource is not None:
+            item["file_url"] = next(file_urls)
+        yield item
 
 
 def get_textbook_info(content_id: str, user_data: str, app_id: str):
@@ -84,12 +217,8 @@ def get_textbook_info(content_id: str, user_data: str, app_id: str):
         # 构建请求URL
         json_url = f"https://s-file-1.ykt.cbern.com.cn/zxx/ndrv2/resources/tch_material/details/{content_id}.json"
         
-        # 发起GET请求并检查响应状态
-        response = requests.get(json_url, timeout=10)
-        response.raise_for_status()
-        
-        # 解析JSON响应数据
-        data = response.json()
+        # 获取详情JSON（优先使用本地缓存）
+        data = fetch_json(json_url)
         
         # 获取资源基本信息
         file_name = data.get("title", content_id)
@@ -107,7 +236,8 @@ def get_textbook_info(content_id: str, user_data: str, app_id: str):
             "file_name": file_name,
             "file_url": file_url,
             "file_format": file_format,
-            "file_size": file_size
+            "file_size": file_size,
+            "update_time": data.get("update_time")
         }]
     except requests.exceptions.HTTPError as http_err:
         print(f"HTTP错误: {http_err}")
@@ -135,12 +265,8 @@ def get_courseware_info(resource_id: str, user_data: str, app_id: str):
         # 构建请求URL
         json_url = f"https://s-file-2.ykt.cbern.com.cn/zxx/ndrv2/prepare_sub_type/resources/details/{resource_id}.json"
 
-        # 发起GET请求并检查响应状态
-        response = requests.get(json_url, timeout=10)
-        response.raise_for_status()
-
-        # 解析JSON响应数据
-        data = response.json()
+        # 获取详情JSON（优先使用本地缓存）
+        data = fetch_json(json_url)
 
         # 获取资源基本信息
         file_name = data.get("title", resource_id)
@@ -158,7 +284,8 @@ def get_courseware_info(resource_id: str, user_data: str, app_id: str):
             "file_name": file_name,
             "file_url": file_url,
             "file_format": file_format,
-            "file_size": file_size
+            "file_size": file_size,
+            "update_time": data.get("update_time")
         }]
     except requests.exceptions.HTTPError as http_err:
         print(f"HTTP错误: {http_err}")
@@ -184,28 +311,7 @@ def get_bookcoursebag_info(activity_id: str, user_data: str, app_id: str):
                      若发生错误，则返回None。
     """
     try:
-        bookcoursebag_info_list = []  # 存储书课包课件信息的列表
-        
-        # 构造请求URL以获取详细信息
-        json_url = f"https://s-file-2.ykt.cbern.com.cn/zxx/ndrv2/national_lesson/resources/details/{activity_id}.json"
-        
-        # 发起HTTP GET请求并验证响应状态
-        response = requests.get(json_url, timeout=10)
-        response.raise_for_status()
-        
-        # 解析响应中的JSON数据
-        data = response.json()
-        
-        # 提取书课包标题和资源关系
-        dir_name = data.get("title")
-        relations = data.get("relations", {})
-        teacher_list = data.get("teacher_list")
-        teacher_name = teacher_list[0]["name"]
-        if not teacher_name:
-            teacher_name = "未知教师"
-        bookcoursebag_info_list = fetch_resources("national_course_resource", relations, dir_name, teacher_name, user_data, app_id)
-        
-        return bookcoursebag_info_list
+        return list(iter_bookcoursebag_info(activity_id, user_data, app_id))
     except requests.exceptions.HTTPError as http_err:
         print(f"HTTP错误: {http_err}")
     except requests.exceptions.RequestException as req_err:
@@ -218,6 +324,21 @@ def get_bookcoursebag_info(activity_id: str, user_data: str, app_id: str):
     return None
 
 
+def iter_bookcoursebag_info(activity_id: str, user_data: str, app_id: str):
+    """get_bookcoursebag_info的生成器版本，逐个产出资源信息，请求出错时在迭代中抛出异常。"""
+    json_url = f"https://s-file-2.ykt.cbern.com.cn/zxx/ndrv2/national_lesson/resources/details/{activity_id}.json"
+    data = fetch_json(json_url)
+
+    # 提取书课包标题和资源关系
+    dir_name = data.get("title")
+    relations = data.get("relations", {})
+    teacher_list = data.get("teacher_list")
+    teacher_name = teacher_list[0]["name"]
+    if not teacher_name:
+        teacher_name = "未知教师"
+    yield from iter_resources_multi(["national_course_resource"], relations, dir_name, teacher_name, user_data, app_id)
+
+
 def get_experiment_course_info(course_id: str, user_data: str, app_id: str):
     """
     根据课程ID获取实验课程的资源信息列表。
@@ -230,28 +351,7 @@ def get_experiment_course_info(course_id: str, user_data: str, app_id: str):
                     若发生错误，则返回None。
     """
     try:
-        experiment_course_list = []
-
-        json_url = f"https://s-file-1.ykt.cbern.com.cn/zxx/ndrs/experiment/resources/details/{course_id}.json"
-        response = requests.get(json_url, timeout=10)
-        response.raise_for_status()
-        
-        data = response.json()
-        relations = data.get("relations", {})
-        name = data.get("title", "")
-        teacher_list = data.get("teacher_list")
-        teacher_name = teacher_list[0]["name"]
-        if not teacher_name:
-            teacher_name = "未知教师"
-        
-        # 处理lesson_1资源
-        lesson_1_items = fetch_resources("lesson_1", relations, name, teacher_name, user_data, app_id)
-        # 处理实验视频资源
-        experiment_video_items = fetch_resources("experiment_video", relations, name, teacher_name, user_data, app_id)
-
-        experiment_course_list = lesson_1_items + experiment_video_items
-                
-        return experiment_course_list
+        return list(iter_experiment_course_info(course_id, user_data, app_id))
     except requests.exceptions.HTTPError as http_err:
         print(f"HTTP错误: {http_err}")
     except requests.exceptions.RequestException as req_err:
@@ -264,6 +364,21 @@ def get_experiment_course_info(course_id: str, user_data: str, app_id: str):
     return None
 
 
+def iter_experiment_course_info(course_id: str, user_data: str, app_id: str):
+    """get_experiment_course_info的生成器版本，逐个产出资源信息，请求出错时在迭代中抛出异常。"""
+    json_url = f"https://s-file-1.ykt.cbern.com.cn/zxx/ndrs/experiment/resources/details/{course_id}.json"
+    data = fetch_json(json_url)
+    relations = data.get("relations", {})
+    name = data.get("title", "")
+    teacher_list = data.get("teacher_list")
+    teacher_name = teacher_list[0]["name"]
+    if not teacher_name:
+        teacher_name = "未知教师"
+
+    # 同时处理lesson_1资源和实验视频资源
+    yield from iter_resources_multi(["lesson_1", "experiment_video"], relations, name, teacher_name, user_data, app_id)
+
+
 
 def get_one_teacher_info(lesson_id: str, user_data: str, app_id: str):
     """
@@ -277,27 +392,7 @@ def get_one_teacher_info(lesson_id: str, user_data: str, app_id: str):
                     若发生错误，则返回None。
     """
     try:
-        json_url = f"https://s-file-1.ykt.cbern.com.cn/zxx/ndrv2/prepare_lesson/resources/details/{lesson_id}.json"
-        response = requests.get(json_url, timeout=10)
-        response.raise_for_status()
-        
-        data = response.json()
-        relations = data.get("relations", {})
-        dir_name = data.get("title")
-        teacher_list = data.get("teacher_list")
-        teacher_name = teacher_list[0]["name"]
-        if not teacher_name:
-            teacher_name = "未知教师"
-        
-        # 分别处理不同类型的资源
-        lesson_plan_design_items = fetch_resources("lesson_plan_design", relations, dir_name, teacher_name, user_data, app_id)
-        classroom_record_items = fetch_resources("classroom_record", relations, dir_name, teacher_name, user_data, app_id)
-        teaching_assets_items = fetch_resources("teaching_assets", relations, dir_name, teacher_name, user_data, app_id)
-        
-        # 合并所有资源列表
-        one_teacher_list = lesson_plan_design_items + classroom_record_items + teaching_assets_items
-        
-        return one_teacher_list
+        return list(iter_one_teacher_info(lesson_id, user_data, app_id))
     except requests.exceptions.HTTPError as http_err:
         print(f"HTTP错误: {http_err}")
     except requests.exceptions.RequestException as req_err:
@@ -310,6 +405,24 @@ def get_one_teacher_info(lesson_id: str, user_data: str, app_id: str):
     return None
 
 
+def iter_one_teacher_info(lesson_id: str, user_data: str, app_id: str):
+    """get_one_teacher_info的生成器版本，逐个产出资源信息，请求出错时在迭代中抛出异常。"""
+    json_url = f"https://s-file-1.ykt.cbern.com.cn/zxx/ndrv2/prepare_lesson/resources/details/{lesson_id}.json"
+    data = fetch_json(json_url)
+    relations = data.get("relations", {})
+    dir_name = data.get("title")
+    teacher_list = data.get("teacher_list")
+    teacher_name = teacher_list[0]["name"]
+    if not teacher_name:
+        teacher_name = "未知教师"
+
+    # 同时处理不同类型的资源，结果按类型顺序合并
+    yield from iter_resources_multi(
+        ["lesson_plan_design", "classroom_record", "teaching_assets"],
+        relations, dir_name, teacher_name, user_data, app_id
+    )
+
+
 def get_subject_info(course_id: str, user_data: str, app_id: str):
     """
     根据课程ID获取学科课程精品课的资源信息列表。
@@ -322,21 +435,7 @@ def get_subject_info(course_id: str, user_data: str, app_id: str):
                     若发生错误，则返回None。
     """
     try:
-        json_url = f"https://s-file-1.ykt.cbern.com.cn/zxx/ndrv2/resources/{course_id}.json"
-        response = requests.get(json_url, timeout=10)
-        response.raise_for_status()
-        
-        data = response.json()
-        relations= data.get("relations", {})
-        dir_name = data.get("title")
-        teacher_list = data.get("teacher_list")
-        teacher_name = teacher_list[0]["name"]
-        if not teacher_name:
-            teacher_name = "未知教师"
-
-        subject_list = fetch_resources("course_resource", relations, dir_name, teacher_name, user_data, app_id)
-
-        return subject_list
+        return list(iter_subject_info(course_id, user_data, app_id))
     except requests.exceptions.HTTPError as http_err:
         print(f"HTTP错误: {http_err}")
     except requests.exceptions.RequestException as req_err:
@@ -349,6 +448,20 @@ def get_subject_info(course_id: str, user_data: str, app_id: str):
     return None
 
 
+def iter_subject_info(course_id: str, user_data: str, app_id: str):
+    """get_subject_info的生成器版本，逐个产出资源信息，请求出错时在迭代中抛出异常。"""
+    json_url = f"https://s-file-1.ykt.cbern.com.cn/zxx/ndrv2/resources/{course_id}.json"
+    data = fetch_json(json_url)
+    relations= data.get("relations", {})
+    dir_name = data.get("title")
+    teacher_list = data.get("teacher_list")
+    teacher_name = teacher_list[0]["name"]
+    if not teacher_name:
+        teacher_name = "未知教师"
+
+    yield from iter_resources_multi(["course_resource"], relations, dir_name, teacher_name, user_data, app_id)
+
+
 def get_basis_info(course_id: str, user_data: str, app_id: str):
     """
     根据课程ID获取基础教育精品课的资源信息列表。
@@ -361,21 +474,7 @@ def get_basis_info(course_id: str, user_data: str, app_id: str):
                     若发生错误，则返回None。
     """
     try:
-        json_url = f"https://s-file-1.ykt.cbern.com.cn/competitive/elite_lesson/resources/{course_id}.json"
-        response = requests.get(json_url, timeout=10)
-        response.raise_for_status()
-        
-        data = response.json()
-        relations= data.get("relations", {})
-        dir_name = data.get("title")
-        teacher_list = data.get("teacher_list")
-        teacher_name = teacher_list[0]["name"]
-        if not teacher_name:
-            teacher_name = "未知教师"
-
-        basis_list = fetch_resources("course_resource", relations, dir_name, teacher_name, user_data, app_id)
-
-        return basis_list
+        return list(iter_basis_info(course_id, user_data, app_id))
     except requests.exceptions.HTTPError as http_err:
         print(f"HTTP错误: {http_err}")
     except requests.exceptions.RequestException as req_err:
@@ -388,6 +487,20 @@ def get_basis_info(course_id: str, user_data: str, app_id: str):
     return None
 
 
+def iter_basis_info(course_id: str, user_data: str, app_id: str):
+    """get_basis_info的生成器版本，逐个产出资源信息，请求出错时在迭代中抛出异常。"""
+    json_url = f"https://s-file-1.ykt.cbern.com.cn/competitive/elite_lesson/resources/{course_id}.json"
+    data = fetch_json(json_url)
+    relations= data.get("relations", {})
+    dir_name = data.get("title")
+    teacher_list = data.get("teacher_list")
+    teacher_name = teacher_list[0]["name"]
+    if not teacher_name:
+        teacher_name = "未知教师"
+
+    yield from iter_resources_multi(["course_resource"], relations, dir_name, teacher_name, user_data, app_id)
+
+
 def get_homework_info(content_id: str, user_data: str, app_id: str):
     """
     根据内容ID获取作业的资源信息列表。
@@ -401,10 +514,7 @@ def get_homework_info(content_id: str, user_data: str, app_id: str):
     """
     try:
         json_url = f"https://s-file-1.ykt.cbern.com.cn/zxx/ndrs/special_edu/resources/details/{content_id}.json"
-        response = requests.get(json_url, timeout=10)
-        response.raise_for_status()
-
-        data = response.json()        
+        data = fetch_json(json_url)
 
         # 获取资源基本信息
         file_name = data.get("title")
@@ -426,7 +536,8 @@ def get_homework_info(content_id: str, user_data: str, app_id: str):
             "file_name": file_name,
             "file_url": file_url,
             "file_format": file_format,
-            "file_size": file_size
+            "file_size": file_size,
+            "update_time": data.get("update_time")
         }]
     except requests.exceptions.HTTPError as http_err:
         print(f"HTTP错误: {http_err}")
@@ -441,39 +552,7 @@ def get_homework_info(content_id: str, user_data: str, app_id: str):
 
 def get_thematic_infos(content_id: str, user_data: str, app_id: str):
     try:
-        json_url = f"https://s-file-1.ykt.cbern.com.cn/zxx/ndrs/special_edu/thematic_course/{content_id}/resources/list.json"
-        response = requests.get(json_url, timeout=10)
-        response.raise_for_status()
-
-        datas = response.json()
-        ret = []
-
-        for data in datas:
-            # 获取资源基本信息
-            file_name = data.get("title")
-            custom_props = data.get("custom_properties", {})
-            file_format = custom_props.get("format")
-            file_size = custom_props.get("size")
-            file_url = None
-
-            # 遍历资源项以查找正确的文件URL
-            ti_items = data.get("ti_items", [])
-            for item in ti_items:
-                if ((file_format == "mp4" and item.get("ti_file_flag") == "href") or
-                (item.get("ti_size") == file_size and file_format != "mp4")):
-                    file_url = item.get("ti_storages")[0]
-            
-            per_ret = [{
-            "dir_name": "",
-            "file_name": file_name,
-            "file_url": file_url,
-            "file_format": file_format,
-            "file_size": file_size
-            }]
-            ret.append(per_ret)
-        
-        # 返回资源信息
-        return ret
+        return [[item] for item in iter_thematic_infos(content_id, user_data, app_id)]
     except requests.exceptions.HTTPError as http_err:
         print(f"HTTP错误: {http_err}")
     except requests.exceptions.RequestException as req_err:
@@ -483,13 +562,41 @@ def get_thematic_infos(content_id: str, user_data: str, app_id: str):
     except Exception as e:
         print(f"未知错误: {e}")
 
+
+def iter_thematic_infos(content_id: str, user_data: str, app_id: str):
+    """get_thematic_infos的生成器版本，逐个产出资源信息，请求出错时在迭代中抛出异常。"""
+    json_url = f"https://s-file-1.ykt.cbern.com.cn/zxx/ndrs/special_edu/thematic_course/{content_id}/resources/list.json"
+    datas = fetch_json(json_url)
+
+    for data in datas:
+        # 获取资源基本信息
+        file_name = data.get("title")
+        custom_props = data.get("custom_properties", {})
+        file_format = custom_props.get("format")
+        file_size = custom_props.get("size")
+        file_url = None
+
+        # 遍历资源项以查找正确的文件URL
+        ti_items = data.get("ti_items", [])
+        for item in ti_items:
+            if ((file_format == "mp4" and item.get("ti_file_flag") == "href") or
+            (item.get("ti_size") == file_size and file_format != "mp4")):
+                file_url = item.get("ti_storages")[0]
+
+        yield {
+        "dir_name": "",
+        "file_name": file_name,
+        "file_url": file_url,
+        "file_format": file_format,
+        "file_size": file_size,
+        "update_time": data.get("update_time")
+        }
+
+
 def get_wisdom_info(content_id: str, user_data: str, app_id: str):
     try:
         json_url = f"https://s-file-1.ykt.cbern.com.cn/ldjy/ndrs/special_edu/resources/details/{content_id}.json"
-        response = requests.get(json_url, timeout=10)
-        response.raise_for_status()
-
-        data = response.json()        
+        data = fetch_json(json_url)
 
         # 获取资源基本信息
         file_name = data.get("title")
@@ -511,7 +618,8 @@ def get_wisdom_info(content_id: str, user_data: str, app_id: str):
             "file_name": file_name,
             "file_url": file_url,
             "file_format": file_format,
-            "file_size": file_size
+            "file_size": file_size,
+            "update_time": data.get("update_time")
         }]
     except requests.exceptions.HTTPError as http_err:
         print(f"HTTP错误: {http_err}")
@@ -543,7 +651,8 @@ def get_courseware_url(resource_id, access_token, mac_key, app_id):
     method_type = "GET"
     
     # 获取授权头
-    authorization_header = auth_encrypt(request_url, access_token, mac_key, diff, method_type)
+    with profiling.stage("doc_center_sign"):
+        authorization_header = auth_encrypt(request_url, access_token, mac_key, diff, method_type)
     
     # 设置请求头
     headers = {
@@ -552,7 +661,8 @@ def get_courseware_url(resource_id, access_token, mac_key, app_id):
     }
     try:
         # 发起GET请求并检查响应状态
-        response = requests.get(url = request_url, headers = headers, timeout=10)
+        with profiling.stage("doc_center_document"):
+            response = transport.get(request_url, headers = headers)
         response.raise_for_status()
 
         # 解析JSON响应数据
@@ -580,6 +690,54 @@ def get_courseware_url(resource_id, access_token, mac_key, app_id):
     return None
 
 def save_info(container_id: str, resource_id: str, access_token: str, mac_key: str, app_id: str):
+    """将单个资源添加到用户的文档中心"""
+    return post_add_to_center(container_id, [resource_id], access_token, mac_key, app_id)
+
+
+def save_infos(resources: list, access_token: str, mac_key: str, app_id: str, batch_size: int = None) -> dict:
+    """
+    批量将资源添加到用户的文档中心。
+
+    资源按container_id分组，每组按batch_size（默认config.ADD_TO_CENTER_BATCH）拆分后各发送一次请求；
+    整批请求失败时，再对该批中的资源逐个重试。
+
+    :param resources: (container_id, resource_id) 元组列表
+    :return: 以resource_id为键、是否添加成功为值的字典
+    """
+    batch_size = max(1, batch_size or config.ADD_TO_CENTER_BATCH)
+    groups = {}
+    for container_id, resource_id in resources:
+        resource_ids = groups.setdefault(container_id, [])
+        if resource_id not in resource_ids:
+            resource_ids.append(resource_id)
+
+    batches = [(container_id, resource_ids[start:start + batch_size])
+               for container_id, resource_ids in groups.items()
+               for start in range(0, len(resource_ids), batch_size)]
+
+    def submit(batch):
+        container_id, resource_ids = batch
+        if post_add_to_center(container_id, resource_ids, access_token, mac_key, app_id):
+            return {resource_id: True for resource_id in resource_ids}
+        if len(resource_ids) == 1:
+            return {resource_ids[0]: False}
+        # 整批失败时逐个重试，找出具体失败的资源
+        return {resource_id: save_info(container_id, resource_id, access_token, mac_key, app_id)
+                for resource_id in resource_ids}
+
+    results = {}
+    for batch_result in resolve_in_parallel(submit, batches):
+        results.update(batch_result)
+
+    failed = [resource_id for resource_id, ok in results.items() if not ok]
+    if failed:
+        print(f"以下资源添加到文档中心失败: {', '.join(map(str, failed))}")
+    metrics.inc("smartedu_add_to_center_total", len(results) - len(failed), result="ok")
+    metrics.inc("smartedu_add_to_center_total", len(failed), result="failed")
+    return results
+
+
+def post_add_to_center(container_id: str, resource_ids: list, access_token: str, mac_key: str, app_id: str):
     request_url = "https://doc-center.ykt.eduyun.cn/v1.0/c/document/actions/add_to_center/batch?auto_rename=true"
     data = {
         "parent_id":"0",
@@ -589,6 +747,7 @@ def save_info(container_id: str, resource_id: str, access_token: str, mac_key: s
                 "resource_id":resource_id,
                 "type":"get"
             }
+            for resource_id in resource_ids
         ]
     }
 
@@ -599,7 +758,8 @@ def save_info(container_id: str, resource_id: str, access_token: str, mac_key: s
     method_type = "POST"
 
     # 获取授权头
-    authorization_header = auth_encrypt(request_url, access_token, mac_key, diff, method_type)
+    with profiling.stage("doc_center_sign"):
+        authorization_header = auth_encrypt(request_url, access_token, mac_key, diff, method_type)
     
     # 设置请求头
     headers = {
@@ -607,8 +767,9 @@ def save_info(container_id: str, resource_id: str, access_token: str, mac_key: s
         'sdp-app-id': app_id
     }
     try:
-        # 发起GET请求并检查响应状态
-        response = requests.post(url = request_url, json = data, headers = headers, timeout=10)
+        # 发起POST请求并检查响应状态
+        with profiling.stage("add_to_center"):
+            response = transport.post(request_url, json = data, headers = headers)
         response.raise_for_status()
 
         # 返回资源信息
@@ -623,4 +784,3 @@ def save_info(container_id: str, resource_id: str, access_token: str, mac_key: s
         print(f"未知错误: {e}")
     
     return False
-    
\ No newline at end of file
@@ -0,0 +1,353 @@
+import os
+import time
+import sqlite3
+import threading
+from utils import config, metrics
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    web_url TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_web_url ON jobs (web_url, status);
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id INTEGER NOT NULL REFERENCES jobs (id),
+    seq INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    file_name TEXT,
+    file_url TEXT,
+    file_format TEXT,
+    file_size,
+    update_time TEXT,
+    is_video INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    claimed_at REAL,
+    updated_at REAL NOT NULL,
+    UNIQUE (job_id, seq)
+);
+CREATE INDEX IF NOT EXISTS items_claim ON items (job_id, status, id);
+"""
+
+# 条目状态
+PENDING, RUNNING, DONE, FAILED = "pending", "running", "done", "failed"
+# 任务状态：解析尚未结束，此时条目可能还不完整；解析结果已超过config.RESOLUTION_TTL，下载地址可能已失效
+RESOLVING, EXPIRED = "resolving", "expired"
+
+
+class JobStore:
+    """
+    基于SQLite（WAL模式）的持久化任务队列，保存在缓存目录下的jobs.db中。
+
+    每个网页地址成为一个任务，解析出的条目（保存目录、文件名、下载地址、格式、大小）边解析边逐条写入，
+    状态为pending、running、done或failed，并记录尝试次数。解析结束前任务为resolving状态，
+    中断时解析未完成的任务不会被继续，再次处理该链接时重新解析。同一台机器上的多个线程或进程可以同时领取条目：
+    领取在一个IMMEDIATE事务中完成，同一条目只会被一个工作者领取。
+
+    领取的条目有租约（config.JOB_LEASE秒），本进程在下载期间定期续约；租约过期或领取它的进程已退出时，
+    条目可被其他工作者或重新运行的进程再次领取，因此进程崩溃后重新运行会从中断处继续。
+    解析结果中的文档中心下载地址会失效，超过config.RESOLUTION_TTL的任务不再继续，再次处理该链接时重新解析。
+    """
+
+    def __init__(self, path: str = None):
+        self._path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._active = set()  # 本进程正在处理的条目ID，由续约线程定期更新租约
+        self._heartbeat = None
+        self.worker = f"{os.getpid()}"
+
+    @property
+    def path(self) -> str:
+        return self._path or config.JOB_DB or os.path.join(config.CACHE_DIR, "jobs.db")
+
+    def _connect(self) -> sqlite3.Connection:
+        """每个线程使用自己的连接，缓存目录变化时重新连接"""
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = {}
+        connection = connections.get(self.path)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(_SCHEMA)
+            connections[self.path] = connection
+        return connection
+
+    def _transaction(self, connection: sqlite3.Connection):
+        return _ImmediateTransaction(connection)
+
+    def find_unfinished(self, web_url: str):
+        """
+        查找该网页地址尚未完成的任务，创建时间超过config.RESOLUTION_TTL的任务标记为expired，不再继续。
+
+        返回:
+            int 或 None: 任务ID，没有未完成的任务时返回None。
+        """
+        now = time.time()
+        connection = self._connect()
+        with self._transaction(connection):
+            connection.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE web_url = ? AND status = 'pending' AND created_at <= ?",
+                (EXPIRED, now, web_url, now - config.RESOLUTION_TTL))
+            row = connection.execute(
+                "SELECT id FROM jobs WHERE web_url = ? AND status = 'pending' ORDER BY id DESC LIMIT 1",
+                (web_url,)).fetchone()
+        return row["id"] if row is not None else None
+
+    def create_job(self, web_url: str) -> int:
+        """新建任务，返回任务ID。解析出的条目通过add_item加入，解析结束后调用finish_resolve。"""
+        now = time.time()
+        connection = self._connect()
+        with self._transaction(connection):
+            return connection.execute(
+                "INSERT INTO jobs (web_url, status, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                (web_url, RESOLVING, now, now)).lastrowid
+
+    def add_item(self, job_id: int, item: dict) -> dict:
+        """
+        把解析出的条目加入任务，并直接由本进程领取（解析后马上下载）。
+
+        返回:
+            dict: 领取的条目，与claim的返回格式相同。
+        """
+        now = time.time()
+        connection = self._connect()
+        with self._transaction(connection):
+            seq = connection.execute("SELECT COALESCE(MAX(seq) + 1, 0) FROM items WHERE job_id = ?",
+                                     (job_id,)).fetchone()[0]
+            item_id = connection.execute(
+                "INSERT INTO items (job_id, seq, path, file_name, file_url, file_format, file_size, update_time,"
+                " is_video, status, attempts, worker, claimed_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'running', 1, ?, ?, ?)",
+                (job_id, seq, item["path"], item["file_name"], item["file_url"], item["file_format"],
+                 item["file_size"], item.get("update_time"), int(item["is_video"]), self.worker, now, now)).lastrowid
+            # 在事务内登记，本进程的其他线程领取时不会把它当作之前的进程留下的条目
+            with self._lock:
+                self._active.add(item_id)
+        metrics.inc("smartedu_job_items_total", result="added")
+        self._start_heartbeat()
+        return {**item, "id": item_id, "job_id": job_id, "attempts": 1}
+
+    def finish_resolve(self, job_id: int, ok: bool) -> None:
+        """
+        解析结束。解析成功时任务可被继续（所有条目都已结束时直接更新为最终状态），
+        解析出错时任务标记为failed，再次处理该链接时重新解析。
+        """
+        now = time.time()
+        connection = self._connect()
+        with self._transaction(connection):
+            connection.execute("UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?",
+                               (PENDING if ok else FAILED, now, job_id))
+            if ok:
+                self._update_job_locked(connection, job_id, now)
+
+    def claim(self, job_id: int = None):
+        """
+        领取一个待处理的条目（或租约已过期的运行中条目），job_id为None时从所有任务中领取。
+
+        返回:
+            dict 或 None: 条目信息（与prepare_download_items的格式相同，另有id和attempts），没有可领取的条目时返回None。
+        """
+        items = self.claim_many(job_id, 1)
+        return items[0] if items else None
+
+    def claim_many(self, job_id: int = None, limit: int = None) -> list:
+        """一次领取最多limit个条目，limit为None时领取全部可领取的条目"""
+        now = time.time()
+        connection = self._connect()
+        condition = "(status = 'pending' OR (status = 'running' AND claimed_at < ?))"
+        params = [now - config.JOB_LEASE]
+        if job_id is not None:
+            condition += " AND job_id = ?"
+            params.append(job_id)
+        with self._transaction(connection):
+            self._reclaim_dead_locked(connection, job_id, now)
+            rows = connection.execute(
+                f"SELECT * FROM items WHERE {condition} ORDER BY id LIMIT ?", params + [limit or -1]).fetchall()
+            connection.executemany(
+                "UPDATE items SET status = 'running', attempts = attempts + 1, worker = ?, claimed_at = ?,"
+                " updated_at = ? WHERE id = ?",
+                [(self.worker, now, now, row["id"]) for row in rows])
+            with self._lock:
+                self._active.update(row["id"] for row in rows)
+
+        items = [_row_to_item(row) for row in rows]
+        self._start_heartbeat()
+        return items
+
+    def _reclaim_dead_locked(self, connection: sqlite3.Connection, job_id: int, now: float) -> None:
+        """租约未过期、但领取它的进程已经退出的条目放回待处理状态，不必等到租约过期"""
+        query = "SELECT id, worker FROM items WHERE status = 'running'"
+        params = []
+        if job_id is not None:
+            query += " AND job_id = ?"
+            params.append(job_id)
+        with self._lock:
+            active = set(self._active)
+        alive = {}
+        dead = []
+        for row in connection.execute(query, params).fetchall():
+            worker = row["worker"]
+            if worker == self.worker:
+                # 本进程正在处理的条目；不在其中的是之前使用相同进程号的进程留下的
+                if row["id"] not in active:
+                    dead.append(row["id"])
+                continue
+            if worker not in alive:
+                alive[worker] = _process_alive(worker)
+            if not alive[worker]:
+                dead.append(row["id"])
+        if dead:
+            connection.executemany(
+                "UPDATE items SET status = 'pending', worker = NULL, claimed_at = NULL, updated_at = ? WHERE id = ?",
+                [(now, item_id) for item_id in dead])
+
+    def complete(self, item_id: int, ok: bool) -> None:
+        """
+        记录条目的处理结果。失败且尝试次数未达到config.JOB_MAX_ATTEMPTS时放回待处理状态，
+        任务的所有条目都结束后更新任务状态。
+        """
+        now = time.time()
+        connection = self._connect()
+        with self._transaction(connection):
+            row = connection.execute("SELECT job_id, attempts FROM items WHERE id = ?", (item_id,)).fetchone()
+            if ok:
+                status = DONE
+            else:
+                status = FAILED if row["attempts"] >= config.JOB_MAX_ATTEMPTS else PENDING
+            connection.execute("UPDATE items SET status = ?, worker = NULL, claimed_at = NULL, updated_at = ?"
+                               " WHERE id = ?", (status, now, item_id))
+            self._update_job_locked(connection, row["job_id"], now)
+        with self._lock:
+            self._active.discard(item_id)
+        metrics.inc("smartedu_job_items_total", result=status)
+
+    def release(self, item_ids) -> None:
+        """放回未处理的条目（如下载被中断），不计入尝试次数"""
+        now = time.time()
+        connection = self._connect()
+        with self._transaction(connection):
+            connection.executemany(
+                "UPDATE items SET status = 'pending', attempts = MAX(attempts - 1, 0), worker = NULL,"
+                " claimed_at = NULL, updated_at = ? WHERE id = ? AND status = 'running'",
+                [(now, item_id) for item_id in item_ids])
+        with self._lock:
+            self._active.difference_update(item_ids)
+
+    def _update_job_locked(self, connection: sqlite3.Connection, job_id: int, now: float) -> None:
+        job = connection.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if job["status"] != PENDING:
+            # 解析尚未结束，或任务已结束
+            return
+        counts = dict(connection.execute(
+            "SELECT status, COUNT(*) FROM items WHERE job_id = ? GROUP BY status", (job_id,)).fetchall())
+        if counts.get(PENDING) or counts.get(RUNNING):
+            return
+        status = FAILED if counts.get(FAILED) else DONE
+        connection.execute("UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?", (status, now, job_id))
+
+    def job_status(self, job_id: int) -> dict:
+        """任务状态及各状态的条目数"""
+        connection = self._connect()
+        job = connection.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        counts = dict(connection.execute(
+            "SELECT status, COUNT(*) FROM items WHERE job_id = ? GROUP BY status", (job_id,)).fetchall())
+        return {"status": job["status"] if job else None,
+                **{status: counts.get(status, 0) for status in (PENDING, RUNNING, DONE, FAILED)}}
+
+    def _start_heartbeat(self) -> None:
+        with self._lock:
+            if self._heartbeat is not None:
+                return
+            self._heartbeat = threading.Thread(target=self._renew_forever, daemon=True)
+            self._heartbeat.start()
+
+    def _renew_forever(self) -> None:
+        """每隔租约的三分之一时间为本进程正在处理的条目续约"""
+        while True:
+            time.sleep(max(config.JOB_LEASE / 3, 1))
+            with self._lock:
+                item_ids = list(self._active)
+            if not item_ids:
+                continue
+            now = time.time()
+            try:
+                connection = self._connect()
+                with self._transaction(connection):
+                    connection.executemany(
+                        "UPDATE items SET claimed_at = ? WHERE id = ? AND status = 'running' AND worker = ?",
+                        [(now, item_id, self.worker) for item_id in item_ids])
+            except sqlite3.Error as e:
+                print(f"任务租约续约失败: {e}")
+
+
+class _ImmediateTransaction:
+    """BEGIN IMMEDIATE事务，开始时即取得写锁，多个进程同时领取条目时不会读到相同的待处理条目"""
+
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.connection.execute("COMMIT" if exc_type is None else "ROLLBACK")
+        return False
+
+
+def _process_alive(worker) -> bool:
+    """领取条目的进程（worker为进程号）是否仍在运行，无法判断时视为仍在运行"""
+    try:
+        pid = int(worker)
+    except (TypeError, ValueError):
+        return True
+    if os.name == "nt":
+        # Windows上os.kill(pid, 0)会发送CTRL_C_EVENT，改为查询进程的退出码
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return kernel32.GetLastError() == 5  # ERROR_ACCESS_DENIED：进程存在但无权访问
+        try:
+            code = ctypes.c_ulong()
+            if not kernel32.GetExitCodeProcess(handle, ctypes.byref(code)):
+                return True
+            return code.value == 259  # STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # 进程存在但属于其他用户等情况
+        return True
+    return True
+
+
+def _row_to_item(row: sqlite3.Row) -> dict:
+    return {
+        "id": row["id"],
+        "job_id": row["job_id"],
+        "path": row["path"],
+        "file_name": row["file_name"],
+        "file_url": row["file_url"],
+        "file_format": row["file_format"],
+        "file_size": row["file_size"],
+        "update_time": row["update_time"],
+        "is_video": bool(row["is_video"]),
+        "attempts": row["attempts"]
+    }
+
+
+job_store = JobStore()
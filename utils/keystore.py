@@ -0,0 +1,110 @@
+import os
+import json
+import time
+import threading
+from utils import config, metrics
+
+
+class KeyStore:
+    """
+    视频解密密钥缓存，以密钥URL（其中包含key_id）为键。
+
+    密钥缓存在内存中，启用config.KEY_CACHE_DISK时同时保存到缓存目录下的keys.json，
+    超过config.KEY_CACHE_TTL秒后失效。同一个密钥同时被多个线程请求时只获取一次。
+    """
+
+    def __init__(self, fetcher):
+        """
+        参数:
+            fetcher (callable): 获取密钥的函数，参数为(key_url, key_id)，失败时返回None。
+        """
+        self._fetcher = fetcher
+        self._keys = {}  # {key_url: (密钥, 过期时间)}
+        self._disk_loaded = False
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self.hits = 0
+        self.fetches = 0
+
+    @property
+    def disk_path(self) -> str:
+        return os.path.join(config.CACHE_DIR, "keys.json")
+
+    def _load_disk_locked(self) -> None:
+        if self._disk_loaded or not config.KEY_CACHE_DISK:
+            return
+        self._disk_loaded = True
+        try:
+            with open(self.disk_path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        for key_url, entry in data.items():
+            if entry.get("expires_at", 0) > now and key_url not in self._keys:
+                self._keys[key_url] = (bytes.fromhex(entry["key"]), entry["expires_at"])
+
+    def _save_disk_locked(self) -> None:
+        if not config.KEY_CACHE_DISK:
+            return
+        now = time.time()
+        data = {key_url: {"key": key.hex(), "expires_at": expires_at}
+                for key_url, (key, expires_at) in self._keys.items() if expires_at > now}
+        os.makedirs(config.CACHE_DIR, exist_ok=True)
+        temp_path = self.disk_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(data, file)
+        os.replace(temp_path, self.disk_path)
+
+    def _lookup_locked(self, key_url: str):
+        self._load_disk_locked()
+        entry = self._keys.get(key_url)
+        if entry is not None and entry[1] > time.time():
+            return entry[0]
+        return None
+
+    def peek(self, key_url: str):
+        """只读取缓存，不发起请求，缓存中没有时返回None。"""
+        with self._lock:
+            key = self._lookup_locked(key_url)
+            if key is not None:
+                self.hits += 1
+                metrics.inc("smartedu_cache_events_total", cache="keys", result="hits")
+            return key
+
+    def put(self, key_url: str, key: bytes) -> None:
+        """保存由其他途径（如asyncio下载引擎）获取到的密钥。"""
+        with self._lock:
+            self.fetches += 1
+            metrics.inc("smartedu_cache_events_total", cache="keys", result="misses")
+            self._keys[key_url] = (key, time.time() + config.KEY_CACHE_TTL)
+            self._save_disk_locked()
+
+    def get(self, key_url: str, key_id: str):
+        """
+        获取密钥，缓存中没有或已过期时调用fetcher获取。
+
+        返回:
+            bytes 或 None: 解密密钥，获取失败时返回None。
+        """
+        with self._lock:
+            key = self._lookup_locked(key_url)
+            if key is not None:
+                self.hits += 1
+                metrics.inc("smartedu_cache_events_total", cache="keys", result="hits")
+                return key
+            key_lock = self._key_locks.setdefault(key_url, threading.Lock())
+
+        # 同一密钥只允许一个线程去获取，其他线程等待结果
+        with key_lock:
+            with self._lock:
+                key = self._lookup_locked(key_url)
+                if key is not None:
+                    self.hits += 1
+                    metrics.inc("smartedu_cache_events_total", cache="keys", result="hits")
+                    return key
+
+            key = self._fetcher(key_url, key_id)
+            if key is not None:
+                self.put(key_url, key)
+            return key
@@ -0,0 +1,210 @@
+import os
+import json
+import time
+import atexit
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from utils import config
+
+# 耗时直方图的桶上限（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_lock = threading.Lock()
+_counters = {}  # {(指标名, 标签): 数值}
+_histograms = {}  # {(指标名, 标签): [各桶计数, 总和, 次数]}
+_help = {}
+
+
+def describe(name: str, text: str) -> None:
+    """设置指标的说明，输出Prometheus格式时作为HELP行。"""
+    _help[name] = text
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    """计数器加value，标签通过关键字参数传入，如inc("smartedu_http_requests_total", host=..., status=...)。"""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name: str, value: float, **labels) -> None:
+    """向直方图记录一个观测值（秒）。"""
+    key = _key(name, labels)
+    with _lock:
+        entry = _histograms.get(key)
+        if entry is None:
+            entry = _histograms[key] = [[0] * len(DEFAULT_BUCKETS), 0.0, 0]
+        for index, bound in enumerate(DEFAULT_BUCKETS):
+            if value <= bound:
+                entry[0][index] += 1
+        entry[1] += value
+        entry[2] += 1
+
+
+@contextmanager
+def timer(name: str, **labels):
+    """记录with块的耗时。"""
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        observe(name, time.monotonic() - started, **labels)
+
+
+def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    escaped = (f'{key}="{_escape(value)}"' for key, value in items)
+    return "{" + ",".join(escaped) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render_prometheus() -> str:
+    """以Prometheus文本格式输出所有指标。"""
+    lines = []
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((key, (list(entry[0]), entry[1], entry[2])) for key, entry in _histograms.items())
+
+    last_name = None
+    for (name, labels), value in counters:
+        if name != last_name:
+            if name in _help:
+                lines.append(f"# HELP {name} {_help[name]}")
+            lines.append(f"# TYPE {name} counter")
+            last_name = name
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    for (name, labels), (buckets, total, count) in histograms:
+        if name != last_name:
+            if name in _help:
+                lines.append(f"# HELP {name} {_help[name]}")
+            lines.append(f"# TYPE {name} histogram")
+            last_name = name
+        for bound, bucket_count in zip(DEFAULT_BUCKETS, buckets):
+            lines.append(f"{name}_bucket{_format_labels(labels, (('le', str(bound)),))} {bucket_count}")
+        lines.append(f"{name}_bucket{_format_labels(labels, (('le', '+Inf'),))} {count}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+        lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def to_dict() -> dict:
+    """以便于JSON序列化的形式返回所有指标。"""
+    with _lock:
+        return {
+            "updated_at": time.time(),
+            "counters": [{"name": name, "labels": dict(labels), "value": value}
+                         for (name, labels), value in sorted(_counters.items())],
+            "histograms": [{"name": name, "labels": dict(labels),
+                            "buckets": dict(zip(map(str, DEFAULT_BUCKETS), entry[0])),
+                            "sum": entry[1], "count": entry[2]}
+                           for (name, labels), entry in sorted(_histograms.items())]
+        }
+
+
+def write_json(path: str) -> None:
+    """把所有指标写入JSON文件，先写临时文件再替换，读取方不会读到半个文件。"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        json.dump(to_dict(), file, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+
+def reset() -> None:
+    """清空所有指标。"""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] == "/metrics":
+            body = render_prometheus().encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif self.path.split("?")[0] == "/metrics.json":
+            body = json.dumps(to_dict(), ensure_ascii=False).encode("utf-8")
+            content_type = "application/json; charset=utf-8"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """在后台线程中启动指标接口，/metrics为Prometheus文本格式，/metrics.json为JSON格式。"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_json_flusher(interval: float) -> threading.Thread:
+    """在后台线程中每隔interval秒把指标写入config.METRICS_FILE，进程退出时再写一次。"""
+    def flush_forever():
+        while True:
+            time.sleep(interval)
+            flush()
+
+    atexit.register(flush)
+    thread = threading.Thread(target=flush_forever, daemon=True)
+    thread.start()
+    return thread
+
+
+def flush() -> None:
+    """配置了config.METRICS_FILE时立即写入一次，用于os._exit等不会执行atexit的退出方式之前。"""
+    if config.METRICS_FILE:
+        try:
+            write_json(config.METRICS_FILE)
+        except OSError as e:
+            print(f"写入指标文件 {config.METRICS_FILE} 失败: {e}")
+
+
+def start() -> None:
+    """按配置启动指标输出：config.METRICS_PORT不为0时提供HTTP接口，config.METRICS_FILE不为空时定期写入文件。"""
+    if config.METRICS_PORT:
+        try:
+            start_http_server(config.METRICS_PORT)
+            print(f"指标接口: http://127.0.0.1:{config.METRICS_PORT}/metrics")
+        except OSError as e:
+            print(f"指标接口启动失败: {e}")
+    if config.METRICS_FILE:
+        start_json_flusher(config.METRICS_INTERVAL)
+
+
+describe("smartedu_http_requests_total", "按主机和状态码统计的HTTP请求数，请求异常时status为error")
+describe("smartedu_http_request_seconds", "HTTP请求耗时（stream请求为收到响应头的耗时）")
+describe("smartedu_download_bytes_total", "下载的字节数，kind为document或segment")
+describe("smartedu_segment_fetch_seconds", "单个TS片段下载耗时")
+describe("smartedu_segment_decrypt_seconds", "单个TS片段解密耗时")
+describe("smartedu_segment_write_seconds", "单个TS片段写入输出文件的耗时")
+describe("smartedu_segment_retries_total", "TS片段下载重试次数")
+describe("smartedu_video_merge_seconds", "视频片段全部写入后关闭并重命名输出文件的耗时")
+describe("smartedu_downloads_total", "完成或失败的下载数，kind为document或video")
+describe("smartedu_cache_events_total", "缓存命中情况，cache为metadata、resolution、keys或store")
+describe("smartedu_dedup_bytes_saved_total", "本地存储节省的字节数，kind为network（少下载）或disk（少占用磁盘）")
+describe("smartedu_sync_items_total", "增量同步时跳过（skipped）和需要下载（fetched）的条目数")
+describe("smartedu_job_items_total", "任务队列中加入（added）、完成（done）、失败后待重试（pending）和最终失败（failed）的条目数")
+describe("smartedu_crawl_pages_total", "目录抓取时已抓取的分页数")
+describe("smartedu_crawl_items_total", "目录抓取时处理完成或失败的条目数")
+describe("smartedu_add_to_center_total", "add_to_center请求结果")
+describe("smartedu_courseware_resolve_seconds", "通过文档中心解析单个课件下载链接的耗时")
+describe("smartedu_courseware_resolutions_total", "通过文档中心解析课件下载链接的结果")
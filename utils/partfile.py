@@ -0,0 +1,122 @@
+import os
+import json
+import time
+import threading
+from utils import config
+
+
+class PartFileState:
+    """
+    未完成下载的记录，以JSON格式保存在 <文件名>.part.json 中，与 <文件名>.part 配套使用。
+
+    记录下载地址、服务器返回的ETag/Last-Modified、文件总大小和已写入的字节数。
+    分段下载时还会记录每一段的起止位置及已写入字节数。数据文件以无缓冲方式写入，
+    记录中的字节数不会超过实际落盘的数据，进程意外退出后可以据此继续下载。
+    """
+
+    def __init__(self, part_path: str, url: str):
+        self.part_path = part_path
+        self.url = url
+        self.etag = None
+        self.last_modified = None
+        self.size = None
+        self.bytes_written = 0
+        self.ranges = None  # [[起始位置, 结束位置, 已写入字节数], ...]
+        self._last_save = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state_path(self) -> str:
+        return self.part_path + ".json"
+
+    @classmethod
+    def load(cls, part_path: str, url: str):
+        """
+        读取未完成下载的记录。没有记录、记录损坏、下载地址不同或.part文件已丢失时，
+        清理残留文件并返回一个新的空记录。
+        """
+        state = cls(part_path, url)
+        if not os.path.exists(state.state_path) or not os.path.exists(part_path):
+            state.remove()
+            return state
+        try:
+            with open(state.state_path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            state.remove()
+            return cls(part_path, url)
+        if data.get("url") != url:
+            state.remove()
+            return state
+
+        state.etag = data.get("etag")
+        state.last_modified = data.get("last_modified")
+        state.size = data.get("size")
+        state.ranges = data.get("ranges")
+        # 记录中的字节数不能超过实际文件长度
+        state.bytes_written = min(data.get("bytes_written", 0), os.path.getsize(part_path))
+        return state
+
+    def matches(self, headers) -> bool:
+        """
+        判断服务器返回的ETag/Last-Modified是否与记录一致，双方都没有校验信息时视为一致。
+        """
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+        if self.etag and etag:
+            return self.etag == etag
+        if self.last_modified and last_modified:
+            return self.last_modified == last_modified
+        return True
+
+    def if_range(self):
+        """续传请求中If-Range头的值，没有校验信息时返回None。"""
+        return self.etag or self.last_modified
+
+    def reset(self, headers, size: int = None, ranges: list = None) -> None:
+        """按新的服务器响应重新开始记录。"""
+        self.etag = headers.get("ETag")
+        self.last_modified = headers.get("Last-Modified")
+        self.size = size
+        self.bytes_written = 0
+        self.ranges = ranges
+
+    def add_bytes(self, count: int, range_index: int = None) -> None:
+        """
+        记录新写入的字节数，按config.CHECKPOINT_INTERVAL秒的间隔保存记录。
+        """
+        with self._lock:
+            if range_index is None:
+                self.bytes_written += count
+            else:
+                self.ranges[range_index][2] += count
+            if time.monotonic() - self._last_save >= config.CHECKPOINT_INTERVAL:
+                self._save_locked()
+
+    def save(self) -> None:
+        with self._lock:
+            self._save_locked()
+
+    def _save_locked(self) -> None:
+        data = {
+            "url": self.url,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "size": self.size,
+            "bytes_written": self.bytes_written,
+            "ranges": self.ranges
+        }
+        temp_path = self.state_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(data, file)
+        os.replace(temp_path, self.state_path)
+        self._last_save = time.monotonic()
+
+    def remove(self) -> None:
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+
+    def finish(self, full_path: str) -> None:
+        """下载完成后将.part文件原子地重命名为最终文件名，并删除记录。"""
+        os.replace(self.part_path, full_path)
+        self.remove()
@@ -0,0 +1,213 @@
+import os
+import re
+import json
+import time
+import pstats
+import cProfile
+import threading
+import contextvars
+from contextlib import contextmanager
+from utils import config
+
+# 当前链接的分析记录，download_content开始时设置，工作线程通过bind继承
+_current = contextvars.ContextVar("smartedu_profile", default=None)
+_file_counter = 0
+_file_lock = threading.Lock()
+
+
+class RunProfile:
+    """
+    一个链接从解析到下载完成的分阶段耗时记录。
+
+    每个阶段累计调用次数、墙钟时间、CPU时间（调用线程的thread_time）和处理的字节数。
+    多个线程并发执行的阶段，耗时为各线程之和，可能超过链接的总耗时。
+    """
+
+    def __init__(self, label: str, use_cprofile: bool = False):
+        self.label = label
+        self.use_cprofile = use_cprofile
+        self.started = time.monotonic()
+        self.started_cpu = time.process_time()
+        self.wall = None
+        self.cpu = None
+        self._stages = {}  # {阶段名: [调用次数, 墙钟时间, CPU时间, 字节数]}
+        self._profiles = []
+        self._lock = threading.Lock()
+
+    def add(self, name: str, wall: float, cpu: float = 0.0, size: int = 0, calls: int = 1) -> None:
+        with self._lock:
+            entry = self._stages.get(name)
+            if entry is None:
+                entry = self._stages[name] = [0, 0.0, 0.0, 0]
+            entry[0] += calls
+            entry[1] += wall
+            entry[2] += cpu
+            entry[3] += size
+
+    def run_task(self, func, *args, **kwargs):
+        """执行func，启用cProfile时为该线程单独采样，结束后合并到汇总结果中"""
+        if not self.use_cprofile:
+            return func(*args, **kwargs)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # 当前线程已有其他分析器（或解释器只允许一个分析器）时不再重复采样
+            return func(*args, **kwargs)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.disable()
+            with self._lock:
+                self._profiles.append(profile)
+
+    def finish(self) -> None:
+        self.wall = time.monotonic() - self.started
+        # process_time包含同一时间段内其他链接的CPU时间，仅作参考
+        self.cpu = time.process_time() - self.started_cpu
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            stages = sorted(self._stages.items(), key=lambda item: item[1][1], reverse=True)
+        return {
+            "url": self.label,
+            "wall_seconds": self.wall,
+            "cpu_seconds": self.cpu,
+            "stages": [{"stage": name, "calls": calls, "wall_seconds": wall, "cpu_seconds": cpu, "bytes": size}
+                       for name, (calls, wall, cpu, size) in stages]
+        }
+
+    def print_report(self) -> None:
+        data = self.to_dict()
+        print("-------------------------------------------------------------")
+        print(f"性能分析：{data['url']}")
+        print(f"总耗时 {data['wall_seconds']:.3f} 秒，进程CPU时间 {data['cpu_seconds']:.3f} 秒"
+              f"（并发阶段的耗时为各线程之和）")
+        print(f"{'阶段':<22}{'次数':>8}{'耗时(s)':>11}{'CPU(s)':>10}{'字节数':>14}{'MB/s':>9}")
+        for stage in data["stages"]:
+            rate = stage["bytes"] / stage["wall_seconds"] / 1024 / 1024 if stage["bytes"] and stage["wall_seconds"] else 0
+            print(f"{stage['stage']:<24}{stage['calls']:>8}{stage['wall_seconds']:>11.3f}"
+                  f"{stage['cpu_seconds']:>10.3f}{stage['bytes']:>14}{rate:>9.2f}")
+
+    def print_cprofile(self, limit: int = 20) -> None:
+        stats = self.cprofile_stats()
+        if stats is not None:
+            print(f"cProfile（按累计时间排序，前{limit}项）:")
+            stats.sort_stats("cumulative").print_stats(limit)
+
+    def cprofile_stats(self):
+        with self._lock:
+            profiles = list(self._profiles)
+        if not profiles:
+            return None
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        return stats
+
+    def save(self, directory: str) -> str:
+        """把分析结果写入 <directory>/<时间>-<序号>-<链接摘要>.json，有cProfile结果时另存同名.prof文件"""
+        global _file_counter
+        os.makedirs(directory, exist_ok=True)
+        with _file_lock:
+            _file_counter += 1
+            counter = _file_counter
+        slug = re.sub(r'[^0-9A-Za-z]+', '_', self.label)[-48:].strip('_')
+        base = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{counter}-{slug}")
+        with open(base + ".json", "w", encoding="utf-8") as file:
+            json.dump(self.to_dict(), file, ensure_ascii=False, indent=2)
+        stats = self.cprofile_stats()
+        if stats is not None:
+            stats.dump_stats(base + ".prof")
+        return base + ".json"
+
+
+def begin(label: str):
+    """
+    开始记录一个链接，未启用config.PROFILE时返回None。
+
+    返回的记录需要传给end，期间当前线程以及通过bind提交的任务中的stage都会记入该记录。
+    """
+    if not config.PROFILE:
+        return None
+    profile = RunProfile(label, bool(config.PROFILE_CPROFILE))
+    token = _current.set(profile)
+    cprofile = None
+    if profile.use_cprofile:
+        cprofile = cProfile.Profile()
+        try:
+            cprofile.enable()
+        except ValueError:
+            cprofile = None
+    return profile, token, cprofile
+
+
+def end(handle) -> None:
+    """结束记录，打印各阶段耗时，配置了config.PROFILE_DIR时保存到文件"""
+    if handle is None:
+        return
+    profile, token, cprofile = handle
+    if cprofile is not None:
+        cprofile.disable()
+        with profile._lock:
+            profile._profiles.append(cprofile)
+    _current.reset(token)
+    profile.finish()
+    profile.print_report()
+    if config.PROFILE_DIR:
+        try:
+            print(f"性能分析结果已保存至 {profile.save(config.PROFILE_DIR)}")
+        except OSError as e:
+            print(f"保存性能分析结果失败: {e}")
+    else:
+        profile.print_cprofile()
+
+
+class _Stage:
+    __slots__ = ("bytes",)
+
+    def __init__(self):
+        self.bytes = 0
+
+
+@contextmanager
+def stage(name: str, size: int = 0):
+    """
+    记录with块的耗时，处理的字节数在开始时不知道的可以在块内设置：
+        with profiling.stage("segment_fetch") as s:
+            ...
+            s.bytes = len(data)
+    """
+    profile = _current.get()
+    entry = _Stage()
+    entry.bytes = size
+    if profile is None:
+        yield entry
+        return
+    started, started_cpu = time.monotonic(), time.thread_time()
+    try:
+        yield entry
+    finally:
+        profile.add(name, time.monotonic() - started, time.thread_time() - started_cpu, entry.bytes)
+
+
+def record(name: str, wall: float, cpu: float = 0.0, size: int = 0) -> None:
+    """直接记录一次阶段耗时，用于asyncio协程等无法用thread_time统计CPU时间的情况"""
+    profile = _current.get()
+    if profile is not None:
+        profile.add(name, wall, cpu, size)
+
+
+def bind(func):
+    """
+    让提交到线程池的函数也记入当前链接的分析记录，并继承当前线程的其他上下文（如服务模式中链接的下载进度）。
+    """
+    context = contextvars.copy_context()
+    profile = _current.get()
+
+    def run(*args, **kwargs):
+        # 每次调用使用各自的上下文副本，同一函数可以在多个线程中同时执行
+        if profile is None:
+            return context.copy().run(func, *args, **kwargs)
+        return context.copy().run(profile.run_task, func, *args, **kwargs)
+    return run
@@ -0,0 +1,77 @@
+import threading
+import contextvars
+from contextlib import contextmanager
+from utils.tool import to_int
+
+# 当前链接的进度记录，由服务模式在处理链接前设置，工作线程通过profiling.bind继承
+_current = contextvars.ContextVar("smartedu_progress", default=None)
+
+
+class Progress:
+    """
+    一个链接的下载进度：已解析的条目及其状态，以及已下载的字节数。
+
+    条目按保存路径、文件名和下载地址区分，失败后重试成功的条目只计为完成一次。
+    """
+
+    def __init__(self):
+        self._items = {}  # {条目标识: [状态, 文件大小]}
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def queued(self, item: dict) -> None:
+        with self._lock:
+            self._items.setdefault(_item_key(item), ["pending", to_int(item.get("file_size")) or 0])
+
+    def finished(self, item: dict, ok: bool) -> None:
+        with self._lock:
+            entry = self._items.setdefault(_item_key(item), ["pending", to_int(item.get("file_size")) or 0])
+            entry[0] = "done" if ok else "failed"
+
+    def add_bytes(self, count: int) -> None:
+        with self._lock:
+            self.bytes += count
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            states = [state for state, _ in self._items.values()]
+            return {
+                "items": len(states),
+                "items_done": states.count("done"),
+                "items_failed": states.count("failed"),
+                "bytes": self.bytes,
+                # 解析结果中记录的文件大小之和，视频等没有大小的条目不计入
+                "bytes_expected": sum(size for _, size in self._items.values())
+            }
+
+
+def _item_key(item: dict) -> tuple:
+    return item["path"], item["file_name"], item["file_url"]
+
+
+@contextmanager
+def track(progress: Progress):
+    """with块内（包括通过profiling.bind提交的任务）的条目和字节数记入progress"""
+    token = _current.set(progress)
+    try:
+        yield progress
+    finally:
+        _current.reset(token)
+
+
+def queued(item: dict) -> None:
+    progress = _current.get()
+    if progress is not None:
+        progress.queued(item)
+
+
+def finished(item: dict, ok: bool) -> None:
+    progress = _current.get()
+    if progress is not None:
+        progress.finished(item, ok)
+
+
+def add_bytes(count: int) -> None:
+    progress = _current.get()
+    if progress is not None:
+        progress.add_bytes(count)
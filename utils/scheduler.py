@@ -0,0 +1,189 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from utils import config, cancellation
+
+
+class VideoTask:
+    """
+    调度器中的一个视频：连续的待下载片段编号，以及已派发但尚未结束的片段数。
+
+    每个派发出去的片段最终必须调用一次complete（已写入）或fail（出错）。
+    """
+
+    def __init__(self, scheduler: "SegmentScheduler", indexes: list, fetch, written, window: int):
+        self.scheduler = scheduler
+        self.indexes = list(indexes)
+        self.fetch = fetch
+        self.written = written
+        self.window = max(1, window)
+        self.position = 0  # 下一个待派发片段在indexes中的位置
+        self.outstanding = 0
+        self.error = None
+        self._done = threading.Event()
+        if not self.indexes:
+            self._done.set()
+
+    def held(self) -> int:
+        """已派发但还没写入文件的片段数，即这个视频在重排缓冲区中占用的位置"""
+        if self.position < len(self.indexes):
+            next_index = self.indexes[self.position]
+        else:
+            next_index = self.indexes[-1] + 1
+        return max(0, next_index - self.written())
+
+    def complete(self) -> None:
+        """一个片段已写入，重排缓冲区前移后可能有新的片段可以派发"""
+        self.scheduler._finish_segment(self)
+
+    def fail(self, error: BaseException) -> None:
+        """一个片段出错，视频不再派发新的片段，已派发的片段结束后wait抛出该错误"""
+        self.scheduler._finish_segment(self, error)
+
+    def wait(self) -> None:
+        """等待所有片段结束，有片段出错时抛出第一个错误，当前链接已被取消时抛出cancellation.Cancelled"""
+        # 分段等待，Windows上没有超时的等待不能被Ctrl+C中断
+        while not self._done.wait(0.5):
+            cancellation.check()
+        if self.error is not None:
+            raise self.error
+
+    def cancel(self, error: BaseException) -> None:
+        """停止派发新的片段，并等待已派发的片段结束"""
+        self.scheduler._cancel(self, error)
+        while not self._done.wait(0.5):
+            pass
+
+
+class SegmentScheduler:
+    """
+    全局片段调度器：一组常驻的下载线程从所有正在下载的视频中取片段，视频之间不再各自创建和销毁线程池。
+
+    下载线程按视频提交的顺序优先下载较早提交的视频；该视频的下一个片段超出其重排缓冲区范围（前面的片段还没写入）时，
+    改为下载后面视频的片段，因此短视频收尾或某个片段较慢时，配置的并发数仍能用满。
+    所有视频已派发但未写入的片段总数不超过budget，内存中暂存的片段数量不随同时调度的视频数增长；
+    每个视频最多占用budget在尚未结束的视频之间的平均份额（至少1个），一个视频的片段卡住时不会占满budget而让其他视频都停下。
+    每个视频内部仍按顺序派发片段，由各自的OrderedSegmentWriter按播放列表顺序写入。
+    解密线程池同样由所有视频共用。
+    """
+
+    def __init__(self, workers: int, budget: int):
+        """
+        参数:
+            workers (int): 常驻下载线程数，实际同时在途的请求数由片段并发控制器决定。
+            budget (int): 所有视频共用的重排缓冲区大小（片段数），不小于workers。
+        """
+        self.workers = max(1, workers)
+        self.budget = max(self.workers, budget)
+        self._videos = []  # 还有片段待派发的视频，按提交顺序排列
+        self._tasks = []  # 尚未结束的视频，其中已派发的片段可能还占用着重排缓冲区
+        self._condition = threading.Condition()
+        self._threads = []
+        self._decrypt_executor = None
+        self.videos = 0
+        self.dispatched = 0
+        self._active = 0
+        self.peak_videos = 0  # 最多同时在调度中的视频数
+
+    def submit(self, indexes, fetch, written, window: int) -> VideoTask:
+        """
+        提交一个视频的片段。
+
+        参数:
+            indexes (iterable): 按顺序排列的连续的待下载片段编号。
+            fetch (callable): 在下载线程中下载一个片段，参数为(VideoTask, 片段编号)；
+                              写入后调用VideoTask.complete，抛出异常时由调度器调用VideoTask.fail。
+            written (callable): 返回下一个待写入文件的片段编号，之前的片段均已写入。
+            window (int): 这个视频的重排缓冲区大小，已派发但未写入的片段达到该数量或budget的平均份额时
+                          暂不派发（写入不会阻塞），实际取值不超过budget。
+
+        返回:
+            VideoTask: 调用wait等待视频下载结束。
+        """
+        task = VideoTask(self, indexes, fetch, written, min(window, self.budget))
+        if task.indexes:
+            with self._condition:
+                self._start_locked()
+                self._videos.append(task)
+                self._tasks.append(task)
+                self.videos += 1
+                self._active += 1
+                self.peak_videos = max(self.peak_videos, self._active)
+                self._condition.notify_all()
+        return task
+
+    def decrypt_executor(self) -> ThreadPoolExecutor:
+        """所有视频共用的解密线程池"""
+        with self._condition:
+            if self._decrypt_executor is None:
+                self._decrypt_executor = ThreadPoolExecutor(max_workers=max(1, config.DECRYPT_WORKERS),
+                                                            thread_name_prefix="segment-decrypt")
+            return self._decrypt_executor
+
+    def _start_locked(self) -> None:
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._run, name=f"segment-worker-{len(self._threads)}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _next_locked(self):
+        """按提交顺序取第一个下一片段已可下载的视频，返回(VideoTask, 片段编号)，没有时返回None"""
+        if not self._videos or sum(task.held() for task in self._tasks) >= self.budget:
+            return None
+        share = max(1, self.budget // len(self._tasks))
+        for task in self._videos:
+            if task.held() >= min(task.window, share):
+                continue
+            index = task.indexes[task.position]
+            task.position += 1
+            task.outstanding += 1
+            if task.position == len(task.indexes):
+                self._videos.remove(task)
+            self.dispatched += 1
+            return task, index
+        return None
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                picked = self._next_locked()
+                while picked is None:
+                    self._condition.wait()
+                    picked = self._next_locked()
+            task, index = picked
+            try:
+                task.fetch(task, index)
+            except BaseException as e:
+                task.fail(e)
+
+    def _finish_segment(self, task: VideoTask, error: BaseException = None) -> None:
+        with self._condition:
+            task.outstanding -= 1
+            if error is not None:
+                self._stop_locked(task, error)
+            if task.outstanding == 0 and (task.error is not None or task.position == len(task.indexes)):
+                self._done_locked(task)
+            # 有片段写入后，等待中的线程重新检查各视频的重排缓冲区
+            self._condition.notify_all()
+
+    def _cancel(self, task: VideoTask, error: BaseException) -> None:
+        with self._condition:
+            self._stop_locked(task, error)
+            if task.outstanding == 0:
+                self._done_locked(task)
+
+    def _done_locked(self, task: VideoTask) -> None:
+        if not task._done.is_set():
+            task._done.set()
+            self._tasks.remove(task)
+            self._active -= 1
+
+    def _stop_locked(self, task: VideoTask, error: BaseException) -> None:
+        if task.error is None:
+            task.error = error
+        if task in self._videos:
+            self._videos.remove(task)
+
+    def print_stats(self) -> None:
+        if not self.dispatched:
+            return
+        print(f"片段调度：{self.videos} 个视频共下载 {self.dispatched} 个片段，最多同时调度 {self.peak_videos} 个视频")
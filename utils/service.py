@@ -0,0 +1,285 @@
+import os
+import json
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from utils import config, metrics
+from utils.progress import Progress, track
+from utils.cancellation import Cancelled
+
+# 单个链接的状态
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+
+class Job:
+    """一次提交的下载任务，包含一个或多个链接，每个链接单独记录状态。"""
+
+    def __init__(self, urls: list, user_data: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.urls = urls
+        self.user_data = user_data
+        self.states = [QUEUED] * len(urls)
+        self.progress = [Progress() for _ in urls]
+        self.futures = []
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+
+    @property
+    def finished(self) -> bool:
+        return all(state in FINISHED_STATES for state in self.states)
+
+    @property
+    def status(self) -> str:
+        if self.finished:
+            if FAILED in self.states:
+                return FAILED
+            # 取消前已下载完成的链接不算取消
+            return CANCELLED if CANCELLED in self.states else DONE
+        if RUNNING in self.states or any(state in FINISHED_STATES for state in self.states):
+            return RUNNING
+        return QUEUED
+
+    def to_dict(self) -> dict:
+        counts = {state: self.states.count(state) for state in (QUEUED, RUNNING, DONE, FAILED, CANCELLED)}
+        url_progress = [progress.to_dict() for progress in self.progress]
+        # 条目和字节进度为各链接之和
+        totals = {key: sum(entry[key] for entry in url_progress)
+                  for key in ("items", "items_done", "items_failed", "bytes", "bytes_expected")}
+        return {
+            "id": self.id,
+            "status": self.status,
+            "progress": {"total": len(self.urls), **counts, **totals},
+            "urls": [{"url": url, "status": state, "progress": entry}
+                     for url, state, entry in zip(self.urls, self.states, url_progress)],
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+
+
+class JobManager:
+    """
+    在同一个进程中执行所有客户端提交的下载任务。
+
+    所有任务的链接进入同一个线程池（config.BATCH_WORKERS个线程），按提交顺序执行，
+    共用连接池、各类缓存、片段并发控制和全局限速。
+    """
+
+    def __init__(self, user_data: str, app_id: str, workers: int = None):
+        """
+        参数:
+            user_data (str): 默认的用户身份验证信息，提交任务时未提供时使用。
+            app_id (str): APP-ID。
+            workers (int, optional): 同时处理的链接数，默认使用config.BATCH_WORKERS。
+        """
+        self.user_data = user_data
+        self.app_id = app_id
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers or config.BATCH_WORKERS))
+
+    def submit(self, urls: list, user_data: str = None) -> Job:
+        job = Job(urls, user_data or self.user_data)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune_locked()
+            job.futures = [self._executor.submit(self._run, job, index) for index in range(len(urls))]
+        print(f"已接收任务 {job.id}，共 {len(urls)} 个链接")
+        return job
+
+    def _run(self, job: Job, index: int) -> None:
+        from utils.command import download_content
+
+        with self._lock:
+            if job.states[index] != QUEUED:
+                return
+            job.states[index] = RUNNING
+            if job.started_at is None:
+                job.started_at = time.time()
+
+        url = job.urls[index]
+        print("-------------------------------------------------------------")
+        print(f"[任务 {job.id}] 开始处理 {url}")
+        cancelled = False
+        try:
+            with track(job.progress[index]):
+                ok = download_content(url, job.user_data, self.app_id, cancel=job.cancel_event)
+        except Cancelled:
+            print(f"[任务 {job.id}] 已取消 {url}，未完成的部分可在下次提交时继续")
+            ok, cancelled = False, True
+        except Exception as e:
+            print(f"处理 {url} 时发生错误: {e}")
+            ok = False
+
+        with self._lock:
+            if cancelled or (not ok and job.cancel_event.is_set()):
+                job.states[index] = CANCELLED
+            else:
+                job.states[index] = DONE if ok else FAILED
+            if job.finished:
+                job.finished_at = time.time()
+                print(f"任务 {job.id} 已结束：{job.status}")
+
+    def get(self, job_id: str):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.to_dict() if job is not None else None
+
+    def list_jobs(self) -> list:
+        with self._lock:
+            return [job.to_dict() for job in self._jobs.values()]
+
+    def cancel(self, job_id: str):
+        """
+        取消任务：尚未开始的链接不再处理，正在下载的链接在下一个数据块或片段处停止（未完成的部分可在下次提交时续传）。
+        正在下载的链接停止后状态才变为cancelled。
+
+        返回:
+            dict 或 None: 任务状态，任务不存在时返回None。
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job.cancel_event.set()
+            for index, future in enumerate(job.futures):
+                if job.states[index] == QUEUED:
+                    future.cancel()
+                    job.states[index] = CANCELLED
+            if job.finished and job.finished_at is None:
+                job.finished_at = time.time()
+            return job.to_dict()
+
+    def _prune_locked(self) -> None:
+        """已结束的任务超过config.SERVICE_MAX_JOBS个时，删除最早的记录"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - config.SERVICE_MAX_JOBS)]:
+            del self._jobs[job_id]
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class _ServiceHandler(BaseHTTPRequestHandler):
+    manager = None
+
+    def do_GET(self):
+        parts = self._path_parts()
+        if parts == ["jobs"]:
+            self._send_json(200, {"jobs": self.manager.list_jobs()})
+        elif len(parts) == 2 and parts[0] == "jobs":
+            job = self.manager.get(parts[1])
+            if job is None:
+                self._send_json(404, {"error": "任务不存在"})
+            else:
+                self._send_json(200, job)
+        elif parts == ["health"]:
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_json(404, {"error": "接口不存在"})
+
+    def do_POST(self):
+        parts = self._path_parts()
+        if parts == ["jobs"]:
+            self._submit()
+        elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "cancel":
+            self._cancel(parts[1])
+        else:
+            self._send_json(404, {"error": "接口不存在"})
+
+    def do_DELETE(self):
+        parts = self._path_parts()
+        if len(parts) == 2 and parts[0] == "jobs":
+            self._cancel(parts[1])
+        else:
+            self._send_json(404, {"error": "接口不存在"})
+
+    def _submit(self):
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": "请求内容不是有效的JSON格式"})
+            return
+        if not isinstance(body, dict):
+            self._send_json(400, {"error": "请求内容应为JSON对象"})
+            return
+
+        urls = body.get("urls") or ([body["url"]] if body.get("url") else [])
+        if not isinstance(urls, list) or not all(isinstance(url, str) for url in urls):
+            self._send_json(400, {"error": "urls应为字符串列表"})
+            return
+        # 去除空白行，"exit"在交互模式中表示退出程序，服务模式下不接受
+        urls = [url.strip() for url in urls if url.strip() and url.strip() != "exit"]
+        if not urls:
+            self._send_json(400, {"error": "请提供url或urls"})
+            return
+
+        job = self.manager.submit(urls, body.get("user_data"))
+        self._send_json(201, self.manager.get(job.id))
+
+    def _cancel(self, job_id: str):
+        job = self.manager.cancel(job_id)
+        if job is None:
+            self._send_json(404, {"error": "任务不存在"})
+        else:
+            self._send_json(200, job)
+
+    def _path_parts(self) -> list:
+        return [part for part in self.path.split("?")[0].split("/") if part]
+
+    def _send_json(self, status: int, data) -> None:
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def create_server(manager: JobManager, host: str = None, port: int = None) -> ThreadingHTTPServer:
+    """创建任务接口服务器，尚未开始处理请求。"""
+    handler = type("ServiceHandler", (_ServiceHandler,), {"manager": manager})
+    server = ThreadingHTTPServer((host or config.SERVICE_HOST, config.SERVICE_PORT if port is None else port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def serve(user_data: str, app_id: str, host: str = None, port: int = None) -> None:
+    """
+    以服务模式运行：在本地提供任务接口，直到按Ctrl+C退出。
+
+    接口:
+        POST   /jobs               提交任务，内容为{"url": "..."}或{"urls": [...]}，可附带"user_data"
+        GET    /jobs               查看所有任务
+        GET    /jobs/<id>          查看任务状态和进度（链接数、条目数和已下载的字节数）
+        POST   /jobs/<id>/cancel   取消任务（DELETE /jobs/<id> 同样有效）
+    """
+    from utils.command import print_run_stats
+
+    manager = JobManager(user_data, app_id)
+    server = create_server(manager, host, port)
+    address, bound_port = server.server_address[:2]
+    print("-------------------------------------------------------------")
+    print(f"服务模式已启动，任务接口: http://{address}:{bound_port}/jobs")
+    print("按 Ctrl+C 退出")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    manager.shutdown()
+    print_run_stats()
+    metrics.flush()
+    print("退出程序")
+    # 与交互模式的exit一致，不等待正在下载的链接，未完成的部分下次可续传
+    os._exit(0)
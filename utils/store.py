@@ -0,0 +1,287 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+from utils import config, metrics
+from utils.tool import to_int
+
+# Linux上的FICLONE ioctl，在支持写时复制的文件系统（btrfs、xfs等）上克隆文件
+_FICLONE = 0x40049409
+
+
+class ContentStore:
+    """
+    内容寻址的本地文件存储，避免同一文件被重复下载和重复占用磁盘。
+
+    下载完成的文件按SHA-256保存在 <存储目录>/objects/<前两位>/<摘要> 中，并在index.json中记录
+    下载地址、文件大小和摘要。再次下载同一地址（且大小一致）的文件时，直接从存储中复制到目标位置，
+    不发起网络请求。
+
+    默认使用写时复制（reflink），支持的文件系统上内容相同的文件只占用一份磁盘空间，且各副本互不影响；
+    config.DEDUP_LINK为"hardlink"时所有副本共用同一份数据，修改其中一个文件会影响其他文件，因此恢复前会校验数据的SHA-256。
+    不能以这两种方式链接时，除非config.DEDUP_LINK为"copy"，文件不加入存储，避免每个文件在存储中再占一份磁盘空间。
+    存储的数据总大小超过config.DEDUP_MAX_BYTES时，按最近使用时间淘汰最久未用的数据。
+    """
+
+    def __init__(self, directory: str = None):
+        self._directory = directory
+        self._index = None  # {下载地址: {"sha256": 摘要, "size": 字节数, "updated_at": 时间, "used_at": 最近使用时间}}
+        self._lock = threading.Lock()
+        self._url_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0  # 少下载的字节数
+        self.disk_saved = 0  # 因内容相同而少占用的磁盘字节数
+
+    @property
+    def directory(self) -> str:
+        return self._directory or config.DEDUP_DIR or os.path.join(config.CACHE_DIR, "store")
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.directory, "index.json")
+
+    def object_path(self, digest: str) -> str:
+        return os.path.join(self.directory, "objects", digest[:2], digest)
+
+    def _load_locked(self) -> None:
+        if self._index is not None:
+            return
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as file:
+                self._index = json.load(file)
+        except (OSError, ValueError):
+            self._index = {}
+
+    def _save_locked(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(self._index, file)
+        os.replace(temp_path, self.index_path)
+
+    def lock_for(self, url: str) -> threading.Lock:
+        """同一地址同时只允许一个线程下载，其他线程等待后直接从存储中链接。"""
+        with self._lock:
+            return self._url_locks.setdefault(url, threading.Lock())
+
+    def lookup(self, url: str, size=None):
+        """
+        查找地址对应的已存储文件。
+
+        参数:
+            size (int, optional): 资源信息中记录的文件大小，与存储的大小不一致时视为文件已更新。
+
+        返回:
+            str 或 None: 存储中文件的路径，没有或已失效时返回None。
+        """
+        with self._lock:
+            self._load_locked()
+            entry = self._index.get(url)
+        if entry is None:
+            return None
+        if size is not None and to_int(size) not in (None, entry["size"]):
+            return None
+        path = self.object_path(entry["sha256"])
+        try:
+            if os.path.getsize(path) != entry["size"]:
+                return None
+        except OSError:
+            return None
+        return path
+
+    def restore(self, url: str, target: str, size=None) -> bool:
+        """
+        存储中有该地址的文件时，把它链接到target（已存在的target会被替换）。
+
+        返回:
+            bool: 是否已从存储中得到文件，返回False时需要正常下载。
+        """
+        if not config.DEDUP:
+            return False
+        path = self.lookup(url, size)
+        if path is not None and config.DEDUP_LINK == "hardlink" and not self._verify(path):
+            path = None
+        if path is None:
+            self._count("misses")
+            return False
+        try:
+            if not (os.path.exists(target) and os.path.samefile(path, target)):
+                os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+                link_file(path, target)
+        except OSError as e:
+            print(f"从本地存储链接文件失败，重新下载: {e}")
+            self._count("misses")
+            return False
+
+        saved = os.path.getsize(path)
+        with self._lock:
+            entry = self._index.get(url)
+            if entry is not None:
+                entry["used_at"] = time.time()
+                self._save_locked()
+        self._count("hits", saved)
+        print(f"本地存储中已有该文件，未重新下载（节省 {saved / 1024 / 1024:.2f} MB）")
+        return True
+
+    def _verify(self, path: str) -> bool:
+        """
+        硬链接方式下，任何一个副本被原地修改都会改变存储中的数据，恢复前重新计算SHA-256；
+        内容已变化时删除该数据及指向它的记录，重新下载。
+        """
+        digest = os.path.basename(path)
+        try:
+            if file_digest(path)[0] == digest:
+                return True
+        except OSError:
+            return False
+        print("本地存储中的文件已被修改，重新下载。")
+        with self._lock:
+            self._load_locked()
+            for url in [url for url, entry in self._index.items() if entry["sha256"] == digest]:
+                del self._index[url]
+            self._save_locked()
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return False
+
+    def add(self, url: str, path: str) -> None:
+        """
+        把下载完成的文件加入存储。存储中已有相同内容时，path改为指向已有数据，释放重复占用的磁盘空间。
+        加入失败不影响已下载的文件。
+        """
+        if not config.DEDUP:
+            return
+        try:
+            digest, size = file_digest(path)
+            object_path = self.object_path(digest)
+            with self._lock:
+                if os.path.exists(object_path) and os.path.getsize(object_path) == size:
+                    # 复制方式下每个文件本来就各占一份空间，不需要替换
+                    if config.DEDUP_LINK != "copy" and not os.path.samefile(object_path, path):
+                        if link_file(object_path, path, copy=False) is not None:
+                            self.disk_saved += size
+                            metrics.inc("smartedu_dedup_bytes_saved_total", size, kind="disk")
+                else:
+                    os.makedirs(os.path.dirname(object_path), exist_ok=True)
+                    if link_file(path, object_path, copy=config.DEDUP_LINK == "copy") is None:
+                        # 只能复制时不加入存储，否则每个下载的文件都要在存储中再写一份
+                        return
+                self._load_locked()
+                now = time.time()
+                self._index[url] = {"sha256": digest, "size": size, "updated_at": now, "used_at": now}
+                self._evict_locked()
+                self._save_locked()
+        except OSError as e:
+            print(f"加入本地存储失败: {e}")
+
+    def _evict_locked(self) -> None:
+        """存储的数据总大小超过config.DEDUP_MAX_BYTES时，按最近使用时间删除最久未用的数据及指向它的记录"""
+        objects = {}  # {摘要: [最近使用时间, 字节数]}
+        for entry in self._index.values():
+            used_at = entry.get("used_at", entry["updated_at"])
+            item = objects.setdefault(entry["sha256"], [used_at, entry["size"]])
+            item[0] = max(item[0], used_at)
+        total = sum(size for _, size in objects.values())
+        if total <= config.DEDUP_MAX_BYTES:
+            return
+        evicted = set()
+        for digest in sorted(objects, key=lambda key: objects[key][0]):
+            if total <= config.DEDUP_MAX_BYTES:
+                break
+            total -= objects[digest][1]
+            evicted.add(digest)
+            try:
+                os.remove(self.object_path(digest))
+            except OSError:
+                pass
+        for url in [url for url, entry in self._index.items() if entry["sha256"] in evicted]:
+            del self._index[url]
+
+    def _count(self, result: str, saved: int = 0) -> None:
+        with self._lock:
+            if result == "hits":
+                self.hits += 1
+                self.bytes_saved += saved
+            else:
+                self.misses += 1
+        metrics.inc("smartedu_cache_events_total", cache="store", result=result)
+        if saved:
+            metrics.inc("smartedu_dedup_bytes_saved_total", saved, kind="network")
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "bytes_saved": self.bytes_saved, "disk_saved": self.disk_saved}
+
+    def print_stats(self) -> None:
+        if not self.hits + self.misses:
+            return
+        print(f"本地存储：命中 {self.hits} 次，未命中 {self.misses} 次，"
+              f"少下载 {self.bytes_saved / 1024 / 1024:.2f} MB，少占用磁盘 {self.disk_saved / 1024 / 1024:.2f} MB")
+
+
+def file_digest(path: str) -> tuple:
+    """计算文件的SHA-256，返回(十六进制摘要, 字节数)"""
+    sha256 = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as file:
+        while True:
+            chunk = file.read(1024 * 1024)
+            if not chunk:
+                break
+            sha256.update(chunk)
+            size += len(chunk)
+    return sha256.hexdigest(), size
+
+
+def link_file(source: str, target: str, copy: bool = True) -> str:
+    """
+    按config.DEDUP_LINK把source链接到target，不支持时依次退回写时复制和普通复制。
+    先链接到临时文件再替换，target不会出现不完整的状态。
+
+    参数:
+        copy (bool): 是否允许退回普通复制，为False时不能以硬链接或写时复制链接则返回None，target保持不变。
+
+    返回:
+        str 或 None: 实际使用的方式，"hardlink"、"reflink"或"copy"。
+    """
+    temp_path = target + ".link.tmp"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+
+    methods = {"hardlink": ("hardlink", "reflink", "copy"), "reflink": ("reflink", "copy")}
+    for method in methods.get(config.DEDUP_LINK, ("copy",)):
+        if method == "copy" and not copy:
+            return None
+        try:
+            if method == "hardlink":
+                os.link(source, temp_path)
+            elif method == "reflink":
+                _reflink(source, temp_path)
+            else:
+                shutil.copyfile(source, temp_path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            if method == "copy":
+                raise
+            continue
+        os.replace(temp_path, target)
+        return method
+
+
+def _reflink(source: str, target: str) -> None:
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError("当前系统不支持reflink")
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+
+
+content_store = ContentStore()
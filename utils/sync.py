@@ -0,0 +1,140 @@
+import os
+import json
+import time
+import threading
+from utils import config, metrics
+from utils.tool import to_int
+from utils.download import build_file_name
+
+
+def target_path(item: dict) -> str:
+    """条目下载完成后在本地的文件路径"""
+    if item["is_video"]:
+        return os.path.join(item["path"], f"{item['file_name']}.mp4")
+    return os.path.join(item["path"], build_file_name(item["file_url"], item["file_name"]))
+
+
+class SyncState:
+    """
+    增量同步记录，保存在缓存目录下的sync.json中，以本地文件路径为键。
+
+    每个下载完成的条目记录资源信息中的文件大小（custom_properties.size）、更新时间（update_time），
+    以及下载完成时本地文件的大小和修改时间。再次同步时，远程信息和本地文件都没有变化的条目直接跳过。
+    记录按config.CHECKPOINT_INTERVAL的间隔写入文件，每个链接处理结束时调用flush写入剩余的修改。
+    """
+
+    def __init__(self, path: str = None):
+        self._path = path
+        self._records = None  # {本地文件路径: {"size", "update_time", "local_size", "mtime", "synced_at"}}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_save = 0.0
+        self.skipped = 0
+        self.fetched = 0
+
+    @property
+    def path(self) -> str:
+        return self._path or os.path.join(config.CACHE_DIR, "sync.json")
+
+    def _load_locked(self) -> None:
+        if self._records is not None:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                self._records = json.load(file)
+        except (OSError, ValueError):
+            self._records = {}
+
+    def _save_locked(self, force: bool = False) -> None:
+        """
+        保存同步记录。记录较多时每次都重写整个文件开销很大，因此按config.CHECKPOINT_INTERVAL的间隔保存，
+        force为True时立即保存；间隔内的修改由flush写入。
+        """
+        self._dirty = True
+        if not force and time.monotonic() - self._last_save < config.CHECKPOINT_INTERVAL:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(self._records, file, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+        self._dirty = False
+        self._last_save = time.monotonic()
+
+    def flush(self) -> None:
+        """写入尚未保存的同步记录"""
+        with self._lock:
+            if self._dirty:
+                self._save_locked(force=True)
+
+    def is_current(self, item: dict) -> bool:
+        """
+        判断条目在本地是否已是最新：
+
+        - 有同步记录时，远程的文件大小和更新时间（双方都有时）与记录一致，且本地文件的大小和修改时间未变；
+        - 没有同步记录（如之前未开启同步时下载的文件）时，文档的本地大小与资源信息中的大小一致即视为完整，并补上记录。
+        """
+        if not item.get("file_url"):
+            return False
+        path = target_path(item)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        remote_size = to_int(item.get("file_size"))
+        update_time = item.get("update_time")
+
+        with self._lock:
+            self._load_locked()
+            record = self._records.get(path)
+            if record is None:
+                if item["is_video"] or remote_size is None or remote_size != stat.st_size:
+                    return False
+                self._records[path] = _make_record(remote_size, update_time, stat)
+                self._save_locked()
+                return True
+
+        if remote_size is not None and record["size"] is not None and remote_size != record["size"]:
+            return False
+        if update_time and record["update_time"] and update_time != record["update_time"]:
+            return False
+        return stat.st_size == record["local_size"] and stat.st_mtime == record["mtime"]
+
+    def record(self, item: dict) -> None:
+        """条目下载完成后更新同步记录"""
+        path = target_path(item)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        with self._lock:
+            self._load_locked()
+            self._records[path] = _make_record(to_int(item.get("file_size")), item.get("update_time"), stat)
+            self._save_locked()
+
+    def pending(self, items):
+        """过滤掉本地已是最新的条目，逐个产出需要下载的条目（items可以是边解析边产出的生成器）"""
+        for item in items:
+            if self.is_current(item):
+                with self._lock:
+                    self.skipped += 1
+                metrics.inc("smartedu_sync_items_total", result="skipped")
+                print(f"已是最新，跳过 {os.path.basename(target_path(item))}")
+            else:
+                with self._lock:
+                    self.fetched += 1
+                metrics.inc("smartedu_sync_items_total", result="fetched")
+                yield item
+
+    def print_stats(self) -> None:
+        if not self.skipped + self.fetched:
+            return
+        print(f"增量同步：跳过 {self.skipped} 个未变化的文件，下载 {self.fetched} 个新增或变化的文件")
+
+
+def _make_record(size, update_time, stat) -> dict:
+    return {"size": size, "update_time": update_time, "local_size": stat.st_size,
+            "mtime": stat.st_mtime, "synced_at": time.time()}
+
+
+sync_state = SyncState()
@@ -160,3 +160,11 @@ def get_info_parse(user_info: str, info_name: str):
     
     # 返回提取到的信息
     return extracted_info
+
+
+def to_int(value):
+    """转换为整数，无法转换（如None或空字符串）时返回None"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,184 @@
+import time
+import asyncio
+import threading
+import contextlib
+import requests
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from utils import config, metrics
+
+_session = None
+_session_lock = threading.Lock()
+_in_flight = threading.BoundedSemaphore(config.MAX_IN_FLIGHT)
+# 每个主机累计的新建连接数和请求数，连接池被淘汰或会话重建后仍然保留
+_connection_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _count(pool, field: str) -> None:
+    host = f"{pool.scheme}://{pool.host}:{pool.port}"
+    with _stats_lock:
+        entry = _connection_stats.setdefault(host, {"connections": 0, "requests": 0})
+        entry[field] += 1
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        _count(self, "connections")
+        return super()._new_conn()
+
+    def _make_request(self, *args, **kwargs):
+        _count(self, "requests")
+        return super()._make_request(*args, **kwargs)
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        _count(self, "connections")
+        return super()._new_conn()
+
+    def _make_request(self, *args, **kwargs):
+        _count(self, "requests")
+        return super()._make_request(*args, **kwargs)
+
+
+class CountingAdapter(HTTPAdapter):
+    """连接池在新建连接和发出请求时计入进程内的累计统计"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool
+        }
+
+
+def configure(pool_maxsize: int = None, pool_hosts: int = None,
+              connect_timeout: float = None, read_timeout: float = None,
+              max_in_flight: int = None) -> None:
+    """
+    修改连接池和超时配置，已创建的会话会被关闭并在下次请求时按新配置重建。
+
+    参数:
+        pool_maxsize (int, optional): 每个主机保持的最大长连接数，一般与下载线程数一致。
+        pool_hosts (int, optional): 连接池缓存的主机数量。
+        connect_timeout (float, optional): 连接超时时间（秒）。
+        read_timeout (float, optional): 读取超时时间（秒）。
+        max_in_flight (int, optional): 全局同时在途的请求上限。
+    """
+    global _session, _in_flight
+    if pool_maxsize is not None:
+        config.POOL_MAXSIZE = pool_maxsize
+    if pool_hosts is not None:
+        config.POOL_HOSTS = pool_hosts
+    if connect_timeout is not None:
+        config.CONNECT_TIMEOUT = connect_timeout
+    if read_timeout is not None:
+        config.READ_TIMEOUT = read_timeout
+    if max_in_flight is not None:
+        config.MAX_IN_FLIGHT = max_in_flight
+        _in_flight = threading.BoundedSemaphore(max_in_flight)
+
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def get_session() -> requests.Session:
+    """
+    获取进程内共享的会话对象，所有模块复用同一组按主机划分的长连接池。
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = CountingAdapter(pool_connections=config.POOL_HOSTS, pool_maxsize=config.POOL_MAXSIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+    """
+    通过共享会话发起请求，未指定timeout时使用配置中的连接/读取超时。
+
+    所有线程共用一个在途请求上限（config.MAX_IN_FLIGHT），超出时等待其他请求返回；
+    对于stream=True的请求，收到响应头即视为完成。每个请求按主机和状态码计入运行指标。
+    """
+    kwargs.setdefault("timeout", (config.CONNECT_TIMEOUT, config.READ_TIMEOUT))
+    host = urlsplit(url).netloc
+    with _in_flight:
+        started = time.monotonic()
+        try:
+            response = get_session().request(method, url, **kwargs)
+        except requests.exceptions.RequestException:
+            record_request(host, "error", time.monotonic() - started)
+            raise
+        record_request(host, response.status_code, time.monotonic() - started)
+        return response
+
+
+@contextlib.asynccontextmanager
+async def in_flight_async():
+    """
+    在asyncio中占用一个全局在途请求名额，与同步请求共用同一个上限（config.MAX_IN_FLIGHT）。
+
+    名额被占满时轮询等待，不占用线程，任务被取消时也不会遗留名额。
+    """
+    semaphore = _in_flight
+    delay = 0.001
+    while not semaphore.acquire(blocking=False):
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 0.02)
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+
+def record_request(host: str, status, seconds: float) -> None:
+    """按主机和状态码记录一次请求，status为"error"表示请求异常"""
+    metrics.observe("smartedu_http_request_seconds", seconds, host=host)
+    metrics.inc("smartedu_http_requests_total", host=host, status=status)
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
+
+
+def get_connection_stats() -> dict:
+    """
+    统计每个主机的连接复用情况。
+
+    返回:
+        dict: 以"协议://主机:端口"为键，值包含新建连接数、请求数、复用次数和复用率。
+    """
+    with _stats_lock:
+        stats = {host: dict(entry) for host, entry in _connection_stats.items()}
+
+    for entry in stats.values():
+        entry["reused"] = max(entry["requests"] - entry["connections"], 0)
+        entry["reuse_rate"] = entry["reused"] / entry["requests"] if entry["requests"] else 0.0
+    return stats
+
+
+def print_connection_stats() -> None:
+    """
+    打印每个主机的连接复用统计。
+    """
+    stats = get_connection_stats()
+    if not stats:
+        return
+    print("-------------------------------------------------------------")
+    print("连接复用统计:")
+    for host, entry in stats.items():
+        print(f"{host}  请求 {entry['requests']} 次，新建连接 {entry['connections']} 个，"
+              f"复用 {entry['reused']} 次（{entry['reuse_rate']:.0%}）")
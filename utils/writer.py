@@ -0,0 +1,118 @@
+import time
+import threading
+from utils import metrics, profiling
+
+
+class OrderedSegmentWriter:
+    """
+    按播放列表顺序把片段直接写入输出文件。
+
+    下载线程完成顺序不固定，先完成的片段暂存在有限大小的重排缓冲区中，
+    等到前面的片段写入后再依次落盘。若某个片段编号超出缓冲区范围，写入线程会等待，
+    只要缓冲区大小不小于下载线程数，就不会出现所有线程互相等待的情况。
+    """
+
+    def __init__(self, file_path: str, buffer_size: int, start_index: int = 0, mode: str = 'wb',
+                 on_write=None, release=None):
+        """
+        参数:
+            file_path (str): 输出文件路径。
+            buffer_size (int): 重排缓冲区最多暂存的片段数量。
+            start_index (int): 第一个待写入片段的编号。
+            mode (str): 打开输出文件的模式，续传时使用'ab'。
+            on_write (callable, optional): 每个片段写入并刷新到文件后调用，参数为(片段编号, 字节数)。
+            release (callable, optional): 片段数据写入文件或被丢弃后调用，参数为片段数据，用于归还缓冲区。
+        """
+        self.file_path = file_path
+        self.buffer_size = max(1, buffer_size)
+        self.next_index = start_index
+        self.bytes_written = 0
+        self._file = open(file_path, mode)
+        self._pending = {}
+        self._error = None
+        self._condition = threading.Condition()
+        self._on_write = on_write
+        self._release = release
+
+    def written(self) -> int:
+        """下一个待写入的片段编号，之前的片段均已写入文件"""
+        return self.next_index
+
+    def write(self, index: int, data: bytes) -> None:
+        """
+        提交编号为index的片段，若它正好是下一个待写入的片段，则连同缓冲区中的后续片段一起写入文件。
+        提交后片段数据由写入器负责归还，写入已中止而被拒绝时也会归还。
+        """
+        with self._condition:
+            while index - self.next_index >= self.buffer_size and self._error is None:
+                self._condition.wait()
+            if self._error is not None:
+                if self._release is not None:
+                    self._release(data)
+                raise RuntimeError(f"写入已中止: {self._error}")
+
+            self._pending[index] = data
+            while self.next_index in self._pending:
+                chunk = self._pending.pop(self.next_index)
+                started = time.monotonic()
+                try:
+                    with profiling.stage("segment_write", len(chunk)):
+                        self._file.write(chunk)
+                        self.bytes_written += len(chunk)
+                        if self._on_write is not None:
+                            self._file.flush()
+                            self._on_write(self.next_index, len(chunk))
+                finally:
+                    if self._release is not None:
+                        self._release(chunk)
+                metrics.observe("smartedu_segment_write_seconds", time.monotonic() - started)
+                self.next_index += 1
+            self._condition.notify_all()
+
+    def abort(self, error: Exception) -> None:
+        """
+        中止写入并唤醒所有等待中的线程。
+        """
+        with self._condition:
+            if self._error is None:
+                self._error = error
+            if self._release is not None:
+                for chunk in self._pending.values():
+                    self._release(chunk)
+            self._pending.clear()
+            self._condition.notify_all()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class BufferPool:
+    """
+    可重复使用的片段缓冲区。
+
+    片段下载时直接读入从池中取出的bytearray，解密也在原缓冲区中进行，
+    写入文件后再归还，避免每个片段都分配新的大块内存。同时使用的缓冲区数量受重排缓冲区大小限制。
+    """
+
+    def __init__(self):
+        self._free = []
+        self._lock = threading.Lock()
+        self.allocated = 0
+
+    def acquire(self) -> bytearray:
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+            self.allocated += 1
+        return bytearray()
+
+    def release(self, data) -> None:
+        """归还缓冲区，data可以是缓冲区本身或指向它的memoryview。"""
+        if isinstance(data, memoryview):
+            buffer = data.obj
+            data.release()
+        else:
+            buffer = data
+        if isinstance(buffer, bytearray):
+            with self._lock:
+                self._free.append(buffer)